@@ -0,0 +1,132 @@
+###
+# Reading and writing the asset data as newline delimited json - one asset per line
+# Plain json, without pickled python objects, so it can be shipped to the lua side and loaded without trusting the file
+###
+
+import json
+import os
+from data_defs import Asset, Recipe, Component
+
+# orjson loads a lot faster than the json module, but is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def component_to_dict(component: Component) -> dict:
+    return {'name': component.name, 'quantity': component.quantity, 'rate': component.rate, 'energy_rate': component.energy_rate}
+
+
+def recipe_to_dict(recipe: Recipe) -> dict:
+    return {
+        'name':             recipe.name,
+        'ingredients':      [component_to_dict(ingredient) for ingredient in recipe.ingredients],
+        'building_name':    recipe.building_name,
+        'products':         [component_to_dict(product) for product in recipe.products]
+    }
+
+
+def asset_to_dict(asset: Asset) -> dict:
+    '''
+    Flattens an asset and its recipes into a dict - a new one, the asset isn't changed
+    '''
+    return {
+        'name':         asset.name,
+        'image_url':    asset.image_url,
+        'type':         asset.type,
+        'recipes':      None if asset.recipes is None else [recipe_to_dict(recipe) for recipe in asset.recipes]
+    }
+
+
+def asset_from_dict(data: dict, recipes: dict = None) -> Asset:
+    '''
+    Rebuilds an asset from its dict
+    recipes - {name: Recipe} of recipes already loaded, so recipes shared by several items are one object like in the scraped data
+    '''
+    asset_recipes = None
+    if data['recipes'] is not None:
+        asset_recipes = []
+        for recipe_data in data['recipes']:
+            recipe = None if recipes is None else recipes.get(recipe_data['name'])
+
+            if recipe is None:
+                recipe = Recipe(
+                    name=           recipe_data['name'],
+                    ingredients=    tuple(Component(**ingredient) for ingredient in recipe_data['ingredients']),
+                    building_name=  recipe_data['building_name'],
+                    products=       tuple(Component(**product) for product in recipe_data['products'])
+                )
+                if recipes is not None:
+                    recipes[recipe.name] = recipe
+
+            asset_recipes.append(recipe)
+
+    return Asset(name= data['name'], image_url= data['image_url'], type= data['type'], recipes= asset_recipes)
+
+
+def assets_to_ndjson(asset_data: dict, output_file: str = 'asset_data.ndjson'):
+    '''
+    Save asset data as newline delimited json - written one asset at a time, so the whole file is never held in memory
+    Non-ascii characters are escaped and nan/inf are refused, so any json parser can read it
+    '''
+    temp_file = f"{output_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='ascii') as outfile:
+        for asset in asset_data.values():
+            outfile.write(json.dumps(asset_to_dict(asset), allow_nan=False, separators=(',', ':')))
+            outfile.write('\n')
+
+    os.replace(temp_file, output_file)
+
+
+def iter_ndjson(input_file: str):
+    '''
+    Generator of the assets in a newline delimited json file, in the order they were saved
+    '''
+    loads = json.loads if orjson is None else orjson.loads
+    recipes = {}
+
+    with open(input_file, 'rb') as infile:
+        for line in infile:
+            if line.strip():
+                yield asset_from_dict(loads(line), recipes)
+
+
+def load_ndjson(input_file: str = 'asset_data.ndjson') -> dict:
+    '''
+    Load asset data saved with assets_to_ndjson
+    '''
+    return {asset.name: asset for asset in iter_ndjson(input_file)}
+
+
+def load_json(input_file: str = 'asset_data.json') -> dict:
+    '''
+    Load asset data saved with scrape_wiki.assets_to_json - {name: asset dict}
+    '''
+    with open(input_file, 'rb') as infile:
+        data = json.loads(infile.read()) if orjson is None else orjson.loads(infile.read())
+
+    recipes = {}
+    return {name: asset_from_dict(asset, recipes) for name, asset in data.items()}
+
+
+def load_assets(asset_file: str = 'asset_data.pickle') -> dict:
+    '''
+    Load asset data from any of the formats it's saved in - chosen by the file extension
+    Binary (.bin) asset files are memory mapped and read lazily, see binary_assets
+    '''
+    extension = os.path.splitext(asset_file)[1].lower()
+
+    if extension in ('.ndjson', '.jsonl'):
+        return load_ndjson(asset_file)
+
+    if extension == '.json':
+        return load_json(asset_file)
+
+    if extension == '.bin':
+        from binary_assets import BinaryAssets
+        return BinaryAssets(asset_file)
+
+    import pickle
+    with open(asset_file, 'rb') as infile:
+        return pickle.load(infile)
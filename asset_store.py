@@ -0,0 +1,54 @@
+###
+# Process wide, read only store of the asset data
+# The Dash callbacks get the asset data from here instead of unpickling the asset file on every call
+###
+
+import os
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from recipe_index import RecipeIndex, load_recipe_index
+from asset_io import load_assets
+
+
+@dataclass(frozen=True)
+class AssetSnapshot:
+    '''
+    The loaded asset data and the lookup structures compiled from it
+    Shared by every caller in the process - nothing in here should be modified
+    '''
+    assets  : MappingProxyType  # Read only view of the asset dict
+    index   : RecipeIndex       # Compiled recipe index of the same data
+    version : str               # Hash of the asset file contents
+
+
+_snapshots  = {}                # absolute path -> (modification time, AssetSnapshot)
+_lock       = threading.Lock()
+
+
+def get_assets(asset_file: str = 'asset_data.pickle') -> AssetSnapshot:
+    '''
+    Gets the asset data of a file - loaded once per process and only reloaded when the file's modification time changes
+    Any format asset_io can load can be used - pickle, json or ndjson
+    '''
+    path = os.path.abspath(asset_file)
+    mtime = os.stat(path).st_mtime_ns
+
+    cached = _snapshots.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        # Another thread may have reloaded it while we were waiting
+        cached = _snapshots.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        asset_data = load_assets(path)
+
+        index = load_recipe_index(path, asset_data)
+
+        snapshot = AssetSnapshot(assets= MappingProxyType(asset_data), index= index, version= index.source_hash)
+        _snapshots[path] = (mtime, snapshot)
+
+    return snapshot
@@ -0,0 +1,397 @@
+###
+# Benchmarks of the slow parts of the scraper and planners
+# python benchmarks.py parse - wiki page parsing, on the item pages saved in the page cache
+# python benchmarks.py plan - process planning of every craftable item, batches of items and material utilisation
+# Results can be saved as json with --save and compared to a saved run with --compare, to find regressions between revisions
+###
+
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict
+from bs4 import BeautifulSoup as bs
+import scrape_wiki
+from asset_io import load_assets
+from page_cache import PageCache, PageManifest
+from process_planner import ProcessGraph
+
+
+def reference_parse(content: bytes) -> dict:
+    '''
+    The original parse of an item page - the whole page with python's html parser
+    '''
+    return scrape_wiki.read_wiki_page(bs(content, 'html.parser'))
+
+
+def comparable(parse, content: bytes):
+    '''
+    Result of a parse which can be compared to another - Recipe equality is by name only, so the assets are compared as dicts
+    '''
+    try:
+        output = parse(content)
+    except Exception as error:
+        return ('error', type(error).__name__)
+
+    return (None if output['item'] is None else asdict(output['item']), output['msg'], output['error'])
+
+
+def best_time(parse, content: bytes, repeats: int) -> float:
+    '''
+    Fastest of several parses of a page, in seconds
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        try:
+            parse(content)
+        except Exception:
+            pass
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def benchmark_parse(corpus_dir: str = 'wiki_cache', asset_file: str = 'asset_data.pickle', repeats: int = 3) -> dict:
+    '''
+    Times the original and the current parse of the item pages in a corpus of saved wiki pages, and checks they read the same
+    The item pages are found from the page manifest of the asset file - the cache also has the building and list pages, which aren't parsed as items
+    '''
+    manifest = PageManifest.load(scrape_wiki.manifest_file(asset_file), {})
+    if len(manifest.previous_pages) == 0:
+        raise Exception(f"No page manifest for {asset_file} - run the scraper first to save one")
+
+    asset_data = load_assets(asset_file)
+    page_cache = PageCache(corpus_dir)
+
+    pages = sorted(page_cache.path(url, 'html') for url, (_, asset_name) in manifest.previous_pages.items()
+                   if asset_name in asset_data and asset_data[asset_name].type != 'building')
+    pages = [page for page in pages if os.path.exists(page)]
+
+    if len(pages) == 0:
+        raise Exception(f"No saved item pages in {corpus_dir} - run the scraper first to fill the page cache")
+
+    reference_times = []
+    current_times = []
+    mismatches = []
+    for page in pages:
+        with open(page, 'rb') as infile:
+            content = infile.read()
+
+        reference_times.append(best_time(reference_parse, content, repeats))
+        current_times.append(best_time(scrape_wiki.read_item_page, content, repeats))
+
+        if comparable(reference_parse, content) != comparable(scrape_wiki.read_item_page, content):
+            mismatches.append(os.path.basename(page))
+
+    return {
+        'benchmark':    'parse',
+        'pages':        len(pages),
+        'parser':       scrape_wiki.html_parser,
+        'reference_ms': 1000 * sum(reference_times) / len(pages),
+        'current_ms':   1000 * sum(current_times) / len(pages),
+        'speedup':      sum(reference_times) / sum(current_times),
+        'mismatches':   mismatches
+    }
+
+
+def craftable_items(asset_data) -> list:
+    '''
+    Items with a recipe made from other items - i.e. not raw materials or buildings
+    '''
+    return [name for name, asset in asset_data.items() if asset.type != 'building' and any(len(recipe.ingredients) > 0 for recipe in asset.recipes or [])]
+
+
+def peak_memory(function) -> float:
+    '''
+    Peak memory allocated while running function, in KiB
+    '''
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+class PhaseTimer:
+    '''
+    Total time spent in each phase of a scenario, and planning each item, in milliseconds
+    '''
+
+    def __init__(self):
+        self.phases = {}
+        self.items  = {}
+
+    def time(self, phase: str, function, *args):
+        start = time.perf_counter()
+        output = function(*args)
+        self.phases[phase] = self.phases.get(phase, 0) + 1000 * (time.perf_counter() - start)
+        return output
+
+
+def plan_single(asset_data, items: list, rates: tuple, timer: PhaseTimer) -> dict:
+    '''
+    Plans each item on its own at each rate, then changes its rate, reads the raw materials and removes it again
+    '''
+    counts = {'runs': 0, 'failures': [], 'nodes': 0, 'edges': 0, 'max_nodes': 0, 'max_edges': 0}
+
+    for item in items:
+        for rate in rates:
+            start = time.perf_counter()
+            try:
+                planner = timer.time('setup', ProcessGraph, asset_data)
+                timer.time('plan', planner.add_request, item, rate)
+                nodes, edges = len(planner.graph_nodes), len(planner.graph_edges)
+                timer.time('update', planner.update_request, item, 2 * rate)
+                timer.time('raw_materials', planner.raw_materials)
+                timer.time('remove', planner.remove_request, item)
+            except Exception as error:
+                counts['failures'].append(f"{item} at {rate}: {type(error).__name__}")
+                continue
+
+            timer.items[item] = timer.items.get(item, 0) + 1000 * (time.perf_counter() - start)
+
+            counts['runs'] += 1
+            counts['nodes'] += nodes
+            counts['edges'] += edges
+            counts['max_nodes'] = max(counts['max_nodes'], nodes)
+            counts['max_edges'] = max(counts['max_edges'], edges)
+
+    return counts
+
+
+def plan_batches(asset_data, batches: list, timer: PhaseTimer) -> dict:
+    '''
+    Plans each batch of items together on one graph
+    '''
+    counts = {'runs': 0, 'failures': [], 'nodes': 0, 'edges': 0, 'max_nodes': 0, 'max_edges': 0}
+
+    for batch in batches:
+        try:
+            planner = timer.time('setup', ProcessGraph, asset_data)
+            timer.time('plan', planner.add_requests, {item: 1 for item in batch})
+            timer.time('raw_materials', planner.raw_materials)
+        except Exception as error:
+            counts['failures'].append(f"{', '.join(batch)}: {type(error).__name__}")
+            continue
+
+        nodes, edges = len(planner.graph_nodes), len(planner.graph_edges)
+        counts['runs'] += 1
+        counts['nodes'] += nodes
+        counts['edges'] += edges
+        counts['max_nodes'] = max(counts['max_nodes'], nodes)
+        counts['max_edges'] = max(counts['max_edges'], edges)
+
+    return counts
+
+
+def utilisation_scenarios(asset_data, batches: list) -> list:
+    '''
+    (available_mats, request_ratios) for each batch - half the raw materials the batch needs at 10 per min each, with the items at different ratios
+    '''
+    scenarios = []
+    for batch in batches:
+        request_ratios = {item: i + 1 for i, item in enumerate(batch)}
+        try:
+            planner = ProcessGraph(asset_data)
+            planner.add_requests({item: 10 for item in batch})
+        except Exception:
+            continue
+        scenarios.append(({mat: rate / 2 for mat, rate in planner.raw_materials().items()}, request_ratios))
+
+    return scenarios
+
+
+def plan_utilisation(asset_data, scenarios: list, timer: PhaseTimer) -> dict:
+    '''
+    Runs mats_utilisation on each scenario
+    '''
+    counts = {'runs': 0, 'failures': [], 'nodes': 0, 'edges': 0, 'max_nodes': 0, 'max_edges': 0}
+
+    for available_mats, request_ratios in scenarios:
+        try:
+            planner = timer.time('setup', ProcessGraph, asset_data)
+            msg = timer.time('mats_utilisation', planner.mats_utilisation, available_mats, request_ratios)
+        except Exception as error:
+            counts['failures'].append(f"{', '.join(request_ratios)}: {type(error).__name__}")
+            continue
+
+        if msg is not None:
+            counts['failures'].append(f"{', '.join(request_ratios)}: {msg}")
+            continue
+
+        nodes, edges = len(planner.graph_nodes), len(planner.graph_edges)
+        counts['runs'] += 1
+        counts['nodes'] += nodes
+        counts['edges'] += edges
+        counts['max_nodes'] = max(counts['max_nodes'], nodes)
+        counts['max_edges'] = max(counts['max_edges'], edges)
+
+    return counts
+
+
+def revision() -> str:
+    '''
+    git commit of the code being benchmarked, None if it isn't in a git repository
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_plan(asset_file: str = 'asset_data.pickle', rates: tuple = (1, 10, 100), batch_size: int = 5, repeats: int = 3) -> dict:
+    '''
+    Times planning across the whole item catalogue - every craftable item on its own at each rate, batches of items on one graph, and mats_utilisation of each batch
+    Phase timings are the fastest of the repeats, peak memory is measured on a separate run as tracing slows everything down
+    '''
+    start = time.perf_counter()
+    asset_data = load_assets(asset_file)
+    load_ms = 1000 * (time.perf_counter() - start)
+
+    items = craftable_items(asset_data)
+
+    if len(items) == 0:
+        raise Exception(f"No craftable items in {asset_file}")
+
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    scenarios = utilisation_scenarios(asset_data, batches)
+
+    runs = {
+        'single':       lambda timer: plan_single(asset_data, items, rates, timer),
+        'batch':        lambda timer: plan_batches(asset_data, batches, timer),
+        'utilisation':  lambda timer: plan_utilisation(asset_data, scenarios, timer),
+    }
+
+    results = {}
+    item_times = {}
+    for scenario, run in runs.items():
+        phases = {}
+        for _ in range(repeats):
+            timer = PhaseTimer()
+            counts = run(timer)
+            phases = {phase: min(phases.get(phase, duration), duration) for phase, duration in timer.phases.items()}
+            item_times = {item: min(item_times.get(item, duration), duration) for item, duration in timer.items.items()} or item_times
+
+        results[scenario] = counts | {
+            'phases_ms':    phases,
+            'total_ms':     sum(phases.values()),
+            'peak_kib':     peak_memory(lambda: run(PhaseTimer()))
+        }
+
+    return {
+        'benchmark':    'plan',
+        'revision':     revision(),
+        'python':       platform.python_version(),
+        'asset_file':   asset_file,
+        'items':        len(items),
+        'rates':        list(rates),
+        'batch_size':   batch_size,
+        'repeats':      repeats,
+        'load_ms':      load_ms,
+        'scenarios':    results,
+        'slowest':      sorted(item_times.items(), key=lambda pair: -pair[1])[:10]
+    }
+
+
+def flatten(result: dict, prefix: str = '') -> dict:
+    '''
+    Numbers of a benchmark result - {dotted.key: value}
+    '''
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+
+    return flat
+
+
+def compare_results(baseline: dict, result: dict, threshold: float = 1.1) -> list:
+    '''
+    (metric, baseline value, new value, status) of every number in both results
+    Timings (_ms) and memory (_kib) are regressions if they grew by more than the threshold, anything else (i.e. node counts) is flagged if it changed at all
+    '''
+    old, new = flatten(baseline), flatten(result)
+
+    comparison = []
+    for metric in old.keys() & new.keys():
+        if any(key.endswith(('_ms', '_kib')) for key in metric.split('.')):
+            if new[metric] > old[metric] * threshold:
+                status = 'slower'
+            elif new[metric] * threshold < old[metric]:
+                status = 'faster'
+            else:
+                status = 'same'
+        else:
+            status = 'same' if new[metric] == old[metric] else 'changed'
+
+        comparison.append((metric, old[metric], new[metric], status))
+
+    return sorted(comparison)
+
+
+def print_plan(result: dict):
+    print(f"{result['items']} craftable items in {result['asset_file']}, loaded in {result['load_ms']:.1f} ms")
+
+    for scenario, stats in result['scenarios'].items():
+        phases = ', '.join(f"{phase} {duration:.1f}" for phase, duration in stats['phases_ms'].items())
+        print(f"{scenario}: {stats['runs']} runs, {stats['total_ms']:.1f} ms ({phases}), peak {stats['peak_kib']:.0f} KiB")
+        print(f"    {stats['nodes']} nodes and {stats['edges']} edges in total, largest graph {stats['max_nodes']} nodes and {stats['max_edges']} edges")
+
+        if len(stats['failures']) > 0:
+            print(f"    WARNING: {len(stats['failures'])} failed - {'; '.join(stats['failures'])}")
+
+    print("Slowest items: " + ', '.join(f"{item} {duration:.1f} ms" for item, duration in result['slowest']))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=['parse', 'plan'], help='Which benchmark to run')
+    parser.add_argument('--corpus', default='wiki_cache', help='Directory of saved wiki pages, for the parse benchmark')
+    parser.add_argument('--assets', default='asset_data.pickle', help='Asset file to plan with, or whose page manifest lists the item pages to parse')
+    parser.add_argument('--rates', type=float, nargs='+', default=[1, 10, 100], help='Rates each item is planned at, for the plan benchmark')
+    parser.add_argument('--batch-size', type=int, default=5, help='Items planned together in each batch, for the plan benchmark')
+    parser.add_argument('--repeats', type=int, default=3, help='Times each page is parsed or each scenario is planned - the fastest is used')
+    parser.add_argument('--save', help='Save the results to this json file')
+    parser.add_argument('--compare', help='Compare the results to ones saved with --save')
+    parser.add_argument('--threshold', type=float, default=1.1, help='Ratio a timing or memory use has to change by to be reported when comparing')
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'parse':
+        result = benchmark_parse(args.corpus, args.assets, args.repeats)
+
+        print(f"{result['pages']} pages, parsed with {result['parser']}")
+        print(f"Original parse: {result['reference_ms']:.2f} ms per page")
+        print(f"Current parse:  {result['current_ms']:.2f} ms per page ({result['speedup']:.2f}x)")
+
+        if len(result['mismatches']) > 0:
+            print(f"WARNING: {len(result['mismatches'])} pages read differently - {', '.join(result['mismatches'])}")
+
+    elif args.benchmark == 'plan':
+        result = benchmark_plan(args.assets, tuple(args.rates), args.batch_size, args.repeats)
+        print_plan(result)
+
+    if args.save is not None:
+        with open(args.save, 'w') as outfile:
+            json.dump(result, outfile, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as infile:
+            baseline = json.load(infile)
+
+        if baseline.get('benchmark') != result['benchmark']:
+            raise Exception(f"{args.compare} is a result of a different benchmark")
+
+        changes = [row for row in compare_results(baseline, result, args.threshold) if row[3] != 'same']
+        print(f"\nCompared to {args.compare} (revision {baseline.get('revision')}):")
+        for metric, old, new, status in changes:
+            print(f"    {status}: {metric} {old:g} -> {new:g}")
+        if len(changes) == 0:
+            print("    No changes")
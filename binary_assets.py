@@ -0,0 +1,259 @@
+###
+# Compact binary format of the asset data - a string table and numeric arrays of the recipe components
+# Loaded through mmap as numpy views, so startup doesn't unpickle anything and every process using the file shares its pages
+###
+
+import json
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+import numpy as np
+from data_defs import Asset, Recipe, Component
+
+
+magic       = b'SFASSETS'
+version     = 1
+alignment   = 64
+
+# Arrays saved in the file
+# Strings are ids into the string table, missing rates and energy rates (manual crafting) are nan
+arrays = {
+    'string_offsets':       np.int64,       # Start of each string in string_data, with the end of the last one at the end
+    'string_data':          np.uint8,       # utf-8 of every string, one after another
+    'asset_names':          np.int32,
+    'asset_image_urls':     np.int32,
+    'asset_types':          np.int32,
+    'asset_has_recipes':    np.uint8,       # Assets without a recipe list (buildings) are kept apart from ones with an empty list
+    'asset_recipe_ptr':     np.int32,       # Recipes of asset a are asset_recipe_ids[asset_recipe_ptr[a]:asset_recipe_ptr[a+1]]
+    'asset_recipe_ids':     np.int32,
+    'recipe_names':         np.int32,
+    'recipe_buildings':     np.int32,
+    'ingredient_ptr':       np.int32,       # Ingredients of recipe r are at [ingredient_ptr[r]:ingredient_ptr[r+1]] of the ingredient arrays
+    'ingredient_names':     np.int32,
+    'ingredient_quantities': np.float64,
+    'ingredient_rates':     np.float64,
+    'ingredient_energy':    np.float64,
+    'product_ptr':          np.int32,
+    'product_names':        np.int32,
+    'product_quantities':   np.float64,
+    'product_rates':        np.float64,
+    'product_energy':       np.float64,
+}
+
+
+def to_float(value) -> float:
+    '''
+    Numbers as floats, None (or anything else which isn't a number) as nan
+    '''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def aligned(size: int) -> int:
+    '''
+    Size rounded up to the alignment
+    '''
+    return -(-size // alignment) * alignment
+
+
+def assets_to_binary(asset_data: dict, output_file: str = 'asset_data.bin'):
+    '''
+    Save asset data in the binary format
+    Energy rates which aren't numbers are saved as missing
+    '''
+    strings = {}
+    def string_id(string):
+        return strings.setdefault(string, len(strings))
+
+    columns = {name: [] for name in arrays}
+    columns['asset_recipe_ptr'].append(0)
+    columns['ingredient_ptr'].append(0)
+    columns['product_ptr'].append(0)
+
+    recipe_ids = {}
+    for asset in asset_data.values():
+        columns['asset_names'].append(string_id(asset.name))
+        columns['asset_image_urls'].append(string_id(asset.image_url))
+        columns['asset_types'].append(string_id(asset.type))
+        columns['asset_has_recipes'].append(asset.recipes is not None)
+
+        for recipe in asset.recipes or []:
+            if recipe.name not in recipe_ids:
+                recipe_ids[recipe.name] = len(recipe_ids)
+                columns['recipe_names'].append(string_id(recipe.name))
+                columns['recipe_buildings'].append(string_id(recipe.building_name))
+
+                for kind, components in (('ingredient', recipe.ingredients), ('product', recipe.products)):
+                    for component in components:
+                        columns[f'{kind}_names'].append(string_id(component.name))
+                        columns[f'{kind}_quantities'].append(to_float(component.quantity))
+                        columns[f'{kind}_rates'].append(to_float(component.rate))
+                        columns[f'{kind}_energy'].append(to_float(component.energy_rate))
+                    columns[f'{kind}_ptr'].append(len(columns[f'{kind}_names']))
+
+            columns['asset_recipe_ids'].append(recipe_ids[recipe.name])
+
+        columns['asset_recipe_ptr'].append(len(columns['asset_recipe_ids']))
+
+    encoded = [string.encode() for string in strings]
+    columns['string_offsets'] = np.cumsum([0] + [len(string) for string in encoded])
+    columns['string_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    # Table of contents - name: [dtype, length, offset], offsets from the start of the arrays
+    # Every array starts on an aligned offset, so the numpy views of it are aligned
+    data = {name: np.ascontiguousarray(columns[name], dtype=dtype) for name, dtype in arrays.items()}
+    contents = {}
+    offset = 0
+    for name, array in data.items():
+        contents[name] = [array.dtype.str, len(array), offset]
+        offset += aligned(array.nbytes)
+
+    header = json.dumps({'version': version, 'arrays': contents}).encode()
+    arrays_start = aligned(len(magic) + 8 + len(header))
+
+    temp_file = f"{output_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'wb') as outfile:
+        outfile.write(magic)
+        outfile.write(struct.pack('<Q', len(header)))
+        outfile.write(header)
+
+        for name, array in data.items():
+            outfile.write(b'\0' * (arrays_start + contents[name][2] - outfile.tell()))
+            outfile.write(array.tobytes())
+
+    os.replace(temp_file, output_file)
+
+
+class BinaryAssets(Mapping):
+    '''
+    Read only asset dict of a binary asset file - {name: Asset}, in the order they were saved
+    The file is memory mapped and the arrays are numpy views of it - Asset and Recipe objects are only made when first used
+    Can be used anywhere the asset dict is, i.e. ProcessGraph(BinaryAssets('asset_data.bin'))
+    '''
+
+    def __init__(self, input_file: str = 'asset_data.bin'):
+        with open(input_file, 'rb') as infile:
+            self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(magic)] != magic:
+            self._mmap.close()
+            raise Exception(f"{input_file} is not a binary asset file")
+
+        header_length = struct.unpack('<Q', self._mmap[len(magic):len(magic) + 8])[0]
+        header = json.loads(self._mmap[len(magic) + 8:len(magic) + 8 + header_length])
+
+        if header['version'] != version:
+            self._mmap.close()
+            raise Exception(f"{input_file} is version {header['version']} of the binary asset format, version {version} is needed")
+
+        arrays_start = aligned(len(magic) + 8 + header_length)
+        for name, (dtype, length, offset) in header['arrays'].items():
+            if length == 0:
+                # Empty arrays at the end of the file can start past the end of it
+                setattr(self, name, np.empty(0, dtype=np.dtype(dtype)))
+            else:
+                setattr(self, name, np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=length, offset=arrays_start + offset))
+
+        self._strings   = {}
+        self._assets    = {}
+        self._recipes   = {}
+
+        # Name lookups - only the asset names are decoded up front
+        self.asset_ids = {self.string(string_id): i for i, string_id in enumerate(self.asset_names.tolist())}
+
+
+    def string(self, string_id: int) -> str:
+        '''
+        String of the string table
+        '''
+        string = self._strings.get(string_id)
+
+        if string is None:
+            start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+            string = bytes(self.string_data[start:end]).decode()
+            self._strings[string_id] = string
+
+        return string
+
+
+    def components(self, kind: str, recipe_id: int) -> tuple:
+        '''
+        Ingredients or products of a recipe
+        '''
+        ptr = getattr(self, f'{kind}_ptr')
+        names, quantities, rates, energy = (getattr(self, f'{kind}_{column}') for column in ('names', 'quantities', 'rates', 'energy'))
+
+        components = []
+        for i in range(ptr[recipe_id], ptr[recipe_id + 1]):
+            components.append(Component(
+                name=           self.string(names[i]),
+                quantity=       float(quantities[i]),
+                rate=           None if np.isnan(rates[i]) else float(rates[i]),
+                energy_rate=    None if np.isnan(energy[i]) else float(energy[i])
+            ))
+
+        return tuple(components)
+
+
+    def recipe(self, recipe_id: int) -> Recipe:
+        '''
+        Recipe of a recipe id - one object per recipe, shared by every asset which has it
+        '''
+        recipe = self._recipes.get(recipe_id)
+
+        if recipe is None:
+            recipe = Recipe(
+                name=           self.string(self.recipe_names[recipe_id]),
+                ingredients=    self.components('ingredient', recipe_id),
+                building_name=  self.string(self.recipe_buildings[recipe_id]),
+                products=       self.components('product', recipe_id)
+            )
+            self._recipes[recipe_id] = recipe
+
+        return recipe
+
+
+    def __getitem__(self, name: str) -> Asset:
+        asset = self._assets.get(name)
+
+        if asset is None:
+            asset_id = self.asset_ids[name]
+
+            recipes = None
+            if self.asset_has_recipes[asset_id]:
+                start, end = self.asset_recipe_ptr[asset_id], self.asset_recipe_ptr[asset_id + 1]
+                recipes = [self.recipe(recipe_id) for recipe_id in self.asset_recipe_ids[start:end].tolist()]
+
+            asset = Asset(
+                name=       name,
+                image_url=  self.string(self.asset_image_urls[asset_id]),
+                type=       self.string(self.asset_types[asset_id]),
+                recipes=    recipes
+            )
+            self._assets[name] = asset
+
+        return asset
+
+
+    def __contains__(self, name) -> bool:
+        return name in self.asset_ids
+
+
+    def __iter__(self):
+        return iter(self.asset_ids)
+
+
+    def __len__(self) -> int:
+        return len(self.asset_ids)
+
+
+    def close(self):
+        '''
+        Unmaps the file - the arrays can't be used after this
+        '''
+        for name in arrays:
+            setattr(self, name, None)
+        self._mmap.close()
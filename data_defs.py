@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from os import name
 
 
@@ -13,10 +13,11 @@ class Asset:
     recipes: list = None
 
 
-@dataclass
+@dataclass(frozen=True, eq=False)
 class Recipe:
     '''
     For recipe information
+    Immutable, and compared and hashed by name only - recipe names are unique, so each recipe can be kept once in a set or dict
     '''
     name: str
     ingredients: tuple
@@ -24,39 +25,33 @@ class Recipe:
     products: tuple
 
     def __post_init__(self):
-        # For searching through a list of recipes
-        self.ingredients_names  = [ingredient.name for ingredient in self.ingredients]
-        self.products_names     = [product.name for product in self.products]
+        # Components are kept as tuples so the recipe can't be changed after it's made
+        object.__setattr__(self, 'ingredients', tuple(self.ingredients))
+        object.__setattr__(self, 'products', tuple(self.products))
+
+        # For searching through the components of a recipe
+        object.__setattr__(self, 'ingredients_names', tuple(ingredient.name for ingredient in self.ingredients))
+        object.__setattr__(self, 'products_names', tuple(product.name for product in self.products))
+        object.__setattr__(self, 'ingredient_index', {name: i for i, name in enumerate(self.ingredients_names)})
+        object.__setattr__(self, 'product_index', {name: i for i, name in enumerate(self.products_names)})
+
+    def __setstate__(self, state):
+        # Pickles made before recipes were immutable have lists of components - rebuild the lookups from the fields
+        for field_name in ('name', 'ingredients', 'building_name', 'products'):
+            object.__setattr__(self, field_name, state[field_name])
+        self.__post_init__()
 
     def __eq__(self, other):
-        # It should be enough to compare the recipe names, these are unique?
+        # It should be enough to compare the recipe names, these are unique
+        if not isinstance(other, Recipe):
+            return NotImplemented
         return self.name == other.name
 
-        """ #First trivially check if they have the same number of components
-        if (len(self.ingredients) != len(other.ingredients)) or (len(self.products) != len(other.products)):
-            return False
-
-        # Check if the string attributes are equal
-        if (self.name != other.name) or (self.building_name != other.building_name):
-            return False
-
-        # Need to call the equate functions of the objects in the list of ingredients and products
-        for m,n in zip(self.ingredients, other.ingredients):
-            if m != n:
-                return False
-
-        for m,n in zip(self.products, other.products):
-            if m != n:
-                return False
-
-        # If all checks are fine, then the two recipes are equal
-        return True """
-
     def __hash__(self):
-        return hash((self.name, self.ingredients, self.building_name, self.products))
+        return hash(self.name)
 
 
-@dataclass(unsafe_hash=True)
+@dataclass(frozen=True)
 class Component:
     '''
     Stores data on each component of a recipe (ingredients or products)
@@ -68,6 +63,27 @@ class Component:
 
 
 @dataclass
+class AssetDiff:
+    '''
+    Changes between two versions of the asset data - sets of names
+    '''
+    added_assets    : set
+    removed_assets  : set
+    changed_assets  : set
+    added_recipes   : set
+    removed_recipes : set
+    changed_recipes : set
+    affected_items  : set   # Items made or used by any of the changed recipes - for invalidating cached plans, i.e. SubplanCache.invalidate
+
+    def is_empty(self):
+        '''
+        Whether nothing changed
+        '''
+        return not (self.added_assets or self.removed_assets or self.changed_assets or self.added_recipes or self.removed_recipes or self.changed_recipes)
+
+
+# Graph nodes and edges are slotted - large plans have thousands of them, and slots keep them small and quick to access
+@dataclass(slots=True)
 class ItemNode():
     '''
     For item nodes on the graph - components or liquids or gases
@@ -88,7 +104,7 @@ class ItemNode():
         '''
         return self.rate_filled - self.rate_requested
 
-@dataclass
+@dataclass(slots=True)
 class BuildingNode():
     '''
     For production building nodes on the graph
@@ -98,6 +114,7 @@ class BuildingNode():
     primary_item            : str          
     production_rate_default : float     # Amount of primary item produced per min at 100% clock speed
     rate_produced           : float     # Amount of primary item actually produced
+    clock_speed             : float = field(init=False, default=0)  # Decimal, kept up to date with update_clockspeed
     
     def __post_init__(self):
         self.update_clockspeed()
@@ -109,7 +126,7 @@ class BuildingNode():
         self.clock_speed = (self.rate_produced / self.production_rate_default)
     
 
-@dataclass
+@dataclass(slots=True)
 class GraphEdge:
     '''
     For the edges of the production planner graph
@@ -0,0 +1,149 @@
+###
+# Cytoscape elements of a planner's graph, shared by both Dash apps
+# Only the elements which changed since the last render are sent to the browser
+###
+
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from dash import Patch, no_update
+from data_defs import ItemNode, BuildingNode
+
+
+def asset_name(node_name: str) -> str:
+    '''
+    Name of the asset a node shows - for its image
+    '''
+    name = node_name.replace('_OUT', '').split(':')[0]
+
+    if name == 'resource_well_extractor':
+        return 'resource_well_pressurizer'
+
+    return name
+
+
+def graph_elements(planner, asset_data) -> list:
+    '''
+    Cytoscape elements of the nodes and edges of a planner's graph
+    A building node running over 100% is labelled with how many machines it takes - nodes are never merged, so each keeps its own edges
+    '''
+    elements = []
+
+    # Get nodes in graph
+    for node_name, node in planner.graph_nodes.items():
+        if isinstance(node, ItemNode):
+            label = f"{round(node.rate_filled,1)} {' '.join(node.name.split('_'))} per min"
+        elif isinstance(node, BuildingNode):
+            # Rounded first so float error doesn't add a machine
+            machines = math.ceil(round(node.clock_speed, 6))
+            if machines > 1:
+                label = f"{machines}x {node.name} ({round(node.clock_speed*100,1)}%)"
+            else:
+                label = f"{node.name} ({round(node.clock_speed*100,1)}%)"
+
+        elements.append({'data' : {
+            'id'    : node_name,
+            'label' : label,
+            'image' : asset_data[asset_name(node_name)].image_url
+        }})
+
+    # Get connecting edges - ids are needed to patch them, so parallel edges between the same nodes are added together
+    edges = {}
+    for edge in planner.graph_edges:
+        key = (edge.source_id, edge.target_id)
+        edges[key] = edges.get(key, 0) + edge.rate
+
+    for (source_id, target_id), rate in edges.items():
+        elements.append({'data' : {
+            'id'        : f"{source_id}->{target_id}",
+            'source'    : source_id,
+            'target'    : target_id,
+            'weight'    : round(rate,1)
+        }})
+
+    return elements
+
+
+def elements_token(elements: list) -> str:
+    '''
+    Hash of a list of elements, to identify what the browser is showing
+    '''
+    return hashlib.sha256(json.dumps(elements, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class RenderCache:
+    '''
+    Element lists recently sent to browsers, keyed by their token - so the next update of a graph can be sent as a patch of what the browser already has
+    Keyed by content, not by session, so it's shared by every session which is showing the same graph
+    '''
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize    = maxsize
+        self.rendered   = OrderedDict()
+        self._lock      = threading.Lock()
+
+
+    def remember(self, token: str, elements: list):
+        with self._lock:
+            self.rendered[token] = elements
+            self.rendered.move_to_end(token)
+
+            while len(self.rendered) > self.maxsize:
+                self.rendered.popitem(last=False)
+
+
+    def render(self, elements: list, token: str = None) -> tuple:
+        '''
+        (elements output, new token) to update a browser showing the elements of token to these elements
+        The output is no_update if nothing has changed, a Patch of the changed elements if the browser's elements are known,
+        otherwise the full list
+        '''
+        with self._lock:
+            previous = self.rendered.get(token)
+            if previous is not None:
+                self.rendered.move_to_end(token)
+
+        if previous is None:
+            new_token = elements_token(elements)
+            self.remember(new_token, elements)
+            return elements, new_token
+
+        # The browser's list after the patch - kept elements stay where they are, new ones go on the end
+        new_elements = {element['data']['id']: element for element in elements}
+        kept_ids = set(element['data']['id'] for element in previous) & new_elements.keys()
+
+        patched = [new_elements[element['data']['id']] for element in previous if element['data']['id'] in kept_ids]
+        patched += [element for element in elements if element['data']['id'] not in kept_ids]
+
+        if patched == previous:
+            return no_update, token
+
+        patch = Patch()
+        changes = 0
+
+        # Removed from the end first, so the positions of the ones before don't move
+        for position in reversed(range(len(previous))):
+            if previous[position]['data']['id'] not in kept_ids:
+                del patch[position]
+                changes += 1
+
+        kept = [element for element in previous if element['data']['id'] in kept_ids]
+        for position, element in enumerate(kept):
+            if element != patched[position]:
+                patch[position] = patched[position]
+                changes += 1
+
+        for element in patched[len(kept):]:
+            patch.append(element)
+            changes += 1
+
+        new_token = elements_token(patched)
+        self.remember(new_token, patched)
+
+        # Not worth patching if most of the graph changed
+        if changes > len(patched) // 2:
+            return patched, new_token
+
+        return patch, new_token
@@ -0,0 +1,118 @@
+###
+# Runs plans in the background so the Dash request threads aren't blocked while they're calculated
+# Jobs are queued on a local thread or process pool - no broker or other service is needed
+###
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class JobRunner:
+    '''
+    Background jobs, at most one per session - submitting a new job for a session supersedes its previous one
+    A superseded job is cancelled if it hasn't started yet, otherwise its result is thrown away when it finishes
+    processes - run jobs in worker processes instead of threads, for planners which hold the GIL. The job function and its arguments then have to be picklable
+    '''
+
+    def __init__(self, max_workers: int = 2, processes: bool = False, max_jobs: int = 256):
+        self.max_workers    = max_workers
+        self.processes      = processes
+        self.max_jobs       = max_jobs      # Finished jobs kept for polling - the oldest are dropped after this
+
+        self.jobs           = OrderedDict() # job id -> {'session', 'future', 'submitted', 'superseded'}
+        self.sessions       = {}            # session id -> id of its latest job
+
+        self._executor      = None
+        self._ids           = itertools.count()
+        self._lock          = threading.Lock()
+
+
+    def submit(self, session: str, function, *args) -> str:
+        '''
+        Starts function(*args) in the background for a session, superseding the session's previous job
+        Returns the id of the job, for polling with status
+        '''
+        with self._lock:
+            if self._executor is None:
+                pool = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+                self._executor = pool(max_workers= self.max_workers)
+
+            self.supersede(session)
+
+            job_id = f"{session}:{next(self._ids)}"
+            self.jobs[job_id] = {
+                'session':      session,
+                'future':       self._executor.submit(function, *args),
+                'submitted':    time.time(),
+                'superseded':   False
+            }
+            self.sessions[session] = job_id
+
+            # Drop the oldest finished jobs
+            for old_id in [old_id for old_id, job in self.jobs.items() if job['future'].done()][:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[old_id]
+
+        return job_id
+
+
+    def supersede(self, session: str):
+        '''
+        Cancels the session's current job - the lock should be held
+        '''
+        job = self.jobs.get(self.sessions.pop(session, None))
+
+        if job is not None:
+            job['superseded'] = True
+            job['future'].cancel()
+
+
+    def cancel(self, session: str):
+        '''
+        Cancels the session's current job, if it has one
+        '''
+        with self._lock:
+            self.supersede(session)
+
+
+    def status(self, job_id: str) -> dict:
+        '''
+        State of a job - {'state', 'elapsed', 'result', 'error'}
+        state is one of 'queued', 'running', 'done', 'failed', 'cancelled' (also when it's been superseded) or 'unknown'
+        '''
+        with self._lock:
+            job = self.jobs.get(job_id)
+
+        if job is None:
+            return {'state': 'unknown', 'elapsed': 0, 'result': None, 'error': None}
+
+        future = job['future']
+        status = {'state': 'queued', 'elapsed': time.time() - job['submitted'], 'result': None, 'error': None}
+
+        if job['superseded'] or future.cancelled():
+            status['state'] = 'cancelled'
+        elif future.done():
+            error = future.exception()
+            if error is None:
+                status['state'] = 'done'
+                status['result'] = future.result()
+            else:
+                status['state'] = 'failed'
+                status['error'] = error
+        elif future.running():
+            status['state'] = 'running'
+
+        return status
+
+
+    def shutdown(self):
+        '''
+        Cancels the queued jobs and stops the workers, once the running jobs have finished
+        '''
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(cancel_futures= True)
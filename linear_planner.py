@@ -0,0 +1,413 @@
+from data_defs import ItemNode, BuildingNode, GraphEdge
+from process_planner import ProcessGraph
+from recipe_index import RecipeIndex, compile_assets
+from recipe_optimiser import maximise_throughput
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+import time
+
+
+class LinearProcessGraph(ProcessGraph):
+    '''
+    Computes the same production graph as ProcessGraph, but solves for all building clock speeds at once
+    Builds an item by recipe stoichiometry matrix from the chosen recipes and solves it as a sparse linear system,
+    so every node is balanced exactly - including byproducts which feed back into the process
+    '''
+
+    def __init__(self, asset_data: dict, recipe_index: RecipeIndex = None, recipe_choices: dict = None, stats = None):
+        super().__init__(asset_data, recipe_choices= recipe_choices, stats= stats)
+
+        # Compiled index of the asset data - can be passed in so it's not rebuilt for every planner
+        self.recipe_index       = compile_assets(asset_data) if recipe_index is None else recipe_index
+
+        self.utilisation        = None  # ThroughputResult of the last mats_utilisation - raw material slack and shadow prices
+
+
+    def add_request(self, requested_item: str, requested_amount: int):
+        '''
+        Adds an item request and re-solves the whole graph
+        '''
+        self.add_requests({requested_item: requested_amount})
+
+
+    def add_requests(self, requests: dict):
+        '''
+        Adds several item requests - {item_name: amount} - and solves them all together in one go
+        '''
+        for requested_item, requested_amount in requests.items():
+            self.requests[requested_item] = self.requests.get(requested_item, 0) + requested_amount
+
+        self.solve()
+
+
+    def update_request(self, requested_item: str, requested_amount: float):
+        '''
+        Changes the requested amount of an item and re-solves the graph - requests dropping to zero are removed
+        '''
+        if requested_amount > 0:
+            self.requests[requested_item] = requested_amount
+        else:
+            self.requests.pop(requested_item, None)
+
+        self.solve()
+
+
+    def remove_request(self, requested_item: str):
+        '''
+        Removes a request and re-solves the graph
+        '''
+        self.update_request(requested_item, 0)
+
+
+    def mats_utilisation(self, available_mats: dict, request_ratios: dict, alternates: bool = False):
+        '''
+        Calculates the process which produces the most of a set of requested items at a requested ratio given a set of available materials
+        Solved directly as one linear program - the raw material slack and shadow prices are kept in self.utilisation
+        available_mats - {item_name: amount_available}
+        request_ratios - {item_name: ratio}
+        alternates - whether alternate recipes can be used to get more out of the materials
+        Returns None or an error message for handling by calling script
+        '''
+
+        # Check inputs
+        if len(request_ratios) == 0:
+            return "No requested items"
+        if not isinstance(request_ratios, dict):
+            raise TypeError("Items request and their ratios should be given as a dictionary")
+
+        if self.stats is not None:
+            start = time.perf_counter()
+
+        self.utilisation = maximise_throughput(self.recipe_index, available_mats, request_ratios, alternates, self.recipe_choices)
+
+        if self.stats is not None:
+            self.stats.add_time('linear_program', start)
+
+        if len(self.utilisation.missing) > 0:
+            return f"Missing raw materials {(', '.join(self.utilisation.missing)).replace('_',' ')}"
+
+        # Build the graph straight from the solved clock speeds
+        recipe_ids = np.flatnonzero(self.utilisation.clock_speeds > self.tolerance).tolist()
+
+        # Each recipe's primary item is an item it was chosen for, or its biggest product
+        chosen_for = {}
+        for item_name, recipe_name in self.utilisation.recipe_choices.items():
+            chosen_for.setdefault(self.recipe_index.recipe_ids[recipe_name], self.recipe_index.item_ids[item_name])
+
+        primary_items = []
+        for recipe_id in recipe_ids:
+            if recipe_id in chosen_for:
+                primary_items.append(chosen_for[recipe_id])
+            else:
+                product_items, product_rates = self.recipe_index.products(recipe_id)
+                primary_items.append(int(product_items[np.argmax(product_rates)]))
+
+        stoichiometry = self.recipe_index.stoichiometry()[:, recipe_ids]
+        clock_speeds = self.utilisation.clock_speeds[recipe_ids]
+
+        self.reset_graph()
+        self.requests = dict(self.utilisation.production)
+        self.build_graph(recipe_ids, primary_items, stoichiometry, clock_speeds)
+        self.request_mats = self.attribute_mats(recipe_ids, stoichiometry, clock_speeds)
+
+        if self.stats is not None:
+            self.stats.add_time('mats_utilisation', start)
+
+        return None
+
+
+    def choose_recipe(self, item_id: int) -> int:
+        '''
+        Gets the id of the recipe used to produce an item - the chosen recipe if there is one, otherwise the standard recipe
+        '''
+        item_name = str(self.recipe_index.item_names[item_id])
+        if item_name in self.recipe_choices:
+            if self.recipe_choices[item_name] not in self.recipe_index.recipe_ids:
+                raise Exception(f'{item_name} has no recipe {self.recipe_choices[item_name]}')
+
+            return self.recipe_index.recipe_ids[self.recipe_choices[item_name]]
+
+        recipe_id = self.recipe_index.standard_recipe(item_id)
+
+        if recipe_id < 0:
+            raise Exception(f'No recipe for {self.recipe_index.item_names[item_id]}')
+
+        return recipe_id
+
+
+    def solve(self):
+        '''
+        Solves for the clock speed of every recipe needed by the current requests and rebuilds the graph from the result
+        '''
+        if self.stats is not None:
+            start = time.perf_counter()
+
+        # Nothing requested - an empty graph
+        if len(self.requests) == 0:
+            requests = self.requests
+            self.reset_graph()
+            self.requests = requests
+
+            if self.stats is not None:
+                self.stats.add_time('solve', start)
+            return
+
+        index = self.recipe_index
+
+        # Find every item needed by walking the chosen recipes upstream from the requested items
+        item_recipes = {}
+        stack = [index.item_ids[item_name] for item_name in self.requests]
+        while len(stack) > 0:
+            item_id = stack.pop()
+            if item_id in item_recipes:
+                continue
+
+            recipe_id = self.choose_recipe(item_id)
+            item_recipes[item_id] = recipe_id
+
+            stack.extend(ingredient for ingredient in index.ingredients(recipe_id)[0].tolist() if ingredient not in item_recipes)
+
+        # Each recipe gets one column, balanced against one of the items which chose it - starting with the first
+        # Every item which chose it is still checked, the solver moves the column to whichever of them is short
+        recipe_ids = []
+        recipe_rows = []
+        item_cols = {}
+        for item_id, recipe_id in item_recipes.items():
+            if recipe_id not in recipe_ids:
+                recipe_ids.append(recipe_id)
+                recipe_rows.append(item_id)
+            item_cols[item_id] = recipe_ids.index(recipe_id)
+
+        # Stoichiometry matrix - net rate of each item for each chosen recipe at 100% clock speed
+        stoichiometry = index.stoichiometry()[:, recipe_ids]
+
+        demand = np.zeros(index.n_items)
+        for item_name, amount in self.requests.items():
+            demand[index.item_ids[item_name]] += amount
+
+        recipe_rows = np.array(recipe_rows, dtype=int)
+        clock_speeds, _, recipe_rows = self.solve_clock_speeds(stoichiometry, demand, recipe_rows, item_cols)
+
+        self.build_graph(recipe_ids, recipe_rows, stoichiometry, clock_speeds)
+
+        self.request_mats = self.attribute_mats(recipe_ids, stoichiometry, clock_speeds)
+
+        if self.stats is not None:
+            self.stats.add_time('solve', start)
+
+
+    def solve_clock_speeds(self, stoichiometry: sparse.csc_matrix, demand: np.ndarray, recipe_rows: np.ndarray, item_cols: dict = None) -> tuple:
+        '''
+        Solves for recipe clock speeds so that every item is produced at exactly the rate it's needed
+        Recipes which would need a negative clock speed (their item is already covered by byproducts) are switched off
+        and their item is left with a surplus instead - repeated until the active set of recipes is stable
+        item_cols - {item_id: column} of every item which chose a recipe. A recipe chosen by several items (i.e. one making two requested products)
+        is balanced against whichever of them needs it to run fastest, the others are left with a surplus
+        Returns the clock speeds, which recipes were left switched on and the item each recipe was balanced against
+        '''
+        n_recipes = stoichiometry.shape[1]
+        active = np.ones(n_recipes, dtype=bool)
+        clock_speeds = np.zeros(n_recipes)
+        recipe_rows = recipe_rows.copy()
+
+        # Items sharing a recipe with another item - only these can move a column
+        if item_cols is None:
+            item_cols = {}
+        shared = [(item_id, col) for item_id, col in item_cols.items() if recipe_rows[col] != item_id]
+        shared_rows = np.array([item_id for item_id, _ in shared], dtype=int)
+        shared_cols = np.array([col for _, col in shared], dtype=int)
+
+        for _ in range((2 + len(shared)) * (n_recipes + 1)):
+            clock_speeds[:] = 0
+
+            cols = np.flatnonzero(active)
+            if len(cols) > 0:
+                rows = recipe_rows[cols]
+                system = stoichiometry[rows, :][:, cols]
+
+                solution = np.atleast_1d(spsolve(system.tocsc(), demand[rows]))
+                if not np.all(np.isfinite(solution)):
+                    raise Exception('Recipe choices give a singular production system - cannot balance the graph')
+
+                clock_speeds[cols] = solution
+
+            # Switch off recipes which would have to run backwards
+            negative = clock_speeds < -self.tolerance
+            if np.any(negative):
+                active[negative] = False
+                continue
+
+            # Switch back on recipes whose item is no longer covered by other recipes' byproducts
+            shortfall = (stoichiometry @ clock_speeds)[recipe_rows] - demand[recipe_rows] < -self.tolerance
+            reactivate = shortfall & ~active
+            if np.any(reactivate):
+                active[reactivate] = True
+                continue
+
+            # Balance shared recipes against an item which is still short
+            if len(shared) > 0:
+                short = (stoichiometry @ clock_speeds)[shared_rows] - demand[shared_rows] < -self.tolerance
+                if np.any(short):
+                    k = np.flatnonzero(short)[0]
+                    col = shared_cols[k]
+                    shared_rows[k], recipe_rows[col] = recipe_rows[col], shared_rows[k]
+                    active[col] = True
+                    continue
+
+            return np.maximum(clock_speeds, 0), active, recipe_rows
+
+        raise Exception('Could not find a balanced set of clock speeds for the requested items')
+
+
+    def build_graph(self, recipe_ids: list, primary_items: list, stoichiometry: sparse.csc_matrix, clock_speeds: np.ndarray):
+        '''
+        Rebuilds the graph nodes and edges from the solved clock speeds
+        Item nodes act as hubs - buildings feed into them and are fed from them
+        '''
+        requests = self.requests
+        self.reset_graph()
+        self.requests = requests
+
+        # Item hub nodes - only the ones which actually have something flowing through them
+        produced = np.asarray(stoichiometry.maximum(0) @ clock_speeds).ravel()
+        consumed = np.asarray((-stoichiometry).maximum(0) @ clock_speeds).ravel()
+        for item_id, item_name in enumerate(self.recipe_index.item_names.tolist()):
+            requested = float(consumed[item_id]) + self.requests.get(item_name, 0)
+
+            if produced[item_id] > self.tolerance or requested > self.tolerance:
+                self.graph_nodes[item_name] = ItemNode(name= item_name, rate_requested= requested, rate_filled= float(produced[item_id]))
+
+        # Building nodes
+        for recipe_id, primary_id, clock_speed in zip(recipe_ids, primary_items, clock_speeds.tolist()):
+            if clock_speed <= self.tolerance:
+                continue
+
+            recipe = self.recipe_index.recipe_object(self.assets, recipe_id)
+            primary_item = str(self.recipe_index.item_names[primary_id])
+
+            # Keyed by recipe so alternates for the same building and item stay separate nodes
+            building_node_name = f"{recipe.building_name}:{recipe.name}"
+            default_rate = recipe.products[ recipe.product_index[primary_item] ].rate
+
+            self.graph_nodes[building_node_name] = BuildingNode(
+                name=                       recipe.building_name,
+                recipe=                     recipe,
+                primary_item=               primary_item,
+                production_rate_default=    default_rate,
+                rate_produced=              default_rate * clock_speed
+            )
+
+            for product in recipe.products:
+                self.add_edge(GraphEdge(
+                    source_id   = building_node_name,
+                    target_id   = product.name,
+                    item_name   = product.name,
+                    rate        = product.rate * clock_speed
+                ))
+
+            for ingredient in recipe.ingredients:
+                self.add_edge(GraphEdge(
+                    source_id   = ingredient.name,
+                    target_id   = building_node_name,
+                    item_name   = ingredient.name,
+                    rate        = ingredient.rate * clock_speed
+                ))
+
+            if len(recipe.ingredients) == 0:
+                # If there's no ingredients, this is an extractor/miner building
+                self.root_nodes.append(building_node_name)
+
+        # Requested item nodes
+        for item_name, amount in self.requests.items():
+            node_name = f"{item_name}_OUT"
+            self.graph_nodes[node_name] = ItemNode(name= item_name, rate_requested= amount, rate_filled= amount)
+
+            self.add_edge(GraphEdge(
+                source_id   = item_name,
+                target_id   = node_name,
+                item_name   = item_name,
+                rate        = amount
+            ))
+
+
+    def attribute_mats(self, recipe_ids: list, stoichiometry: sparse.csc_matrix, clock_speeds: np.ndarray) -> dict:
+        '''
+        Splits the raw materials between the requests through the solved clock speeds - {item_name: {raw_material: rate}}
+        Each item goes to the requests in proportion to how much of it is used for each of them, directly or by the recipes it's used in,
+        and each recipe runs for the requests in proportion to how much of its used output goes to each - so a request still gets its share
+        when its recipe is shared with another item, or switched off because byproducts cover it
+        '''
+        index = self.recipe_index
+        request_mats = {item_name: {} for item_name in self.requests}
+
+        running = np.flatnonzero(clock_speeds > self.tolerance)
+        if len(running) == 0:
+            return request_mats
+
+        clock_speeds = clock_speeds[running]
+        net_rates = stoichiometry[:, running].toarray()
+        produced = np.maximum(net_rates, 0)
+        consumed = np.maximum(-net_rates, 0)
+
+        demands = np.zeros((len(net_rates), len(self.requests)))
+        for k, (item_name, amount) in enumerate(self.requests.items()):
+            demands[index.item_ids[item_name], k] = amount
+
+        # Rate of each item going to recipes and requests - surplus isn't counted, so the shares add up to all of the raw materials
+        used = consumed @ clock_speeds + demands.sum(axis=1)
+        items = np.flatnonzero(used > self.tolerance)
+
+        # Share of each recipe's used output which is of each item
+        weights = produced[items, :].T
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+        # Fraction of each item used for each request - the item's own request plus its share of the recipes it's used in
+        system = np.diag(used[items]) - (consumed[items, :] * clock_speeds) @ weights
+        try:
+            fractions = np.linalg.solve(system, demands[items, :])
+        except np.linalg.LinAlgError:
+            raise Exception('Could not split the raw materials between the requests')
+
+        # Clock speed of each recipe run for each request
+        request_clock_speeds = clock_speeds[:, None] * (weights @ fractions)
+
+        for col, recipe_clock_speeds in zip(running.tolist(), request_clock_speeds):
+            recipe_id = recipe_ids[col]
+
+            # Only extraction recipes use raw materials
+            if len(index.ingredients(recipe_id)[0]) > 0:
+                continue
+
+            product_items, product_rates = index.products(recipe_id)
+            raw_material = str(index.item_names[product_items[0]])
+
+            for item_name, clock_speed in zip(self.requests, recipe_clock_speeds.tolist()):
+                if clock_speed > self.tolerance:
+                    request_mats[item_name][raw_material] = request_mats[item_name].get(raw_material, 0) + float(product_rates[0]) * clock_speed
+
+        return request_mats
+
+        demands = np.zeros((len(rows), len(self.requests)))
+        for k, (item_name, amount) in enumerate(self.requests.items()):
+            demands[rows == index.item_ids[item_name], k] = amount
+
+        system = stoichiometry[rows, :][:, cols].tocsc()
+        clock_speeds = np.asarray(spsolve(system, demands)).reshape(len(cols), len(self.requests))
+
+        for col, request_clock_speeds in zip(cols.tolist(), clock_speeds):
+            recipe_id = recipe_ids[col]
+
+            # Only extraction recipes use raw materials
+            if len(index.ingredients(recipe_id)[0]) > 0:
+                continue
+
+            product_items, product_rates = index.products(recipe_id)
+            raw_material = str(index.item_names[product_items[0]])
+
+            for item_name, clock_speed in zip(self.requests, request_clock_speeds.tolist()):
+                if clock_speed > self.tolerance:
+                    request_mats[item_name][raw_material] = request_mats[item_name].get(raw_material, 0) + float(product_rates[0]) * clock_speed
+
+        return request_mats
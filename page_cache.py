@@ -0,0 +1,213 @@
+###
+# On disk cache of wiki pages, and of what the scraper read from them
+# Pages are revalidated with their ETag/Last-Modified headers, so an unchanged page is neither downloaded nor parsed again
+# The manifest of page hashes lets an asset file be rebuilt from only the pages which changed since it was made
+###
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from dataclasses import replace
+
+
+class PageCache:
+    '''
+    Cached pages, keyed by url - each page is kept as <key>.html with its validators in <key>.json
+    Parse results are kept as <key>.parsed.pickle, along with the hash of the content they were parsed from
+    '''
+
+    def __init__(self, cache_dir: str = 'wiki_cache'):
+        self.cache_dir      = cache_dir
+        self.page_hits      = 0     # Pages which were unchanged, served from disk
+        self.page_misses    = 0     # Pages which had to be downloaded
+        self.parse_hits     = 0
+        self.parse_misses   = 0
+
+        self._lock          = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    def path(self, url: str, extension: str) -> str:
+        '''
+        File of a url in the cache directory
+        '''
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.{extension}")
+
+
+    def write(self, path: str, data: bytes):
+        '''
+        Written to a temporary file first so a page is never half written if the scrape is stopped
+        '''
+        temp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'wb') as outfile:
+            outfile.write(data)
+
+        os.replace(temp_file, path)
+
+
+    def validators(self, url: str) -> dict:
+        '''
+        Conditional request headers for a cached page - empty if the page isn't cached
+        '''
+        try:
+            with open(self.path(url, 'json'), 'r') as infile:
+                meta = json.load(infile)
+        except (OSError, ValueError):
+            return {}
+
+        if not os.path.exists(self.path(url, 'html')):
+            return {}
+
+        headers = {}
+        if meta.get('etag') is not None:
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified') is not None:
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        return headers
+
+
+    def content(self, url: str) -> bytes:
+        '''
+        Cached content of a page - for when the server says it hasn't changed
+        '''
+        with open(self.path(url, 'html'), 'rb') as infile:
+            content = infile.read()
+
+        with self._lock:
+            self.page_hits += 1
+
+        return content
+
+
+    def store(self, url: str, content: bytes, etag: str = None, last_modified: str = None):
+        '''
+        Saves a freshly fetched page and its validators
+        '''
+        self.write(self.path(url, 'html'), content)
+        self.write(self.path(url, 'json'), json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified}).encode())
+
+        with self._lock:
+            self.page_misses += 1
+
+
+    def parsed(self, url: str, content: bytes, parse, version: str = ''):
+        '''
+        Result of parse(content), reused from the cache if the page content and version haven't changed since it was last parsed
+        version - changed whenever the parser changes, so old results aren't used
+        '''
+        found, result = self.cached_parse(url, content, version)
+
+        if not found:
+            result = parse(content)
+            self.store_parse(url, content, result, version)
+
+        return result
+
+
+    def cached_parse(self, url: str, content: bytes, version: str = '') -> tuple:
+        '''
+        (found, result) - the saved result of parsing this content of the page, if there is one
+        For parsing the page somewhere else (i.e. another process) when it isn't found, then saving it with store_parse
+        '''
+        try:
+            with open(self.path(url, 'parsed.pickle'), 'rb') as infile:
+                cached_hash, result = pickle.load(infile)
+
+            if cached_hash == content_hash(content) + version:
+                with self._lock:
+                    self.parse_hits += 1
+                return True, result
+
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            # Not parsed yet, or saved by an older version of the scraper
+            pass
+
+        return False, None
+
+
+    def store_parse(self, url: str, content: bytes, result, version: str = ''):
+        '''
+        Saves the result of parsing this content of the page
+        '''
+        self.write(self.path(url, 'parsed.pickle'), pickle.dumps((content_hash(content) + version, result)))
+
+        with self._lock:
+            self.parse_misses += 1
+
+
+    def info(self) -> dict:
+        '''
+        Cache statistics
+        '''
+        return {'page_hits': self.page_hits, 'page_misses': self.page_misses, 'parse_hits': self.parse_hits, 'parse_misses': self.parse_misses}
+
+
+def content_hash(content: bytes) -> str:
+    '''
+    sha256 of a page's content
+    '''
+    return hashlib.sha256(content).hexdigest()
+
+
+class PageManifest:
+    '''
+    Content hash of each page the asset data was built from, and the name of the asset read from it - {url: (content_hash, asset_name)}
+    A page with the same content as in the previous build reuses the asset from then instead of being parsed again
+    '''
+
+    def __init__(self, previous_pages: dict = None, previous_assets: dict = None):
+        self.previous_pages     = previous_pages or {}
+        self.previous_assets    = previous_assets or {}
+        self.pages              = {}
+
+
+    def reuse(self, url: str, content: bytes):
+        '''
+        Copy of the asset read from a page in the previous build, None if the page has changed since or is new
+        '''
+        previous = self.previous_pages.get(url)
+
+        if previous is None or previous[0] != content_hash(content) or previous[1] not in self.previous_assets:
+            return None
+
+        self.pages[url] = previous
+
+        # Copied so the previous asset data isn't changed by anything done to the new one
+        return replace(self.previous_assets[previous[1]])
+
+
+    def record(self, url: str, content: bytes, asset_name: str):
+        '''
+        Records the asset read from a page in this build
+        '''
+        self.pages[url] = (content_hash(content), asset_name)
+
+
+    def save(self, output_file: str):
+        '''
+        Save the pages of this build - written to a temporary file first, like the pages in the cache
+        '''
+        temp_file = f"{output_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as outfile:
+            json.dump(self.pages, outfile, indent=0)
+
+        os.replace(temp_file, output_file)
+
+
+    @classmethod
+    def load(cls, input_file: str, previous_assets: dict):
+        '''
+        Manifest of a previous build, to build the next one from - empty if there isn't one
+        '''
+        try:
+            with open(input_file, 'r') as infile:
+                previous_pages = {url: tuple(page) for url, page in json.load(infile).items()}
+        except (OSError, ValueError):
+            previous_pages = {}
+
+        return cls(previous_pages, previous_assets)
@@ -0,0 +1,123 @@
+###
+# Fetches many wiki pages at once over pooled connections
+# Used by the scraper so a full refresh of the asset data isn't one request after another on new connections
+###
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from page_cache import PageCache
+
+
+class PageFetcher:
+    '''
+    Fetches pages with a limited number of requests in flight at once
+    The worker threads are kept between calls and each has its own session, so connections are kept open and reused between requests
+    Failed requests (connection errors and 429/5xx responses) are retried with exponential backoff
+    With a PageCache, cached pages are only downloaded again if the server says they've changed
+    '''
+
+    def __init__(self, max_workers: int = 8, retries: int = 3, backoff: float = 0.5, timeout: float = 30, cache: PageCache = None):
+        self.max_workers    = max_workers
+        self.retries        = retries
+        self.backoff        = backoff
+        self.timeout        = timeout
+        self.cache          = cache
+
+        self._executor      = None
+        self._local         = threading.local()
+        self._sessions      = []
+        self._lock          = threading.Lock()
+
+
+    def session(self) -> requests.Session:
+        '''
+        Session of the current thread - made on first use
+        '''
+        session = getattr(self._local, 'session', None)
+
+        if session is None:
+            retry = Retry(
+                total=              self.retries,
+                backoff_factor=     self.backoff,
+                status_forcelist=   (429, 500, 502, 503, 504),
+                allowed_methods=    frozenset(['GET'])
+            )
+            adapter = HTTPAdapter(max_retries= retry, pool_connections= self.max_workers, pool_maxsize= self.max_workers)
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+
+        return session
+
+
+    def fetch(self, url: str) -> bytes:
+        '''
+        Gets the content of a page - raises an exception if it can't be fetched
+        '''
+        headers = {} if self.cache is None else self.cache.validators(url)
+
+        response = self.session().get(url, headers= headers, timeout= self.timeout)
+
+        # Not modified since it was cached
+        if response.status_code == 304 and len(headers) > 0:
+            return self.cache.content(url)
+
+        response.raise_for_status()
+
+        if self.cache is not None:
+            self.cache.store(url, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        return response.content
+
+
+    def fetch_all(self, urls: list):
+        '''
+        Fetches pages concurrently - generator of (url, content, error) in the same order as urls
+        content is None and error is the exception if the page couldn't be fetched
+        Pages are yielded as soon as they and the ones before them are fetched, so they can be processed while the rest download
+        '''
+        def fetch_page(url):
+            try:
+                return url, self.fetch(url), None
+            except (requests.RequestException, OSError) as error:
+                return url, None, error
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers= self.max_workers)
+            executor = self._executor
+
+        yield from executor.map(fetch_page, urls)
+
+
+    def close(self):
+        '''
+        Stops the worker threads and closes the connections of every session
+        '''
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        # Outside the lock - workers starting a session need it
+        if executor is not None:
+            executor.shutdown()
+
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
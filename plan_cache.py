@@ -0,0 +1,167 @@
+###
+# Cache of finished plans for the Dash callbacks, keyed by what was requested and the version of the asset data
+# Kept in memory and on disk - the disk copy is shared by every worker process serving the app
+###
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+def canonical(value):
+    '''
+    Value with the same form for equal requests - dicts sorted by key and numbers as floats, so {'a': 1, 'b': 2} and {'b': 2.0, 'a': 1} match
+    '''
+    if isinstance(value, dict):
+        return sorted((str(key), canonical(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+
+    return value
+
+
+class PlanCache:
+    '''
+    Least recently used cache of plan results, with results dropped once they're older than the ttl
+    Each result is also saved as <key>.pickle in cache_dir, so other processes can use it - the oldest files are removed once there are more than max_files
+    '''
+
+    def __init__(self, cache_dir: str = 'plan_cache', maxsize: int = 128, ttl: float = 3600, max_files: int = 1024):
+        self.cache_dir  = cache_dir
+        self.maxsize    = maxsize
+        self.ttl        = ttl       # Seconds a result is kept for
+        self.max_files  = max_files
+        self.results    = OrderedDict()     # key -> (time made, result)
+        self.hits       = 0
+        self.disk_hits  = 0         # Hits on results made by another process, or before this one was restarted
+        self.misses     = 0
+
+        self._lock      = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    def key(self, kind: str, asset_version: str, *inputs) -> str:
+        '''
+        Key of a plan - kind is which planner made it, inputs are everything it was made from (i.e. the requested items)
+        '''
+        return hashlib.sha256(json.dumps([kind, asset_version, canonical(list(inputs))]).encode()).hexdigest()
+
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+
+    def get(self, key: str):
+        '''
+        Cached result of a plan, None if it isn't cached or has expired
+        '''
+        now = time.time()
+
+        with self._lock:
+            cached = self.results.get(key)
+
+            if cached is not None and now - cached[0] <= self.ttl:
+                self.hits += 1
+                self.results.move_to_end(key)
+                return cached[1]
+
+            self.results.pop(key, None)
+
+        # Made by another process
+        try:
+            with open(self.path(key), 'rb') as infile:
+                made, result = pickle.load(infile)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            made, result = None, None
+
+        with self._lock:
+            if made is None or now - made > self.ttl:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self.remember(key, made, result)
+
+        return result
+
+
+    def put(self, key: str, result):
+        '''
+        Caches the result of a plan
+        '''
+        made = time.time()
+
+        with self._lock:
+            self.remember(key, made, result)
+
+        # Written to a temporary file first so other processes never read half of it
+        temp_file = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'wb') as outfile:
+            pickle.dump((made, result), outfile)
+        os.replace(temp_file, self.path(key))
+
+        self.evict_files()
+
+
+    def remember(self, key: str, made: float, result):
+        '''
+        Adds a result to the in memory cache - the lock should be held
+        '''
+        self.results[key] = (made, result)
+        self.results.move_to_end(key)
+
+        while len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+
+    def evict_files(self):
+        '''
+        Removes expired files, and the oldest ones if there are too many
+        '''
+        files = []
+        now = time.time()
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pickle')):
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                # Removed by another process
+                pass
+
+        files.sort()
+        for i, (mtime, path) in enumerate(files):
+            if now - mtime <= self.ttl and len(files) - i <= self.max_files:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def clear(self):
+        '''
+        Drops every cached result, on disk too
+        '''
+        with self._lock:
+            self.results.clear()
+
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pickle')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def info(self) -> dict:
+        '''
+        Cache statistics
+        '''
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.results), 'maxsize': self.maxsize}
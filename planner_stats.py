@@ -0,0 +1,108 @@
+###
+# Counters and timers of the work done inside a planner - for finding out where the time goes when a plan is slow
+# Opt in - planners only count anything when they're given a PlannerStats, otherwise the checks are all that's run
+###
+
+import json
+import time
+from collections import deque
+
+
+class PlannerStats:
+    '''
+    Totals of the work done by a planner since it was made (or reset), and a record of the most recent requests
+    Timings are inclusive - i.e. propagation done while expanding recipes is counted in both
+    '''
+
+    counters = ('propagation_hops', 'edges_scanned', 'recipes_expanded', 'subplans_merged')
+
+    def __init__(self, max_requests: int = 100):
+        self.propagation_hops   = 0     # Nodes updated while propagating changes upstream
+        self.edges_scanned      = 0     # Edges looked at when searching the adjacency lists
+        self.recipes_expanded   = 0     # Building nodes added from a recipe
+        self.subplans_merged    = 0     # Cached plans scaled into the graph
+        self.max_depth          = 0     # Deepest chain of recipe expansions in progress at once
+
+        self.timings            = {}    # {phase: seconds}
+        self.calls              = {}    # {phase: times run}
+        self.requests           = deque(maxlen= max_requests)
+
+        self._open_requests     = []
+
+
+    def reset(self):
+        '''
+        Clears everything counted so far
+        '''
+        self.__init__(self.requests.maxlen)
+
+
+    def add_time(self, phase: str, start: float):
+        '''
+        Adds the time since start (a time.perf_counter()) to a phase
+        '''
+        self.timings[phase] = self.timings.get(phase, 0) + time.perf_counter() - start
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+
+    def record_depth(self, depth: int):
+        '''
+        Records the number of recipe expansions in progress
+        '''
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+        # Kept against the outermost request
+        if len(self._open_requests) > 0 and depth > self._open_requests[0]['max_depth']:
+            self._open_requests[0]['max_depth'] = depth
+
+
+    def begin_request(self, action: str, item_name: str, amount: float):
+        '''
+        Starts the record of a request - requests made while handling another one (i.e. the change done by a removal) are part of the outer one
+        '''
+        self._open_requests.append({
+            'action':       action,
+            'item':         item_name,
+            'amount':       amount,
+            'max_depth':    0,
+            'start':        time.perf_counter(),
+            'counters':     {counter: getattr(self, counter) for counter in self.counters}
+        })
+
+
+    def end_request(self):
+        '''
+        Finishes the record of the latest request
+        '''
+        request = self._open_requests.pop()
+        self.add_time(f"{request['action']}_request", request['start'])
+
+        if len(self._open_requests) > 0:
+            return
+
+        record = {'action': request['action'], 'item': request['item'], 'amount': request['amount']}
+        record.update({counter: getattr(self, counter) - request['counters'][counter] for counter in self.counters})
+        record['max_depth'] = request['max_depth']
+        record['time_ms'] = 1000 * (time.perf_counter() - request['start'])
+        self.requests.append(record)
+
+
+    def as_dict(self) -> dict:
+        '''
+        Everything counted, as plain python types
+        '''
+        stats = {counter: getattr(self, counter) for counter in self.counters}
+        stats['max_depth'] = self.max_depth
+        stats['timings_ms'] = {phase: 1000 * duration for phase, duration in self.timings.items()}
+        stats['calls'] = dict(self.calls)
+        stats['requests'] = list(self.requests)
+
+        return stats
+
+
+    def to_json(self, **kwargs) -> str:
+        '''
+        as_dict as a json string - keyword arguments are passed on to json.dumps
+        '''
+        return json.dumps(self.as_dict(), **kwargs)
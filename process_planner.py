@@ -1,4 +1,6 @@
 from data_defs import Recipe, ItemNode, BuildingNode, GraphEdge
+import heapq
+import time
 import numpy as np
 
 class ProcessGraph:
@@ -6,12 +8,21 @@ class ProcessGraph:
     Computes a network graph of the balanced production layout to produce the requested items at a given rate
     '''
 
-    def __init__(self, asset_data: dict):
+    tolerance = 1e-9    # Rates smaller than this are treated as zero
+
+    def __init__(self, asset_data: dict, subplan_cache = None, recipe_choices: dict = None, stats = None):
         self.assets = asset_data
+        self.subplan_cache      = subplan_cache     # Optional SubplanCache - scales cached per unit plans into the graph instead of expanding recipes again
+        self.recipe_choices     = {} if recipe_choices is None else recipe_choices  # {item_name: recipe_name} - recipes to use instead of the standard ones
+        self.stats              = stats             # Optional PlannerStats - counts and times the work done, nothing is counted without one
 
         self.graph_nodes        = {}    
         self.graph_edges        = []
+        self.edges_in           = {}    # node id -> tuple of edges ending at that node - so upstream neighbours can be found without scanning every edge
+        self.edges_out          = {}    # node id -> tuple of edges starting at that node
         self.root_nodes         = []    # Keep track of root nodes for laying out graph later
+        self.requests           = {}    # {item_name: amount} of the requests added to the graph
+        self.request_mats       = {}    # {item_name: {raw_material: rate}} - raw materials attributed to each request
         self.available_mats     = {}    # Can load in the available raw materials we can use for production - for calculating optimal resource utilisation
 
 
@@ -23,7 +34,21 @@ class ProcessGraph:
         '''
         self.graph_nodes        = {}   
         self.graph_edges        = []
+        self.edges_in           = {}
+        self.edges_out          = {}
         self.root_nodes         = []   
+        self.requests           = {}
+        self.request_mats       = {}
+
+
+    def add_edge(self, edge: GraphEdge):
+        '''
+        Adds an edge to the graph and to the adjacency indexes
+        Adjacency is kept in tuples - most nodes only have one or two edges each way, and a tuple is half the size of a list holding them
+        '''
+        self.graph_edges.append(edge)
+        self.edges_in[edge.target_id] = self.edges_in.get(edge.target_id, ()) + (edge,)
+        self.edges_out[edge.source_id] = self.edges_out.get(edge.source_id, ()) + (edge,)
         
 
     def add_request(self, requested_item: str, requested_amount: int):
@@ -31,39 +56,444 @@ class ProcessGraph:
         Starts the process of adding a network to the graph to represent the production process of the requested item
         Propagating back from the item to basic items (i.e. ores, etc.)
         '''
+        if self.stats is not None:
+            self.stats.begin_request('add', requested_item, requested_amount)
+
         node_name = f"{requested_item}_OUT"
 
+        # Raw materials before this request, so the increase can be attributed to it
+        mats_before = self.raw_materials()
+
         # Add to graph
         self.graph_nodes[node_name] = ItemNode(name= requested_item, rate_requested= requested_amount)
+        self.requests[requested_item] = requested_amount
 
         # First check if there are unused resources (byproducts or buildings) in the graph we can use
         self.use_resources(node_name)
 
-        # Fill request by propagating the node
-        self.fill_item_request(node_name)
+        # Fill request by propagating the node - unless the resources already on the graph filled it
+        if self.graph_nodes[node_name].rate_needed() > self.tolerance:
+            self.fill_item_request(node_name)
+
+        self.request_mats[requested_item] = {mat: rate - mats_before.get(mat, 0) for mat, rate in self.raw_materials().items() if rate != mats_before.get(mat, 0)}
+
+        if self.stats is not None:
+            self.stats.end_request()
+
+
+    def add_requests(self, requests: dict):
+        '''
+        Adds several item requests to the same graph - {item_name: amount}
+        Upstream processes shared between the items are only built once and just have their rates increased for later items
+        '''
+        for requested_item, requested_amount in requests.items():
+            self.add_request(requested_item, requested_amount)
+
+
+    def update_request(self, requested_item: str, requested_amount: float):
+        '''
+        Changes the requested amount of an item, only updating the part of the graph upstream of the request
+        Adds the request if it's not on the graph yet, and removes it if the amount drops to zero
+        The graph ends up the same as planning self.requests from scratch in the order they were first added
+        Note - byproducts are given to whichever request is planned after them, so a plan depends on the order of the requests
+        (i.e. {'plastic': 5} then {'heavy_oil_residue': 2} can need more crude oil than the other way round) - LinearProcessGraph doesn't
+        '''
+        node_name = f"{requested_item}_OUT"
+
+        if node_name not in self.graph_nodes:
+            if requested_amount > 0:
+                self.add_request(requested_item, requested_amount)
+            return
+
+        if requested_amount <= 0:
+            self.remove_request(requested_item)
+        else:
+            self.change_request(requested_item, requested_amount)
+
+
+    def byproducts_upstream(self, node_names: list) -> bool:
+        '''
+        Whether any building upstream of the given nodes makes byproducts
+        '''
+        stack = [node_name for node_name in node_names if node_name in self.graph_nodes]
+        visited = set(stack)
+
+        while len(stack) > 0:
+            node_name = stack.pop()
+            node = self.graph_nodes[node_name]
+
+            if isinstance(node, BuildingNode) and len(node.recipe.products) > 1:
+                return True
+
+            for edge in self.edges_in.get(node_name, ()):
+                if edge.source_id not in visited:
+                    visited.add(edge.source_id)
+                    stack.append(edge.source_id)
+
+        return False
+
+
+    def replan(self, requests: dict, requested_item: str, requested_amount: float):
+        '''
+        Plans the graph again from scratch for the given requests, in their order - for changes which can't be made in place
+        requested_item and requested_amount are the change which needed it, for the stats
+        '''
+        if self.stats is not None:
+            self.stats.begin_request('replan', requested_item, requested_amount)
+
+        self.reset_graph()
+        self.add_requests(requests)
+
+        if self.stats is not None:
+            self.stats.end_request()
+
+
+    def change_request(self, requested_item: str, requested_amount: float):
+        '''
+        Applies the change in rate of a request already on the graph to the buildings upstream of it
+        Increases use up surplus on the graph before adding production, decreases turn down the request's own building first
+        '''
+        node_name = f"{requested_item}_OUT"
+
+        # Changing production which makes byproducts changes what the other requests were given - replan instead
+        if self.byproducts_upstream([node_name, requested_item]):
+            requests = dict(self.requests)
+            requests[requested_item] = requested_amount
+            self.replan(requests, requested_item, requested_amount)
+            return
+
+        if self.stats is not None:
+            self.stats.begin_request('change', requested_item, requested_amount)
+
+        mats_before = self.raw_materials()
+
+        node = self.graph_nodes[node_name]
+        node.rate_requested = requested_amount
+        self.requests[requested_item] = requested_amount
+
+        # The request can be filled by its own building and by surplus of the same item elsewhere on the graph
+        builder_edge = None
+        surplus_edge = None
+        for edge in self.edges_in.get(node_name, ()):
+            if isinstance(self.graph_nodes[edge.source_id], BuildingNode):
+                builder_edge = edge
+            else:
+                surplus_edge = edge
+
+        if node.rate_needed() > self.tolerance:
+            # Use up any surplus on the graph first
+            if requested_item in self.graph_nodes and self.graph_nodes[requested_item].rate_unused() > self.tolerance:
+                rate_increment = min(self.graph_nodes[requested_item].rate_unused(), node.rate_needed())
+
+                node.rate_filled += rate_increment
+                self.graph_nodes[requested_item].rate_requested += rate_increment
+                self.propagate_node_update(requested_item)
+
+                if surplus_edge is None:
+                    self.add_edge(GraphEdge(
+                        source_id= requested_item,
+                        target_id= node_name,
+                        item_name= requested_item,
+                        rate=      rate_increment
+                    ))
+                else:
+                    surplus_edge.rate += rate_increment
+
+            # Then increase production of the request's own building, or add one
+            if node.rate_needed() > self.tolerance:
+                if builder_edge is None:
+                    self.fill_item_request(node_name)
+                else:
+                    self.propagate_node_update(node_name)
+
+        elif node.rate_unused() > self.tolerance:
+            updated_nodes = []
+
+            # Turn down the request's own building first
+            if builder_edge is not None:
+                builder_node = builder_edge.source_id
+                rate_decrement = min(node.rate_unused(), self.graph_nodes[builder_node].rate_produced)
+
+                node.rate_filled -= rate_decrement
+                self.graph_nodes[builder_node].rate_produced -= rate_decrement
+                builder_edge.rate -= rate_decrement
+                updated_nodes.append(builder_node)
+
+            # Then give back surplus taken from elsewhere on the graph
+            if surplus_edge is not None and node.rate_unused() > self.tolerance:
+                rate_decrement = min(node.rate_unused(), surplus_edge.rate)
+
+                node.rate_filled -= rate_decrement
+                self.graph_nodes[requested_item].rate_requested -= rate_decrement
+                surplus_edge.rate -= rate_decrement
+                updated_nodes.append(requested_item)
+
+            # Both decreases are propagated together so shared upstream buildings are only updated once
+            self.propagate_updates(updated_nodes)
+
+        # Attribute the change in raw materials to this request
+        mats_after = self.raw_materials()
+        request_mats = self.request_mats.setdefault(requested_item, {})
+        for mat in mats_before.keys() | mats_after.keys():
+            rate = request_mats.get(mat, 0) + mats_after.get(mat, 0) - mats_before.get(mat, 0)
+
+            if abs(rate) > self.tolerance:
+                request_mats[mat] = rate
+            else:
+                request_mats.pop(mat, None)
+
+        if self.stats is not None:
+            self.stats.end_request()
+
+
+    def remove_request(self, requested_item: str):
+        '''
+        Removes a request from the graph, along with any upstream processes which were only used by it
+        '''
+        node_name = f"{requested_item}_OUT"
+
+        if node_name not in self.graph_nodes:
+            return
+
+        if self.byproducts_upstream([node_name, requested_item]):
+            requests = dict(self.requests)
+            del requests[requested_item]
+            self.replan(requests, requested_item, 0)
+            return
+
+        if self.stats is not None:
+            self.stats.begin_request('remove', requested_item, 0)
+
+        # Turn down the upstream processes, then remove whatever isn't used anymore
+        self.change_request(requested_item, 0)
+
+        upstream = [edge.source_id for edge in self.edges_in.get(node_name, ())]
+        self.remove_node(node_name)
+        self.prune_nodes(upstream)
+
+        del self.requests[requested_item]
+        self.request_mats.pop(requested_item, None)
+
+        if self.stats is not None:
+            self.stats.end_request()
+
+
+    def remove_node(self, node_name: str):
+        '''
+        Removes a node and all its edges from the graph
+        '''
+        removed = self.edges_in.pop(node_name, ()) + self.edges_out.pop(node_name, ())
+
+        for edge in removed:
+            if edge.source_id in self.edges_out:
+                self.edges_out[edge.source_id] = tuple(e for e in self.edges_out[edge.source_id] if e is not edge)
+            if edge.target_id in self.edges_in:
+                self.edges_in[edge.target_id] = tuple(e for e in self.edges_in[edge.target_id] if e is not edge)
+
+        removed_ids = set(id(edge) for edge in removed)
+        self.graph_edges = [edge for edge in self.graph_edges if id(edge) not in removed_ids]
+
+        if node_name in self.root_nodes:
+            self.root_nodes.remove(node_name)
+
+        del self.graph_nodes[node_name]
+
+
+    def prune_nodes(self, node_names: list):
+        '''
+        Removes buildings which no longer produce anything and items which no longer flow anywhere, 
+        working upstream from the given nodes
+        '''
+        stack = list(node_names)
+        while len(stack) > 0:
+            node_name = stack.pop()
+            node = self.graph_nodes.get(node_name)
+
+            if isinstance(node, BuildingNode):
+                unused = node.rate_produced <= self.tolerance
+            elif isinstance(node, ItemNode):
+                unused = abs(node.rate_requested) <= self.tolerance and abs(node.rate_filled) <= self.tolerance
+            else:
+                continue
+
+            if unused:
+                stack.extend(edge.source_id for edge in self.edges_in.get(node_name, ()))
+                stack.extend(edge.target_id for edge in self.edges_out.get(node_name, ()))
+                self.remove_node(node_name)
+
+
+    def raw_materials(self) -> dict:
+        '''
+        Total rate of each raw material extracted by the root nodes of the graph - {item_name: rate}
+        '''
+        mat_names, mat_rates = self.raw_material_vector()
+
+        return dict(zip(mat_names, mat_rates.tolist()))
+
+
+    def raw_material_vector(self) -> tuple:
+        '''
+        Names of the raw materials extracted by the root nodes of the graph, and a vector of the total rate of each
+        Several extractor roots of the same raw material are summed together
+        '''
+        mat_ids = {}
+        root_ids = np.fromiter((mat_ids.setdefault(self.graph_nodes[root].primary_item, len(mat_ids)) for root in self.root_nodes), dtype=int, count=len(self.root_nodes))
+        root_rates = np.fromiter((self.graph_nodes[root].rate_produced for root in self.root_nodes), dtype=float, count=len(self.root_nodes))
+
+        mat_rates = np.zeros(len(mat_ids))
+        np.add.at(mat_rates, root_ids, root_rates)
+
+        return list(mat_ids), mat_rates
 
 
     def fill_item_request(self, item_node_name: str):
         '''
         Edits the graph to fulfil the requested amount of the given item
         '''
+        expansion = self.item_expansion(item_node_name)
+
+        if expansion is not None:
+            self.run_expansions(expansion)
+
+
+    def item_expansion(self, item_node_name: str):
+        '''
+        Fills an item node from a cached plan of the item if there is one
+        Otherwise returns the expansion of its recipe, to be run by run_expansions
+        '''
         # Get item recipe
-        recipes = self.assets[ self.graph_nodes[item_node_name].name ].recipes
+        recipe = self.choose_recipe(self.graph_nodes[item_node_name].name)
 
-        # Just use the standard recipe for now
-        if len(recipes) > 0:
-            recipe = recipes[0]
-        else:
-            raise Exception(f'No recipe for {self.graph_nodes[item_node_name].name}')
+        # Scale a cached plan of this item into the graph if there is one - not for requested items, they need their own buildings
+        # Note - surplus already on the graph isn't used by cached plans
+        if self.subplan_cache is not None and item_node_name == self.graph_nodes[item_node_name].name:
+            subplan = self.subplan_cache.get(self, item_node_name, recipe)
+
+            if subplan is not None:
+                self.merge_subplan(subplan, item_node_name, self.graph_nodes[item_node_name].rate_needed())
+                return None
 
         # Update the graph to add the ingredients and byproducts of this recipe
-        self.build_recipe(recipe, item_node_name)
+        return self.expand_recipe(recipe, item_node_name)
+
+
+    def run_expansions(self, expansion):
+        '''
+        Runs a recipe expansion and the expansions of every ingredient it needs filled, depth first
+        The expansions in progress are kept on an explicit stack rather than the call stack, so long production chains can't hit the recursion limit
+        '''
+        if self.stats is not None:
+            start = time.perf_counter()
+
+        stack = [expansion]
+
+        if self.stats is not None:
+            self.stats.record_depth(1)
+
+        while len(stack) > 0:
+            # Next ingredient of the innermost recipe which needs filling
+            ingredient_name = next(stack[-1], None)
+
+            if ingredient_name is None:
+                stack.pop()
+                continue
+
+            expansion = self.item_expansion(ingredient_name)
+            if expansion is not None:
+                stack.append(expansion)
+
+                if self.stats is not None:
+                    self.stats.record_depth(len(stack))
+
+        if self.stats is not None:
+            self.stats.add_time('expansion', start)
+
+
+    def merge_subplan(self, subplan, item_node_name: str, rate: float):
+        '''
+        Adds a cached per unit plan of an item to the graph, scaled to the given rate
+        Nodes and edges already on the graph just have the scaled rates added to them
+        '''
+        if self.stats is not None:
+            start = time.perf_counter()
+            self.stats.subplans_merged += 1
+
+        for node_name, (rate_requested, rate_filled) in subplan.item_nodes.items():
+            # The item being filled already has its request on the graph
+            if node_name == item_node_name:
+                rate_requested -= 1
+
+            if node_name in self.graph_nodes:
+                self.graph_nodes[node_name].rate_requested += rate_requested * rate
+                self.graph_nodes[node_name].rate_filled += rate_filled * rate
+            else:
+                self.graph_nodes[node_name] = ItemNode(name= node_name, rate_requested= rate_requested * rate, rate_filled= rate_filled * rate)
+
+        for node_name, node in subplan.building_nodes.items():
+            if node_name in self.graph_nodes:
+                self.graph_nodes[node_name].rate_produced += node.rate_produced * rate
+                self.graph_nodes[node_name].update_clockspeed()
+            else:
+                self.graph_nodes[node_name] = BuildingNode(
+                    name=                       node.name,
+                    recipe=                     node.recipe,
+                    primary_item=               node.primary_item,
+                    production_rate_default=    node.production_rate_default,
+                    rate_produced=              node.rate_produced * rate
+                )
+
+        for source_id, target_id, item_name, edge_rate in subplan.edges:
+            for position, edge in enumerate(self.edges_out.get(source_id, ())):
+                if edge.target_id == target_id:
+                    edge.rate += edge_rate * rate
+                    if self.stats is not None:
+                        self.stats.edges_scanned += position + 1
+                    break
+            else:
+                self.add_edge(GraphEdge(
+                    source_id   = source_id,
+                    target_id   = target_id,
+                    item_name   = item_name,
+                    rate        = edge_rate * rate
+                ))
+
+        for root in subplan.root_nodes:
+            if root not in self.root_nodes:
+                self.root_nodes.append(root)
+
+        # Nodes of the subplan which nothing flows through, i.e. a byproduct that was used up when the subplan was made
+        self.prune_nodes(list(subplan.building_nodes) + list(subplan.item_nodes))
+
+        if self.stats is not None:
+            self.stats.add_time('subplan_merge', start)
+
+
+    def choose_recipe(self, item_name: str) -> Recipe:
+        '''
+        Gets the recipe to produce an item with - the chosen recipe if there is one, otherwise the standard recipe
+        '''
+        recipes = self.assets[item_name].recipes
+
+        if recipes is None or len(recipes) == 0:
+            raise Exception(f'No recipe for {item_name}')
+
+        if item_name in self.recipe_choices:
+            for recipe in recipes:
+                if recipe.name == self.recipe_choices[item_name]:
+                    return recipe
+
+            raise Exception(f'{item_name} has no recipe {self.recipe_choices[item_name]}')
+
+        return recipes[0]
 
 
     def use_resources(self, requesting_node: str):
         '''
         Checks if nodes currently on the graph can be used to fill the user request
         '''
+        if self.stats is not None:
+            start = time.perf_counter()
+
         # Quick check
         if isinstance(self.graph_nodes[requesting_node], ItemNode):
             # User requested items will have this flag to separate it from items within the process
@@ -81,43 +511,150 @@ class ProcessGraph:
                     self.propagate_node_update(item_name)
 
                     # Add edge
-                    self.graph_edges.append(GraphEdge(
+                    self.add_edge(GraphEdge(
                         source_id= item_name,
                         target_id= requesting_node,
                         item_name= item_name,
                         rate=      rate_increment
                     ))
 
+        if self.stats is not None:
+            self.stats.add_time('use_resources', start)
+
 
     def propagate_node_update(self, node_name: str):
         '''
         Propagates the new resource usage of a node to upstream nodes
-        Uses the graph edges to find the immediate upstream nodes from this one and updates their requirements
-        Function is called recursively until no more upstream nodes are found
         '''
+        self.propagate_updates([node_name])
 
-        if isinstance(self.graph_nodes[node_name], ItemNode):
-            # Find this node's upstream builder, if it has one
-            for i,edge in enumerate(self.graph_edges):
-                if edge.target_id == node_name:
-                    builder_node = edge.source_id
 
-                    # Only propagate the update upstream if the item node is a 'primary' product - so existing upstream processes don't mess up
-                    if self.graph_nodes[builder_node].primary_item == node_name:
+    def propagate_updates(self, node_names: list):
+        '''
+        Propagates the new resource usage of a batch of nodes to every node upstream of them
+        Nodes are updated from a worklist in topological order - downstream first - so each node is updated once
+        after all of the changes below it, instead of once per path to it
+        Nodes in a loop are put back on the worklist if something upstream of them changes them again
+        '''
+        if self.stats is not None:
+            start = time.perf_counter()
+
+        order = self.topological_order(node_names)
+
+        worklist = [(order[node_name], node_name) for node_name in set(node_names)]
+        heapq.heapify(worklist)
+        queued = set(node_names)
+
+        while len(worklist) > 0:
+            _, node_name = heapq.heappop(worklist)
+            queued.discard(node_name)
 
-                        # Update rate filled of node - since we'll increase upstream production
-                        rate_increment = self.graph_nodes[node_name].rate_requested - self.graph_nodes[node_name].rate_filled
-                        self.graph_nodes[node_name].rate_filled += rate_increment
+            if self.stats is not None:
+                self.stats.propagation_hops += 1
 
-                        # Update upstream builder
-                        self.graph_nodes[builder_node].rate_produced += rate_increment
+            for upstream_node in self.update_node(node_name):
+                if upstream_node not in queued:
+                    queued.add(upstream_node)
+                    heapq.heappush(worklist, (order[upstream_node], upstream_node))
 
-                        # Update edge
-                        self.graph_edges[i].rate += rate_increment
+        if self.stats is not None:
+            self.stats.add_time('propagation', start)
 
-                        self.propagate_node_update(builder_node)
 
+    def topological_order(self, node_names: list) -> dict:
+        '''
+        Position of every node upstream of the given nodes in a topological order of the graph - {node_name: position}
+        Reverse postorder of an iterative depth first search along the upstream links
+        '''
+        postorder = []
+        visited = set()
+
+        for start_node in node_names:
+            if start_node in visited:
+                continue
+            visited.add(start_node)
+            stack = [(start_node, iter(self.upstream_nodes(start_node)))]
+
+            while len(stack) > 0:
+                node_name, upstream = stack[-1]
+
+                for upstream_node in upstream:
+                    if upstream_node not in visited:
+                        visited.add(upstream_node)
+                        stack.append((upstream_node, iter(self.upstream_nodes(upstream_node))))
                         break
+                else:
+                    stack.pop()
+                    postorder.append(node_name)
+
+        return {node_name: position for position, node_name in enumerate(reversed(postorder))}
+
+
+    def primary_builder_edge(self, node_name: str) -> GraphEdge:
+        '''
+        Edge from the building which produces an item node as its 'primary' product, None if there isn't one
+        '''
+        edges = self.edges_in.get(node_name, ())
+
+        for position, edge in enumerate(edges):
+            builder_node = self.graph_nodes[edge.source_id]
+
+            if isinstance(builder_node, BuildingNode) and builder_node.primary_item == self.graph_nodes[node_name].name:
+                if self.stats is not None:
+                    self.stats.edges_scanned += position + 1
+                return edge
+
+        if self.stats is not None:
+            self.stats.edges_scanned += len(edges)
+
+        return None
+
+
+    def upstream_nodes(self, node_name: str) -> list:
+        '''
+        Nodes which an update of this node is propagated to
+        Item nodes - their 'primary' builder, buildings - their ingredients
+        '''
+        if isinstance(self.graph_nodes[node_name], ItemNode):
+            edge = self.primary_builder_edge(node_name)
+            return [] if edge is None else [edge.source_id]
+
+        edges = self.edges_in.get(node_name, ())
+
+        if self.stats is not None:
+            self.stats.edges_scanned += len(edges)
+
+        return [edge.source_id for edge in edges]
+
+
+    def update_node(self, node_name: str) -> list:
+        '''
+        Updates the immediate upstream nodes of a node to its new resource usage
+        Returns the upstream nodes which were changed, these need updating in turn
+        '''
+        changed = []
+
+        if isinstance(self.graph_nodes[node_name], ItemNode):
+            # Only propagate the update upstream if the item node is a 'primary' product - so existing upstream processes don't mess up
+            edge = self.primary_builder_edge(node_name)
+
+            if edge is not None:
+                builder_node = edge.source_id
+
+                # Update rate filled of node - since we'll increase upstream production
+                # A decrease can't take the builder below zero, the item is just left with a surplus
+                rate_increment = self.graph_nodes[node_name].rate_requested - self.graph_nodes[node_name].rate_filled
+                rate_increment = max(rate_increment, -self.graph_nodes[builder_node].rate_produced)
+                self.graph_nodes[node_name].rate_filled += rate_increment
+
+                # Update upstream builder
+                self.graph_nodes[builder_node].rate_produced += rate_increment
+
+                # Update edge
+                edge.rate += rate_increment
+
+                if rate_increment != 0:
+                    changed.append(builder_node)
 
         elif isinstance(self.graph_nodes[node_name], BuildingNode):
             recipe = self.graph_nodes[node_name].recipe
@@ -127,48 +664,51 @@ class ProcessGraph:
             self.graph_nodes[node_name].update_clockspeed()
             clock_increment = self.graph_nodes[node_name].clock_speed - old_speed
 
-            # Find upstream nodes by travelling along edges
-            for i,edge in enumerate(self.graph_edges):
-                # Update ingredient nodess
-                if edge.target_id == node_name:
-                    ingredient_node = edge.source_id
+            if clock_increment == 0:
+                return changed
 
-                    # Get recipe requirements for this item
-                    idx_in_recipe = recipe.ingredients_names.index( self.graph_nodes[ingredient_node].name )
+            if self.stats is not None:
+                self.stats.edges_scanned += len(self.edges_out.get(node_name, ())) + len(self.edges_in.get(node_name, ()))
 
-                    # Required increment - can be negative in case of decrement (unlikely)
-                    rate_increment = recipe.ingredients[idx_in_recipe].rate * clock_increment
-                    
-                    self.graph_nodes[ingredient_node].rate_requested += rate_increment
+            # Update byproduct nodes - downstream edges of a building are its primary product and byproducts
+            for edge in self.edges_out.get(node_name, ()):
+                byproduct_node = edge.target_id
+
+                if self.graph_nodes[byproduct_node].name != self.graph_nodes[node_name].primary_item:
+                    idx_in_recipe = recipe.product_index[ self.graph_nodes[byproduct_node].name ]
+                    rate_increment = recipe.products[idx_in_recipe].rate * clock_increment
+                    self.graph_nodes[byproduct_node].rate_filled += rate_increment
 
                     # Update edge
-                    self.graph_edges[i].rate += rate_increment
+                    edge.rate += rate_increment
+
+                    ''' 
+                    TO DO: Needs a trickier update for this, in case this byproduct node is being used in another process
+                    Let's say item A is produced as a byproduct by building A at 1 item/min but building B needs item A at 3 items/min
+                    Then another building, building C, needs to produce item A as a 'primary' item at 2 items/min
+                    If building A is subsequently updated such that it is now making 2 of item A per min, building C then needs to be updated to produce less of item A (1 item/min)
 
-                    # Update upstream node - call function recursively
-                    self.propagate_node_update(ingredient_node)
+                    Leave it for now - may result in excess production for complex processes
+                    '''
 
-                    pass
+            # Update ingredient nodes - found by travelling upstream along edges
+            for edge in self.edges_in.get(node_name, ()):
+                ingredient_node = edge.source_id
 
-                # Update byproduct nodes
-                elif edge.source_id == node_name:
-                    byproduct_node = edge.target_id
+                # Get recipe requirements for this item
+                idx_in_recipe = recipe.ingredient_index[ self.graph_nodes[ingredient_node].name ]
 
-                    if self.graph_nodes[byproduct_node].name != self.graph_nodes[node_name].primary_item:
-                        idx_in_recipe = recipe.products_names.index( self.graph_nodes[byproduct_node].name )
-                        rate_increment = recipe.products[idx_in_recipe].rate * clock_increment
-                        self.graph_nodes[byproduct_node].rate_filled += rate_increment
+                # Required increment - can be negative in case of decrement (unlikely)
+                rate_increment = recipe.ingredients[idx_in_recipe].rate * clock_increment
+                
+                self.graph_nodes[ingredient_node].rate_requested += rate_increment
 
-                        # Update edge
-                        self.graph_edges[i].rate += rate_increment
+                # Update edge
+                edge.rate += rate_increment
 
-                        ''' 
-                        TO DO: Needs a trickier update for this, in case this byproduct node is being used in another process
-                        Let's say item A is produced as a byproduct by building A at 1 item/min but building B needs item A at 3 items/min
-                        Then another building, building C, needs to produce item A as a 'primary' item at 2 items/min
-                        If building A is subsequently updated such that it is now making 2 of item A per min, building C then needs to be updated to produce less of item A (1 item/min)
+                changed.append(ingredient_node)
 
-                        Leave it for now - may result in excess production for complex processes
-                        '''
+        return changed
 
 
     def build_recipe(self, recipe: Recipe, item_node_name: str):
@@ -176,8 +716,19 @@ class ProcessGraph:
         Adds a building node using a given recipe to fill an item node, 
         and adds byproducts and ingredients to the graph
         '''
+        self.run_expansions(self.expand_recipe(recipe, item_node_name))
+
+
+    def expand_recipe(self, recipe: Recipe, item_node_name: str):
+        '''
+        Generator which does the work of build_recipe
+        Yields the name of each ingredient node which needs filling, and carries on once it has been filled
+        '''
+        if self.stats is not None:
+            self.stats.recipes_expanded += 1
+
         # Get production rate of 'primary' item with 100% clock speed
-        idx = recipe.products_names.index( self.graph_nodes[item_node_name].name )
+        idx = recipe.product_index[ self.graph_nodes[item_node_name].name ]
         default_rate = recipe.products[idx].rate
 
         # Add a building node to fill the requested rate
@@ -194,7 +745,7 @@ class ProcessGraph:
         self.graph_nodes[item_node_name].rate_filled += self.graph_nodes[building_node_name].rate_produced
 
         # Add edge between new building and requested item
-        self.graph_edges.append(GraphEdge(
+        self.add_edge(GraphEdge(
             source_id   = building_node_name,
             target_id   = item_node_name,
             item_name   = self.graph_nodes[item_node_name].name,
@@ -218,7 +769,7 @@ class ProcessGraph:
                     self.graph_nodes[product.name] = ItemNode(name= product.name, rate_filled= rate_produced)
 
                 # Add edge between building and byproduct node
-                self.graph_edges.append(GraphEdge(
+                self.add_edge(GraphEdge(
                     source_id   = building_node_name,
                     target_id   = product.name,
                     item_name   = product.name,
@@ -241,11 +792,11 @@ class ProcessGraph:
                 
             # Check if the request has been filled - could have been only partially filled by already present nodes (byproducts)
             if self.graph_nodes[ingredient.name].rate_needed() > 0:
-                # Fill item node request
-                self.fill_item_request(ingredient.name)
+                # Fill item node request - done by run_expansions before this carries on
+                yield ingredient.name
 
             # Add edge between ingredient and building
-            self.graph_edges.append(GraphEdge(
+            self.add_edge(GraphEdge(
                 source_id   = ingredient.name,
                 target_id   = building_node_name,
                 item_name   = ingredient.name,
@@ -260,6 +811,9 @@ class ProcessGraph:
     def mats_utilisation(self, available_mats: dict, request_ratios: dict):
         '''
         Calculates the process which produces a set of requested items at a requested ratio given a set of available materials
+        This is the legacy approximation - plans the ratios, then rescales every request by the most limiting material
+        through update_request. It does not trade materials between requests; LinearProcessGraph.mats_utilisation solves
+        the same problem exactly with recipe_optimiser.maximise_throughput
         available_mats - {item_name: amount_available}
         request_ratios - {item_name: ratio}
         Returns None or an error message for handling by calling script
@@ -271,43 +825,38 @@ class ProcessGraph:
         if not isinstance(request_ratios, dict):
             raise TypeError("Items request and their ratios should be given as a dictionary")
 
-        # First do a preliminary calculation to get the raw material ratio requirements
-        production_ratio = np.array([])
-        for item, ratio in request_ratios.items():
-            self.add_request(item, ratio)
-
-            production_ratio = np.append(production_ratio, ratio)
+        if self.stats is not None:
+            start = time.perf_counter()
 
-        missing_mats = []
-        mats_required = np.array([])
-        mats_actual = np.array([])
-        for root in self.root_nodes:
-            # Extract ratios into numpy arrays so we can do some fast operations on them
-            mats_required = np.append(mats_required, self.graph_nodes[root].rate_produced)
+        # First do a preliminary calculation to get the raw material ratio requirements
+        production_ratio = np.fromiter(request_ratios.values(), dtype=float, count=len(request_ratios))
+        self.add_requests(request_ratios)
 
-            try:
-                mats_actual = np.append(mats_actual, available_mats[self.graph_nodes[root].primary_item])
+        # Extract ratios into numpy arrays so we can do some fast operations on them
+        mat_names, mats_required = self.raw_material_vector()
 
-            except KeyError:
-                # Also check if any raw materials have not been provided at all
-                missing_mats.append(self.graph_nodes[root].primary_item)
+        # Also check if any raw materials have not been provided at all
+        missing_mats = np.array(mat_names)[np.isin(mat_names, list(available_mats), invert=True)].tolist()
 
         # Return if there are missing mats
         if len(missing_mats) > 0:
             return f"Missing raw materials {(', '.join(missing_mats)).replace('_',' ')}"
 
-        # Get limiting material
-        mats_availability = mats_actual / mats_required
+        mats_actual = np.fromiter((available_mats[name] for name in mat_names), dtype=float, count=len(mat_names))
+
+        # Get limiting material - ignoring anything that isn't actually used
+        mats_availability = np.divide(mats_actual, mats_required, out=np.full(len(mat_names), np.inf), where=mats_required > 0)
         limiting_idx = np.argmin(mats_availability)
 
         # Get actual amounts of requested items we can produce
         production_amount = (production_ratio / mats_required[limiting_idx]) * mats_actual[limiting_idx]
 
-        # Recalculate the graph with these new item request amounts 
-        # - no significant speed difference between this and updating the individual node requests and propagating upstream, this is actually slightly faster in some cases
-        self.reset_graph()
+        # Scale the requests to these new amounts - only updates the processes upstream of each request
         for i,item in enumerate(request_ratios):
-            self.add_request(item, production_amount[i])
+            self.update_request(item, production_amount[i])
+
+        if self.stats is not None:
+            self.stats.add_time('mats_utilisation', start)
 
         return None
 
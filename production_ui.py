@@ -3,20 +3,87 @@ from dash.dependencies import Output, Input, State, ALL
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_cytoscape as cyto
-import pickle
+import logging
+import threading
+import uuid
+from collections import OrderedDict
 from process_planner import ProcessGraph
-from data_defs import ItemNode, BuildingNode
+from planner_stats import PlannerStats
+from plan_cache import PlanCache
+from subplan_cache import SubplanCache
+from asset_store import get_assets
+from graph_elements import graph_elements, RenderCache
 
 
 # Initialise dash app and extra layouts for graphs
 app = dash.Dash(__name__)
 cyto.load_extra_layouts()
 
+# Each session's planner is kept between callbacks so edited amounts only update the affected part of the graph
+# Least recently used sessions are dropped once there are too many
+session_planners    = OrderedDict()     # session id -> (lock, planner)
+session_lock        = threading.Lock()
+max_sessions        = 32
+
+# Per unit plans of items shared by all sessions
+subplan_cache       = SubplanCache()
+
+# Graphs recently sent to browsers - updates are sent as patches of them
+render_cache        = RenderCache()
+
+# Finished plans - the same requests from another click, tab or worker process aren't planned again
+plan_cache          = PlanCache()
+
+# Planner stats of each callback are logged if the app is started with --stats
+logger              = logging.getLogger(__name__)
+log_stats           = False
+
+
+def plan_session(session: str, asset_data, requested_items: dict, snapshot, stats: PlannerStats = None):
+    '''
+    Updates the session's planner to the requested items - only the changed requests are re-planned
+    A new planner is made if the session doesn't have one or the asset data has been reloaded since
+    Returns snapshot(planner), taken while the session's lock is still held so another callback can't change the planner while it's read
+    stats - counts the work done updating the planner, if given
+    '''
+    with session_lock:
+        lock, planner = session_planners.get(session, (threading.Lock(), None))
+        session_planners[session] = (lock, planner)
+        session_planners.move_to_end(session)
+
+        while len(session_planners) > max_sessions:
+            session_planners.popitem(last=False)
+
+    with lock:
+        if planner is None or planner.assets is not asset_data:
+            planner = ProcessGraph(asset_data, subplan_cache= subplan_cache, stats= stats)
+            planner.add_requests(requested_items)
+        else:
+            planner.stats = stats
+
+            for item in list(planner.requests):
+                if item not in requested_items:
+                    planner.remove_request(item)
+
+            for item, amount in requested_items.items():
+                if planner.requests.get(item) != amount:
+                    planner.update_request(item, amount)
+
+        with session_lock:
+            if session in session_planners:
+                session_planners[session] = (lock, planner)
+
+        return snapshot(planner)
+
+
 # Initialise layout of web app
 app.layout = html.Div([
     # For storing this session's data in the browser - don't store as globals so multiple instances can run
     dcc.Store(id='memory', data={'requested_items':{}}),
 
+    # Token of the graph this page is showing, for sending only what's changed
+    dcc.Store(id='rendered', data=None),
+
     html.H1("Production Planner"),
     
     # Item inputs 
@@ -72,6 +139,7 @@ app.layout = html.Div([
 
 @app.callback(
     Output(component_id='process_network', component_property='elements'),                  # For updating the graph
+    Output(component_id='rendered', component_property='data'),                             # Token of the graph shown
     Output(component_id='raw_materials', component_property='children'),                    # For updating the list of raw materials needed
     Output(component_id='memory', component_property='data'),                               # For updating the session's data storage
     Output(component_id='item_input', component_property='value'),                          # For clearing the input form after it's submitted
@@ -80,8 +148,9 @@ app.layout = html.Div([
     Input(component_id={'type': 'item_amount', 'index': ALL}, component_property='value'),  # Amount of requested item
     State(component_id='item_input', component_property='value'),                           # Get what the user typed and potentially add it to data storage
     State(component_id='memory', component_property='data'),                                # Current state of the data storage
+    State(component_id='rendered', component_property='data'),                              # Token of the graph shown
 )
-def add_item(n_clicks, input_ids, item_amounts, item_name, memory):
+def add_item(n_clicks, input_ids, item_amounts, item_name, memory, rendered):
     elements = []
     mats = []
 
@@ -98,8 +167,8 @@ def add_item(n_clicks, input_ids, item_amounts, item_name, memory):
             del memory['requested_items'][input_ids[i]['index']]
 
 
-    with open('asset_data.pickle', 'rb') as infile:
-        asset_data = pickle.load(infile)
+    assets = get_assets()
+    asset_data = assets.assets
 
     # If valid item, add to storage
     if item_name is not None:
@@ -112,39 +181,28 @@ def add_item(n_clicks, input_ids, item_amounts, item_name, memory):
 
 
     if len(memory['requested_items']) > 0:
-        for item, amount in memory['requested_items'].items():
+        # Graph elements and raw materials of each request - only planned if these requests haven't been planned already
+        key = plan_cache.key('production', assets.version, memory['requested_items'])
+        cached = plan_cache.get(key)
+
+        if cached is None:
+            # Plan all the requested items together in one graph, so shared upstream processes are only built once
+            if 'session' not in memory:
+                memory['session'] = uuid.uuid4().hex
+            stats = PlannerStats() if log_stats else None
+            requested_items = memory['requested_items']
+            cached = plan_session(memory['session'], asset_data, requested_items,
+                lambda planner: (graph_elements(planner, asset_data), {item: dict(planner.request_mats[item]) for item in requested_items}), stats)
+
+            if stats is not None:
+                logger.info(f"add_item planner stats: {stats.to_json()}")
+
+            plan_cache.put(key, cached)
 
-            planner = ProcessGraph(asset_data)
-
-            planner.add_request(item, amount)
-
-            # Get nodes in graph
-            for node_name in planner.graph_nodes:
-                node = planner.graph_nodes[node_name]
-                if isinstance(node,ItemNode):
-                    label = f"{round(node.rate_filled,1)} {' '.join(node.name.split('_'))} per min"
-                elif isinstance(node,BuildingNode):
-                    label = f"{node.name} ({round(node.clock_speed*100,1)}%)"
-
-                asset_name = node_name.replace('_OUT', '').split(':')[0]
-                if asset_name == 'resource_well_extractor':
-                    asset_name = 'resource_well_pressurizer'
-
-                elements.append({'data' : {
-                    'id'    : node_name,
-                    'label' : label,
-                    'image' : asset_data[asset_name].image_url
-                }})
-
-            # Get connecting edges
-            for edge in planner.graph_edges:
-                elements.append({'data' : {
-                    'source'    : edge.source_id,
-                    'target'    : edge.target_id,
-                    'weight'    : round(edge.rate,1)
-                }})
-
-            # Get raw materials
+        elements, request_mats = cached
+
+        # Get raw materials attributed to each requested item
+        for item, amount in memory['requested_items'].items():
             mats.append(html.P(children= [
                 dcc.Input(
                     id={
@@ -158,13 +216,25 @@ def add_item(n_clicks, input_ids, item_amounts, item_name, memory):
                 html.Strong(f"   {' '.join(item.split('_'))} needs:")
                 ] 
                 ))
-            for root in planner.root_nodes:
-                root_node = planner.graph_nodes[root]
-                mats.append(html.P(f"{round(root_node.rate_produced,1)} {' '.join(root_node.primary_item.split('_'))} per min"))
+            for raw_material, rate in request_mats[item].items():
+                mats.append(html.P(f"{round(rate,1)} {' '.join(raw_material.split('_'))} per min"))
             mats.append(html.Br())
 
-    return elements, mats, memory, ''
+    # Only the elements which changed are sent
+    elements, rendered = render_cache.render(elements, rendered)
+
+    return elements, rendered, mats, memory, ''
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stats', action='store_true', help='Log the planner stats of every callback')
+
+    args = parser.parse_args()
+
+    if args.stats:
+        log_stats = True
+        logging.basicConfig(level=logging.INFO)
+
     app.run_server(debug=True, port=8051)
\ No newline at end of file
@@ -0,0 +1,259 @@
+###
+# Compiles the asset data into a compact numeric index of items and recipes
+# Saved next to the asset pickle so planners don't have to walk the Asset and Recipe objects on every request
+###
+
+import hashlib
+import os
+import numpy as np
+from scipy import sparse
+from asset_io import load_assets
+
+
+class RecipeIndex:
+    '''
+    Integer ids for every item and recipe, with the recipe ingredients and products held as CSR style numpy arrays
+    Recipe components of recipe r are at [ptr[r]:ptr[r+1]] of the items and rates arrays
+    The recipes of item i, in the same order as Asset.recipes, are at [item_recipe_ptr[i]:item_recipe_ptr[i+1]] of item_recipe_ids
+    Manual crafting recipes have no rates - these are stored as nan
+    '''
+
+    arrays = ('item_names', 'recipe_names', 'recipe_buildings',
+              'ingredient_ptr', 'ingredient_items', 'ingredient_rates',
+              'product_ptr', 'product_items', 'product_rates',
+              'item_recipe_ptr', 'item_recipe_ids',
+              'recipe_source_items', 'recipe_source_positions')
+
+    def __init__(self, source_hash: str = '', **arrays):
+        self.source_hash = source_hash
+
+        for name in self.arrays:
+            setattr(self, name, arrays[name])
+
+        # Name lookups
+        self.item_ids   = {name: i for i, name in enumerate(self.item_names.tolist())}
+        self.recipe_ids = {name: i for i, name in enumerate(self.recipe_names.tolist())}
+
+        self._stoichiometry = None
+
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_names)
+
+
+    @property
+    def n_recipes(self) -> int:
+        return len(self.recipe_names)
+
+
+    def ingredients(self, recipe_id: int) -> tuple:
+        '''
+        Item ids and rates of a recipe's ingredients at 100% clock speed
+        '''
+        start, end = self.ingredient_ptr[recipe_id], self.ingredient_ptr[recipe_id + 1]
+        return self.ingredient_items[start:end], self.ingredient_rates[start:end]
+
+
+    def products(self, recipe_id: int) -> tuple:
+        '''
+        Item ids and rates of a recipe's products at 100% clock speed
+        '''
+        start, end = self.product_ptr[recipe_id], self.product_ptr[recipe_id + 1]
+        return self.product_items[start:end], self.product_rates[start:end]
+
+
+    def item_recipes(self, item_id: int) -> np.ndarray:
+        '''
+        Recipe ids of an item, in the same order as Asset.recipes
+        '''
+        return self.item_recipe_ids[self.item_recipe_ptr[item_id]:self.item_recipe_ptr[item_id + 1]]
+
+
+    def is_automated(self, recipe_id: int) -> bool:
+        '''
+        Whether a recipe can be used in a production building - manual crafting recipes have no rates
+        '''
+        return bool(np.all(np.isfinite(self.ingredients(recipe_id)[1])) and np.all(np.isfinite(self.products(recipe_id)[1])))
+
+
+    def standard_recipe(self, item_id: int) -> int:
+        '''
+        Id of the first recipe of an item which can be used in a production building, -1 if there isn't one
+        '''
+        for recipe_id in self.item_recipes(item_id).tolist():
+            if self.is_automated(recipe_id):
+                return recipe_id
+
+        return -1
+
+
+    def recipe_object(self, asset_data: dict, recipe_id: int):
+        '''
+        Gets the Recipe object for a recipe id from the asset data it was compiled from
+        '''
+        item_name = str(self.item_names[self.recipe_source_items[recipe_id]])
+        return asset_data[item_name].recipes[self.recipe_source_positions[recipe_id]]
+
+
+    def stoichiometry(self) -> sparse.csc_matrix:
+        '''
+        Item by recipe matrix of net production rates at 100% clock speed - products positive, ingredients negative
+        Manual crafting recipes are left as empty columns
+        '''
+        if self._stoichiometry is None:
+            ingredient_cols = np.repeat(np.arange(self.n_recipes), np.diff(self.ingredient_ptr))
+            product_cols    = np.repeat(np.arange(self.n_recipes), np.diff(self.product_ptr))
+
+            rows    = np.concatenate((self.product_items, self.ingredient_items))
+            cols    = np.concatenate((product_cols, ingredient_cols))
+            values  = np.concatenate((self.product_rates, -self.ingredient_rates))
+
+            automated = np.array([self.is_automated(recipe_id) for recipe_id in range(self.n_recipes)], dtype=bool)
+            keep = automated[cols]
+
+            self._stoichiometry = sparse.csc_matrix((values[keep], (rows[keep], cols[keep])), shape=(self.n_items, self.n_recipes))
+
+        return self._stoichiometry
+
+
+    def save(self, output_file: str):
+        '''
+        Save the index arrays to a numpy .npz file
+        Written to a temporary file first so other processes never read a half written index
+        '''
+        temp_file = f"{output_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'wb') as outfile:
+            np.savez(outfile, source_hash=np.array(self.source_hash), **{name: getattr(self, name) for name in self.arrays})
+
+        os.replace(temp_file, output_file)
+
+
+    @classmethod
+    def load(cls, input_file: str):
+        '''
+        Load an index saved with save()
+        '''
+        with np.load(input_file, allow_pickle=False) as data:
+            return cls(source_hash=str(data['source_hash']), **{name: data[name] for name in cls.arrays})
+
+
+def compile_assets(asset_data: dict, source_hash: str = '') -> RecipeIndex:
+    '''
+    Compiles the asset dict into a RecipeIndex
+    Items get ids in asset order, followed by any recipe components which don't have an asset of their own
+    '''
+    item_names = [name for name, asset in asset_data.items() if asset.type != 'building']
+    item_ids = {name: i for i, name in enumerate(item_names)}
+
+    def item_id(name):
+        if name not in item_ids:
+            item_ids[name] = len(item_names)
+            item_names.append(name)
+        return item_ids[name]
+
+    def rate(component):
+        return np.nan if component.rate is None else component.rate
+
+    recipe_ids = {}
+    recipe_names, recipe_buildings = [], []
+    ingredient_ptr, ingredient_items, ingredient_rates = [0], [], []
+    product_ptr, product_items, product_rates = [0], [], []
+    recipe_source_items, recipe_source_positions = [], []
+    item_recipe_ptr, item_recipe_ids = [0], []
+
+    for name in list(item_names):
+        recipes = asset_data[name].recipes or []
+
+        for position, recipe in enumerate(recipes):
+            # Recipes with multiple products show up in the recipe list of each product - only add it once
+            if recipe.name not in recipe_ids:
+                recipe_ids[recipe.name] = len(recipe_names)
+                recipe_names.append(recipe.name)
+                recipe_buildings.append(recipe.building_name)
+                recipe_source_items.append(item_ids[name])
+                recipe_source_positions.append(position)
+
+                for ingredient in recipe.ingredients:
+                    ingredient_items.append(item_id(ingredient.name))
+                    ingredient_rates.append(rate(ingredient))
+                ingredient_ptr.append(len(ingredient_items))
+
+                for product in recipe.products:
+                    product_items.append(item_id(product.name))
+                    product_rates.append(rate(product))
+                product_ptr.append(len(product_items))
+
+            item_recipe_ids.append(recipe_ids[recipe.name])
+
+        item_recipe_ptr.append(len(item_recipe_ids))
+
+    # Components without their own asset have no recipes
+    item_recipe_ptr.extend([len(item_recipe_ids)] * (len(item_names) + 1 - len(item_recipe_ptr)))
+
+    return RecipeIndex(
+        source_hash=                source_hash,
+        item_names=                 np.array(item_names, dtype=str),
+        recipe_names=               np.array(recipe_names, dtype=str),
+        recipe_buildings=           np.array(recipe_buildings, dtype=str),
+        ingredient_ptr=             np.array(ingredient_ptr, dtype=np.int32),
+        ingredient_items=           np.array(ingredient_items, dtype=np.int32),
+        ingredient_rates=           np.array(ingredient_rates, dtype=np.float64),
+        product_ptr=                np.array(product_ptr, dtype=np.int32),
+        product_items=              np.array(product_items, dtype=np.int32),
+        product_rates=              np.array(product_rates, dtype=np.float64),
+        item_recipe_ptr=            np.array(item_recipe_ptr, dtype=np.int32),
+        item_recipe_ids=            np.array(item_recipe_ids, dtype=np.int32),
+        recipe_source_items=        np.array(recipe_source_items, dtype=np.int32),
+        recipe_source_positions=    np.array(recipe_source_positions, dtype=np.int32),
+    )
+
+
+def file_hash(path: str) -> str:
+    '''
+    sha256 of a file's contents
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def index_file(asset_file: str) -> str:
+    '''
+    Where the compiled index of an asset file is kept - asset_data.pickle -> asset_data.pickle.index.npz
+    The extension is kept so asset files which only differ by format don't share an index
+    '''
+    return f"{asset_file}.index.npz"
+
+
+def load_recipe_index(asset_file: str = 'asset_data.pickle', asset_data: dict = None) -> RecipeIndex:
+    '''
+    Loads the compiled index of an asset file, recompiling and saving it if the asset file has changed since
+    asset_data can be given if the asset file has already been loaded, to avoid loading it again
+    '''
+    source_hash = file_hash(asset_file)
+    cache_file = index_file(asset_file)
+
+    if os.path.exists(cache_file):
+        try:
+            index = RecipeIndex.load(cache_file)
+            if index.source_hash == source_hash:
+                return index
+        except (OSError, ValueError, KeyError):
+            # Unreadable or old format - just rebuild it
+            pass
+
+    if asset_data is None:
+        asset_data = load_assets(asset_file)
+
+    index = compile_assets(asset_data, source_hash)
+
+    try:
+        index.save(cache_file)
+    except OSError:
+        print(f"WARNING: Could not save recipe index to {cache_file}")
+
+    return index
@@ -0,0 +1,240 @@
+###
+# Chooses which recipes to use (standard or alternate) for a set of requested items
+# Solved as a linear program over the recipe index, minimising raw materials, building count or power
+###
+
+from dataclasses import dataclass
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+from recipe_index import RecipeIndex
+
+
+objectives = ('raw', 'buildings', 'power')
+
+
+@dataclass
+class RecipeSelection:
+    '''
+    Result of a recipe optimisation
+    '''
+    recipe_choices  : dict      # {item_name: recipe_name} - for the planners' recipe_choices
+    clock_speeds    : dict      # {recipe_name: clock speed} of every recipe used, as a decimal
+    objective_value : float
+
+
+def recipe_costs(index: RecipeIndex, objective: str, building_power: dict = None, raw_weights: dict = None) -> np.ndarray:
+    '''
+    Cost of running each recipe at 100% clock speed for an objective
+    raw         - items per min of raw materials extracted, raw_weights can make some raw materials more expensive than others
+    buildings   - number of buildings
+    power       - building_power {building_name: MW} of the buildings, has to be given as the asset data doesn't have it
+    '''
+    if objective == 'raw':
+        costs = np.zeros(index.n_recipes)
+        for recipe_id in range(index.n_recipes):
+            # Only extraction recipes use raw materials
+            if len(index.ingredients(recipe_id)[0]) == 0:
+                product_items, product_rates = index.products(recipe_id)
+                weight = 1 if raw_weights is None else raw_weights.get(str(index.item_names[product_items[0]]), 1)
+                costs[recipe_id] = weight * np.nansum(product_rates)
+
+        # Tiny cost on buildings so the solver doesn't pick pointless recipes which don't change the raw materials
+        costs += 1e-6
+
+    elif objective == 'buildings':
+        costs = np.ones(index.n_recipes)
+
+    elif objective == 'power':
+        if building_power is None:
+            raise ValueError("Building power usage needs to be given for the power objective")
+        costs = np.array([building_power.get(building, 0) for building in index.recipe_buildings.tolist()], dtype=float) + 1e-6
+
+    else:
+        raise ValueError(f"Unknown objective {objective} - should be one of {', '.join(objectives)}")
+
+    return costs
+
+
+def optimise_recipes(index: RecipeIndex, requests: dict, objective: str = 'raw', building_power: dict = None,
+                     raw_weights: dict = None, excluded_recipes: set = None) -> RecipeSelection:
+    '''
+    Finds the combination of recipes which produces the requested items - {item_name: amount} - with the lowest cost
+    Every item must be produced at least as fast as it's used, with raw materials unlimited
+    excluded_recipes - names of recipes which can't be used (i.e. alternates not unlocked yet)
+    '''
+    stoichiometry = index.stoichiometry()
+
+    demand = np.zeros(index.n_items)
+    for item_name, amount in requests.items():
+        demand[index.item_ids[item_name]] += amount
+
+    # Manual crafting recipes have no rates, so can't be used
+    usable = np.array([index.is_automated(recipe_id) for recipe_id in range(index.n_recipes)], dtype=bool)
+    if excluded_recipes is not None:
+        for recipe_name in excluded_recipes:
+            if recipe_name in index.recipe_ids:
+                usable[index.recipe_ids[recipe_name]] = False
+
+    bounds = [(0, None if use else 0) for use in usable.tolist()]
+
+    # Net production of each item >= demand  ->  -stoichiometry @ x <= -demand
+    result = linprog(
+        recipe_costs(index, objective, building_power, raw_weights),
+        A_ub=   -stoichiometry.tocsr(),
+        b_ub=   -demand,
+        bounds= bounds,
+        method= 'highs'
+    )
+
+    if result.status != 0:
+        raise Exception(f"Could not find recipes for the requested items - {result.message}")
+
+    return RecipeSelection(
+        recipe_choices=     choose_recipes(index, result.x),
+        clock_speeds=       {str(index.recipe_names[recipe_id]): float(result.x[recipe_id]) for recipe_id in np.flatnonzero(result.x > 1e-9)},
+        objective_value=    float(result.fun)
+    )
+
+
+def choose_recipes(index: RecipeIndex, clock_speeds: np.ndarray) -> dict:
+    '''
+    Picks one recipe per item from a solution - the recipe which produces the most of the item
+    '''
+    best = {}
+    for recipe_id in np.flatnonzero(clock_speeds > 1e-9).tolist():
+        product_items, product_rates = index.products(recipe_id)
+
+        for item_id, rate in zip(product_items.tolist(), product_rates.tolist()):
+            produced = rate * clock_speeds[recipe_id]
+            if item_id not in best or produced > best[item_id][1]:
+                best[item_id] = (recipe_id, produced)
+
+    return {str(index.item_names[item_id]): str(index.recipe_names[recipe_id]) for item_id, (recipe_id, _) in best.items()}
+
+
+@dataclass
+class ThroughputResult:
+    '''
+    Result of a throughput maximisation
+    '''
+    scale           : float     # Multiple of the requested ratios which can be produced
+    production      : dict      # {item_name: amount per min} of the requested items
+    clock_speeds    : np.ndarray    # Clock speed of every recipe in the index, as a decimal
+    recipe_choices  : dict      # {item_name: recipe_name} of the recipes used
+    used            : dict      # {raw_material: amount per min used}
+    slack           : dict      # {raw_material: amount per min left unused}
+    shadow_prices   : dict      # {raw_material: increase in scale per extra 1 per min available}
+    missing         : list      # Raw materials needed but not available at all
+
+
+def raw_materials(index: RecipeIndex) -> dict:
+    '''
+    Extraction recipes of every raw material - {item_id: [recipe_id, ...]}
+    '''
+    extraction = {}
+    for recipe_id in range(index.n_recipes):
+        if len(index.ingredients(recipe_id)[0]) == 0 and index.is_automated(recipe_id):
+            extraction.setdefault(int(index.products(recipe_id)[0][0]), []).append(recipe_id)
+
+    return extraction
+
+
+def maximise_throughput(index: RecipeIndex, available_mats: dict, request_ratios: dict, alternates: bool = True,
+                        recipe_choices: dict = None) -> ThroughputResult:
+    '''
+    Finds the most of the requested items which can be made at the requested ratios with the available raw materials
+    available_mats - {item_name: amount_available}
+    request_ratios - {item_name: ratio}
+    alternates - whether any recipe can be used, otherwise only recipe_choices and standard recipes are
+    Solved as one linear program - maximise scale subject to
+        net production of each item >= scale * ratio
+        raw material extraction <= amount available
+    '''
+    stoichiometry = index.stoichiometry()
+    n_items, n_recipes = stoichiometry.shape
+
+    # Every chosen recipe should exist and make the item it was chosen for
+    for item_name, recipe_name in (recipe_choices or {}).items():
+        if item_name not in index.item_ids:
+            raise ValueError(f"Recipe {recipe_name} chosen for unknown item {item_name}")
+        if recipe_name not in index.recipe_ids or index.item_ids[item_name] not in index.products(index.recipe_ids[recipe_name])[0].tolist():
+            raise ValueError(f"{item_name} has no recipe {recipe_name}")
+
+    # Recipes which can be used
+    if alternates:
+        usable = np.array([index.is_automated(recipe_id) for recipe_id in range(n_recipes)], dtype=bool)
+    else:
+        usable = np.zeros(n_recipes, dtype=bool)
+        for item_id in range(n_items):
+            item_name = str(index.item_names[item_id])
+            if recipe_choices is not None and item_name in recipe_choices:
+                usable[index.recipe_ids[recipe_choices[item_name]]] = True
+            elif index.standard_recipe(item_id) >= 0:
+                usable[index.standard_recipe(item_id)] = True
+
+    ratios = np.zeros(n_items)
+    for item_name, ratio in request_ratios.items():
+        ratios[index.item_ids[item_name]] += ratio
+
+    # Extraction of each raw material, limited to what's available
+    extraction = raw_materials(index)
+    raw_ids = list(extraction)
+    raw_rows = sparse.lil_matrix((len(raw_ids), n_recipes))
+    for row, item_id in enumerate(raw_ids):
+        for recipe_id in extraction[item_id]:
+            raw_rows[row, recipe_id] = index.products(recipe_id)[1][0]
+    raw_available = np.array([available_mats.get(str(index.item_names[item_id]), 0) for item_id in raw_ids], dtype=float)
+
+    # Variables are the recipe clock speeds followed by the scale
+    A_ub = sparse.vstack([
+        sparse.hstack([-stoichiometry, sparse.csc_matrix(ratios.reshape(-1, 1))]),
+        sparse.hstack([raw_rows.tocsc(), sparse.csc_matrix((len(raw_ids), 1))])
+    ]).tocsr()
+    b_ub = np.concatenate((np.zeros(n_items), raw_available))
+
+    costs = np.zeros(n_recipes + 1)
+    costs[-1] = -1
+    costs[:-1] = 1e-6      # Tiny cost on buildings so no pointless recipes are run with the leftover materials
+
+    bounds = [(0, None if use else 0) for use in usable.tolist()] + [(0, None)]
+
+    result = linprog(costs, A_ub= A_ub, b_ub= b_ub, bounds= bounds, method= 'highs')
+
+    if result.status == 3:
+        raise Exception("Requested items don't need any raw materials - production is unlimited")
+    if result.status != 0:
+        raise Exception(f"Could not maximise production - {result.message}")
+
+    clock_speeds = result.x[:-1]
+    scale = float(result.x[-1])
+
+    used = raw_rows.tocsr() @ clock_speeds
+    shadow_prices = -result.ineqlin.marginals[n_items:]
+
+    # If nothing can be made, find which raw materials are missing by planning the ratios with unlimited materials
+    missing = []
+    if scale <= 1e-9:
+        unlimited = linprog(
+            np.where(usable, 1.0, 0.0),
+            A_ub=   -stoichiometry.tocsr(),
+            b_ub=   -ratios,
+            bounds= bounds[:-1],
+            method= 'highs'
+        )
+        if unlimited.status == 0:
+            needed = raw_rows.tocsr() @ unlimited.x
+            missing = [str(index.item_names[item_id]) for item_id, rate, available in zip(raw_ids, needed, raw_available) if rate > 1e-9 and available <= 0]
+
+    raw_names = [str(index.item_names[item_id]) for item_id in raw_ids]
+
+    return ThroughputResult(
+        scale=          scale,
+        production=     {item_name: scale * ratio for item_name, ratio in request_ratios.items()},
+        clock_speeds=   clock_speeds,
+        recipe_choices= choose_recipes(index, clock_speeds),
+        used=           {name: float(rate) for name, rate in zip(raw_names, used) if rate > 1e-9},
+        slack=          {name: float(available - rate) for name, rate, available in zip(raw_names, used, raw_available) if name in available_mats},
+        shadow_prices=  {name: float(price) for name, price in zip(raw_names, shadow_prices) if name in available_mats},
+        missing=        missing
+    )
@@ -3,10 +3,26 @@
 # Non-general, uses the structure, tag labels and attributes present on the website as of 15-06-21
 ###
 
-import requests
 import os
-from bs4 import BeautifulSoup as bs
-from data_defs import Recipe, Component, Asset
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from bs4 import BeautifulSoup as bs, SoupStrainer
+from data_defs import Recipe, Component, Asset, AssetDiff
+from page_fetcher import PageFetcher
+from page_cache import PageCache, PageManifest
+
+
+# Saved with cached parse results - change it whenever the parsing changes, so pages are parsed again
+parser_version = '2'
+
+# lxml is a lot faster than python's own html parser, but is optional
+try:
+    import lxml
+    html_parser = 'lxml'
+except ImportError:
+    html_parser = 'html.parser'
 
 
 def find_navigation_table(full_soup: bs, subsection):
@@ -27,9 +43,12 @@ def find_navigation_table(full_soup: bs, subsection):
     return anchor.find_parent('table')
 
 
-def get_production_buildings(buildings_table: bs, base_link='https://satisfactory.fandom.com/wiki/', overwrite_existing_image = False):
+def get_production_buildings(buildings_table: bs, base_link='https://satisfactory.fandom.com/wiki/', overwrite_existing_image = False, fetcher: PageFetcher = None,
+                             manifest: PageManifest = None):
     '''
     Get the data for all production buildings
+    Pages are fetched concurrently with the fetcher - a new one is used if none is given
+    With a manifest, buildings whose pages haven't changed since the previous build are reused instead of read again
     '''
     buildings = {}
 
@@ -42,32 +61,87 @@ def get_production_buildings(buildings_table: bs, base_link='https://satisfactor
             names = [element.find_parent('a')['href'].split('/')[-1] for element in row.find_all('img')]
 
     if len(names) > 0:
-        for name in names:
-            # Get name from link
-            building_name = name.lower()
+        links = {f"{base_link}{name}": name for name in names}
 
-            full_link = f"{base_link}{name}"
+        with PageFetcher() if fetcher is None else nullcontext(fetcher) as page_fetcher:
+            for full_link, content, error in page_fetcher.fetch_all(list(links)):
+                # Get name from link
+                building_name = links[full_link].lower()
 
-            # Get image url - so the Dash app can use it
-            page = requests.get(full_link)
-            soup = bs(page.content, 'html.parser')
-            img_url = soup.find(attrs={'class':'infobox-table'}).find(attrs={'class':'image'}).find('img')['src']
-            
-            img_url = img_url.split('/')
-            for i,ele in enumerate(img_url):
-                if '.png' in ele  or '.gif' in ele:
-                    idx = i
-                    break
-            img_url = '/'.join(img_url[:idx+1])
+                if error is not None:
+                    print(f"Failed to read {full_link} -> {error}")
+                    continue
 
-            # Construct the data class and add to dict
-            buildings[building_name] = Asset(name=building_name, image_url=img_url, type='building')
+                building = None if manifest is None else manifest.reuse(full_link, content)
 
-            print(f"{building_name}...Done")
+                if building is None:
+                    # Get image url - so the Dash app can use it
+                    img_url = parse_page(page_fetcher, full_link, content, read_building_page)
+
+                    # Construct the data class
+                    building = Asset(name=building_name, image_url=img_url, type='building')
+
+                if manifest is not None:
+                    manifest.record(full_link, content, building.name)
+
+                buildings[building_name] = building
+
+                print(f"{building_name}...Done")
 
     return buildings
 
 
+def make_soup(content: bytes, keep_class: str = None, required: tuple = ()) -> bs:
+    '''
+    Parses page content with the fastest parser available
+    keep_class - only the elements with this class, and everything in them, are built - the rest of the page (navigation, scripts, etc) is skipped
+    required - attrs of elements which must be in the restricted soup, the whole page is parsed instead if any aren't
+    '''
+    if keep_class is not None:
+        soup = bs(content, html_parser, parse_only= SoupStrainer(attrs={'class': keep_class}))
+
+        if all(soup.find(attrs=attrs) is not None for attrs in required):
+            return soup
+
+    return bs(content, html_parser)
+
+
+def read_building_page(content: bytes) -> str:
+    '''
+    Gets the image url of a building from its wiki page
+    '''
+    soup = make_soup(content, 'infobox-table', required=({'class':'image'},))
+    img_url = soup.find(attrs={'class':'infobox-table'}).find(attrs={'class':'image'}).find('img')['src']
+
+    img_url = img_url.split('/')
+    for i,ele in enumerate(img_url):
+        if '.png' in ele  or '.gif' in ele:
+            idx = i
+            break
+
+    return '/'.join(img_url[:idx+1])
+
+
+def read_item_page(content: bytes) -> dict:
+    '''
+    Reads the wiki page of an item from the page content - see read_wiki_page
+    Only the article itself is parsed, unless something read_wiki_page needs is outside of it
+    '''
+    soup = make_soup(content, 'mw-parser-output', required=({'itemprop':'name'}, {'class':'infobox-table'}, {'id':'toc'}))
+
+    return read_wiki_page(soup)
+
+
+def parse_page(fetcher: PageFetcher, url: str, content: bytes, parse):
+    '''
+    Parses a page with the given function - reusing the last result if the fetcher has a cache and the page hasn't changed
+    '''
+    if fetcher.cache is None:
+        return parse(content)
+
+    return fetcher.cache.parsed(url, content, parse, parser_version)
+
+
 def get_section(full_soup: bs, section_name: str) -> list:
     '''
     Gets a list of elements of a section on the wiki page - list of navigable strings
@@ -319,9 +393,8 @@ def read_wiki_page(full_soup: bs) -> dict:
                 ))
 
         # Add recipes in the table if not already in it - sometimes the extraction recipe is in the wiki table, sometimes not
-        for recipe in recipe_list:
-            if recipe not in recipes:
-                recipes.append(recipe)
+        # Recipes are equal by name, so a dict keeps the first of each in order
+        recipes = list({recipe: None for recipe in recipes + recipe_list})
 
     # Construct Item data class and put into output dict
     output['item'] = Asset(name=item_name, image_url=img_url, type='item', recipes=recipes)
@@ -329,71 +402,223 @@ def read_wiki_page(full_soup: bs) -> dict:
     return output
 
 
-def get_items_and_recipes(items_table: bs, base_link='https://satisfactory.fandom.com/wiki/'):
+def get_items_and_recipes(items_table: bs, base_link='https://satisfactory.fandom.com/wiki/', fetcher: PageFetcher = None, manifest: PageManifest = None,
+                          parse_workers: int = None):
     '''
     Get the data for all satisfactory inventory items also outputs a list of all unique recipes
+    Pages are fetched concurrently with the fetcher - a new one is used if none is given - and read in the order of the table
+    With a manifest, items whose pages haven't changed since the previous build are reused instead of read again
+    parse_workers - number of processes pages are parsed in, one per core if not given - 1 parses them in this process
     '''
     items = {}
-    recipes = []
+    recipes = {}    # name -> recipe, in the order they were found
+    read = set()    # names of the recipes read from pages parsed in this build - these replace copies reused from the manifest
 
     # Get the names from the images, so the labels get left out (i.e. the tier links) - also, remove single quote characters that were read as %27
     names = [element.find_parent('a')['href'].split('/')[-1] for element in items_table.find_all('img')]
 
+    def merge_page(full_link, content, output, reused, cache):
+        '''
+        Adds the item read from a page to the output - called in the order of the table, so the output is the same however the pages were parsed
+        output - a future if the page is being parsed in another process, its result is saved in the cache if there is one
+        reused - whether the item was reused from the manifest rather than read from the page
+        '''
+        if isinstance(output, Future):
+            output = output.result()
+
+            if cache is not None:
+                cache.store_parse(full_link, content, output, parser_version)
+
+        item = output['item']
+
+        if item is None:
+            print(f"Failed to read {full_link} -> {output['msg']}")
+            return
+
+        if manifest is not None:
+            manifest.record(full_link, content, item.name)
+
+        # Don't add duplicates - recipes with multiple products will show up in the list of different items
+        # The first instance of a recipe is kept, unless it was reused and this one was read - a recipe shared with a changed page
+        # may have changed too, and the copy from the unchanged page would hide it
+        for recipe in item.recipes:
+            if recipe.name not in recipes or (not reused and recipe.name not in read):
+                recipes[recipe.name] = recipe
+            if not reused:
+                read.add(recipe.name)
+
+        # Use a dict so we can get individual items quickly by name
+        items[item.name] = item
+
+        print(f"{item.name}...Done")
+
     if len(names) > 0:
-        for name in names:
-            full_link = f"{base_link}{name}"
+        links = [f"{base_link}{name}" for name in names]
 
-            page = requests.get(full_link)
-            soup = bs(page.content, 'html.parser')
+        parse_workers = os.cpu_count() if parse_workers is None else parse_workers
 
-            output = read_wiki_page(soup)
+        # Parse workers are spawned rather than forked - the fetcher's threads are already running and a forked child
+        # could inherit one of their locks held
+        with PageFetcher() if fetcher is None else nullcontext(fetcher) as page_fetcher, \
+             ProcessPoolExecutor(parse_workers, mp_context= multiprocessing.get_context('spawn')) if parse_workers > 1 else nullcontext() as executor:
 
-            if output['item'] is not None:
-                # Use a dict so we can get individual items quickly by name
-                items[output['item'].name] = output['item']
+            # Pages being parsed, in table order - (link, content, output or future of the output)
+            pending = deque()
 
-                for recipe in output['item'].recipes:
-                    # Don't add duplicates - recipes with multiple products will show up in the list of different items
-                    if recipe not in recipes:
-                        recipes.append(recipe)
-                
-                print(f"{output['item'].name}...Done")
-            else:
-                print(f"Failed to read {full_link} -> {output['msg']}")
+            for full_link, content, error in page_fetcher.fetch_all(links):
+                if error is not None:
+                    print(f"Failed to read {full_link} -> {error}")
+                    continue
+
+                item = None if manifest is None else manifest.reuse(full_link, content)
+                reused = item is not None
+
+                if reused:
+                    output = {'item': item, 'msg': [], 'error': []}
+
+                elif executor is None:
+                    output = parse_page(page_fetcher, full_link, content, read_item_page)
 
-    return items, recipes
+                else:
+                    found, output = (False, None) if page_fetcher.cache is None else page_fetcher.cache.cached_parse(full_link, content, parser_version)
+
+                    if not found:
+                        # Parsed in another process while the next pages are fetched
+                        output = executor.submit(read_item_page, content)
+
+                pending.append((full_link, content, output, reused))
+
+                # Merge whatever is ready at the front of the queue
+                while len(pending) > 0 and not (isinstance(pending[0][2], Future) and not pending[0][2].done()):
+                    merge_page(*pending.popleft(), page_fetcher.cache)
+
+            while len(pending) > 0:
+                merge_page(*pending.popleft(), page_fetcher.cache)
 
+    # Every item with a recipe shares the instance that was kept
+    for item in items.values():
+        item.recipes = [recipes[recipe.name] for recipe in item.recipes]
 
-def get_all_asset_data(wiki_url: str = 'https://satisfactory.fandom.com/wiki/Satisfactory_Wiki'):
+    return items, list(recipes.values())
+
+
+def get_all_asset_data(wiki_url: str = 'https://satisfactory.fandom.com/wiki/Satisfactory_Wiki', max_workers: int = 8, cache_dir: str = 'wiki_cache',
+                       manifest: PageManifest = None, parse_workers: int = None):
     '''
     Get buildings and item data from the satisfactory wiki and return a list of Asset classes
+    max_workers - most pages fetched at once
+    cache_dir - where pages are cached between runs, so only pages changed on the wiki are downloaded and parsed again - None to not cache
+    manifest - pages of a previous build, assets from pages which haven't changed are reused from it
+    parse_workers - number of processes item pages are parsed in, one per core if not given
     '''
+    cache = None if cache_dir is None else PageCache(cache_dir)
 
-    # Get content of satisfactory wiki home page
-    page = requests.get(wiki_url)
-    soup = bs(page.content, 'html.parser')
+    with PageFetcher(max_workers= max_workers, cache= cache) as fetcher:
+        # Get content of satisfactory wiki home page
+        soup = bs(fetcher.fetch(wiki_url), 'html.parser')
 
-    # Get data and images for all production buildings
-    build_table = find_navigation_table(soup, 'Building')
-    buildings = get_production_buildings(build_table)
+        # Get data and images for all production buildings
+        build_table = find_navigation_table(soup, 'Building')
+        buildings = get_production_buildings(build_table, fetcher= fetcher, manifest= manifest)
 
-    print()
-    # Get data and images for all items
-    items_table = find_navigation_table(soup, 'Item')
-    items, _ = get_items_and_recipes(items_table)
+        print()
+        # Get data and images for all items
+        items_table = find_navigation_table(soup, 'Item')
+        items, _ = get_items_and_recipes(items_table, fetcher= fetcher, manifest= manifest, parse_workers= parse_workers)
 
     return buildings | items
 
 
+def diff_assets(old_assets: dict, new_assets: dict) -> AssetDiff:
+    '''
+    Finds the assets and recipes added, removed or changed between two versions of the asset data
+    Recipes are equal by name, so their components and buildings are compared to find changed ones
+    '''
+    def all_recipes(asset_data):
+        return {recipe.name: recipe for asset in asset_data.values() for recipe in (asset.recipes or [])}
+
+    def recipe_contents(recipe):
+        return (recipe.ingredients, recipe.building_name, recipe.products)
+
+    def asset_contents(asset):
+        return (asset.image_url, asset.type, [recipe_contents(recipe) for recipe in (asset.recipes or [])])
+
+    old_recipes = all_recipes(old_assets)
+    new_recipes = all_recipes(new_assets)
+
+    added_recipes   = new_recipes.keys() - old_recipes.keys()
+    removed_recipes = old_recipes.keys() - new_recipes.keys()
+    changed_recipes = {name for name in new_recipes.keys() & old_recipes.keys() if recipe_contents(new_recipes[name]) != recipe_contents(old_recipes[name])}
+
+    added_assets    = new_assets.keys() - old_assets.keys()
+    removed_assets  = old_assets.keys() - new_assets.keys()
+    changed_assets  = {name for name in new_assets.keys() & old_assets.keys() if asset_contents(new_assets[name]) != asset_contents(old_assets[name])}
+
+    # Anything made or used by a changed recipe could be planned differently now
+    affected_items = set()
+    for name in added_recipes | changed_recipes:
+        affected_items.update(new_recipes[name].ingredients_names + new_recipes[name].products_names)
+    for name in removed_recipes | changed_recipes:
+        affected_items.update(old_recipes[name].ingredients_names + old_recipes[name].products_names)
+    affected_items.update(name for name in added_assets | removed_assets if (new_assets.get(name) or old_assets.get(name)).type != 'building')
+
+    return AssetDiff(
+        added_assets=       set(added_assets),
+        removed_assets=     set(removed_assets),
+        changed_assets=     changed_assets,
+        added_recipes=      set(added_recipes),
+        removed_recipes=    set(removed_recipes),
+        changed_recipes=    changed_recipes,
+        affected_items=     affected_items
+    )
+
+
+def manifest_file(asset_file: str) -> str:
+    '''
+    Where the page manifest of an asset file is kept - asset_data.pickle -> asset_data.manifest.json
+    '''
+    return f"{os.path.splitext(asset_file)[0]}.manifest.json"
+
+
+def update_asset_data(asset_file: str = 'asset_data.pickle', wiki_url: str = 'https://satisfactory.fandom.com/wiki/Satisfactory_Wiki',
+                      max_workers: int = 8, cache_dir: str = 'wiki_cache', parse_workers: int = None) -> AssetDiff:
+    '''
+    Rebuilds an asset file from the wiki, only reading the pages which changed since it was last built
+    Anything no longer on the wiki is removed, and the changes are returned - so caches built from the old asset data can be updated
+    The first build, or one without a manifest, reads every page
+    '''
+    import pickle
+
+    previous_assets = {}
+    if os.path.exists(asset_file):
+        with open(asset_file, 'rb') as infile:
+            previous_assets = pickle.load(infile)
+
+    manifest = PageManifest.load(manifest_file(asset_file), previous_assets)
+
+    asset_data = get_all_asset_data(wiki_url, max_workers= max_workers, cache_dir= cache_dir, manifest= manifest, parse_workers= parse_workers)
+    asset_diff = diff_assets(previous_assets, asset_data)
+
+    if not asset_diff.is_empty() or not os.path.exists(asset_file):
+        assets_to_pickle(asset_data, asset_file)
+    manifest.save(manifest_file(asset_file))
+
+    return asset_diff
+
+
 def assets_to_pickle(asset_data: dict, output_file: str = 'asset_data.pickle'):
     '''
     Save asset data to a pickle file
     '''
     import pickle
 
-    with open(output_file, 'wb') as outfile:
+    # Written to a temporary file first so the planners never load a half written file
+    temp_file = f"{output_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'wb') as outfile:
         pickle.dump(asset_data, outfile)
 
+    os.replace(temp_file, output_file)
+
     print(f"Asset data saved in {output_file}")
 
 
@@ -402,24 +627,18 @@ def assets_to_json(asset_data: dict, output_file: str = 'asset_data.json'):
     Save asset data to a json file - for interoperability
     '''
     import json
-    
-    flat_data = {}
-
-    # Loop through all assets in list and flatten the classes within classes into dictionaries
-    for key in asset_data:
-        asset = asset_data[key]
-
-        recipes = []
-        if asset.recipes is not None:
-            for recipe in asset.recipes:
-                recipe.products = [vars(product) for product in recipe.products]
-                recipe.ingredients = [vars(ingredient) for ingredient in recipe.ingredients]
+    from dataclasses import asdict
 
-                recipes.append(vars(recipe))
+    # Flatten the classes within classes into dictionaries - copies, so the asset data isn't changed
+    flat_data = {}
+    for key, asset in asset_data.items():
+        dictionary = asdict(asset)
+        dictionary['recipes'] = dictionary['recipes'] or []
 
-        
-        dictionary = vars(asset)
-        dictionary['recipes'] = recipes
+        # asdict only copies the fields - the json has always had the names of each recipe's components too, so keep them for anything reading it
+        for recipe, recipe_dict in zip(asset.recipes or [], dictionary['recipes']):
+            recipe_dict['ingredients_names'] = list(recipe.ingredients_names)
+            recipe_dict['products_names'] = list(recipe.products_names)
 
         flat_data[key] = dictionary
 
@@ -429,8 +648,8 @@ def assets_to_json(asset_data: dict, output_file: str = 'asset_data.json'):
 
 if __name__ == '__main__':
     
-    asset_data = get_all_asset_data()
-    assets_to_pickle(asset_data)
+    asset_diff = update_asset_data()
+    print(f"{len(asset_diff.added_recipes)} recipes added, {len(asset_diff.removed_recipes)} removed, {len(asset_diff.changed_recipes)} changed")
 
     # import pickle
     # with open('asset_data.pickle', 'rb') as infile:
@@ -0,0 +1,133 @@
+###
+# Cache of per unit production plans of items, so deep shared subtrees (screws, rotors, circuit boards, etc.)
+# are only expanded once and then scaled into each graph which needs them
+###
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from data_defs import Recipe, ItemNode, BuildingNode
+from process_planner import ProcessGraph
+
+
+@dataclass
+class Subplan:
+    '''
+    Graph needed to produce 1 item per min of an item - every rate in here is per 1 item/min
+    '''
+    item_nodes      : dict      # node name -> (rate_requested, rate_filled)
+    building_nodes  : dict      # node name -> BuildingNode
+    edges           : list      # (source_id, target_id, item_name, rate)
+    root_nodes      : list
+    raw_mats        : dict      # raw material -> rate extracted
+    items           : frozenset # every item in the subplan - for invalidating subplans affected by changed items
+
+
+class SubplanCache:
+    '''
+    Least recently used cache of subplans, keyed by item, the recipe used to produce it and the planner's recipe choices
+    Cleared whenever it's used with different asset data
+    '''
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize    = maxsize
+        self.subplans   = OrderedDict()
+        self.hits       = 0
+        self.misses     = 0
+
+        self._assets    = None
+        self._building  = set()     # Subplans currently being made - an item needed somewhere upstream of itself can't use its own subplan
+        self._lock      = threading.RLock()
+
+
+    def get(self, planner: ProcessGraph, item_name: str, recipe: Recipe) -> Subplan:
+        '''
+        Gets the subplan of an item, making it if it's not cached
+        Returns None if the subplan can't be used - the planner should expand the recipe itself
+        '''
+        key = (item_name, recipe.name, frozenset(planner.recipe_choices.items()))
+
+        with self._lock:
+            if planner.assets is not self._assets:
+                self.invalidate()
+                self._assets = planner.assets
+
+            if key in self.subplans:
+                self.hits += 1
+                self.subplans.move_to_end(key)
+                return self.subplans[key]
+
+            if key in self._building:
+                return None
+
+            self.misses += 1
+            self._building.add(key)
+
+        try:
+            subplan = self.make_subplan(planner, item_name, recipe)
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+        with self._lock:
+            self.subplans[key] = subplan
+            while len(self.subplans) > self.maxsize:
+                self.subplans.popitem(last=False)
+
+        return subplan
+
+
+    def make_subplan(self, planner: ProcessGraph, item_name: str, recipe: Recipe) -> Subplan:
+        '''
+        Plans 1 item per min of an item on an empty graph - using this cache for anything upstream
+        '''
+        graph = ProcessGraph(planner.assets, subplan_cache= self, recipe_choices= planner.recipe_choices)
+
+        graph.graph_nodes[item_name] = ItemNode(name= item_name, rate_requested= 1)
+        graph.build_recipe(recipe, item_name)
+
+        item_nodes = {}
+        building_nodes = {}
+        for node_name, node in graph.graph_nodes.items():
+            if isinstance(node, ItemNode):
+                item_nodes[node_name] = (node.rate_requested, node.rate_filled)
+            else:
+                building_nodes[node_name] = node
+
+        return Subplan(
+            item_nodes=     item_nodes,
+            building_nodes= building_nodes,
+            edges=          [(edge.source_id, edge.target_id, edge.item_name, edge.rate) for edge in graph.graph_edges],
+            root_nodes=     list(graph.root_nodes),
+            raw_mats=       graph.raw_materials(),
+            items=          frozenset(node.name for node in graph.graph_nodes.values() if isinstance(node, ItemNode))
+        )
+
+
+    def invalidate(self, items: set = None):
+        '''
+        Removes cached subplans - all of them, or only the ones which involve any of the given items
+        '''
+        with self._lock:
+            if items is None:
+                self.subplans.clear()
+            else:
+                for key in [key for key, subplan in self.subplans.items() if not subplan.items.isdisjoint(items)]:
+                    del self.subplans[key]
+
+
+    def apply_diff(self, asset_data: dict, asset_diff):
+        '''
+        Moves the cache on to a new version of the asset data - only the subplans involving items affected by the changes are removed
+        asset_diff - scrape_wiki.diff_assets of the old and new asset data
+        '''
+        with self._lock:
+            self.invalidate(asset_diff.affected_items)
+            self._assets = asset_data
+
+
+    def info(self) -> dict:
+        '''
+        Cache statistics
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.subplans), 'maxsize': self.maxsize}
@@ -1,6 +1,55 @@
+import contextlib
+import io
+import json
+import math
+import os
 import pickle
+import sys
+import tempfile
+import threading
+import tracemalloc
+from dataclasses import asdict, FrozenInstanceError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bs4 import BeautifulSoup as bs
+from dash import Patch, no_update
 from process_planner import ProcessGraph
-from data_defs import ItemNode
+from linear_planner import LinearProcessGraph
+from subplan_cache import SubplanCache
+from recipe_index import RecipeIndex, compile_assets, load_recipe_index, index_file, file_hash
+from recipe_optimiser import optimise_recipes, maximise_throughput
+from data_defs import ItemNode, BuildingNode, Asset, Recipe, Component
+from page_fetcher import PageFetcher
+from page_cache import PageCache, PageManifest
+from scrape_wiki import get_production_buildings, get_items_and_recipes, diff_assets, read_wiki_page, read_item_page, read_building_page, assets_to_json
+from asset_io import assets_to_ndjson, load_assets
+from binary_assets import assets_to_binary, BinaryAssets
+from planner_stats import PlannerStats
+from plan_cache import PlanCache
+from job_runner import JobRunner
+from graph_elements import graph_elements, RenderCache
+
+# Cut down wiki page of an item - for the scraper tests
+sample_item_page = '''<html><head><title>Iron Plate</title><script>var wiki = {};</script></head>
+<body><div class="global-navigation"><a href="/wiki/A">A</a><a href="/wiki/B">B</a></div>
+<h1 class="page-header__title">Iron Plate</h1>
+<main><div class="mw-parser-output">
+<table class="infobox-table"><tr><th itemprop="name">Iron Plate</th></tr>
+<tr><td><a class="image" href="x"><img src="https://img.test/images/1/12/Iron_Plate.png/revision/latest?cb=2"></a></td></tr></table>
+<p>Iron Plates are one of the most basic components.</p>
+<div id="toc"><ul>
+<li><span class="tocnumber">1</span> <span class="toctext">Obtaining</span><ul>
+<li><span class="tocnumber">1.1</span> <span class="toctext">Crafting</span></li></ul></li>
+<li><span class="tocnumber">2</span> <span class="toctext">Usage</span></li></ul></div>
+<h2><span>Obtaining</span></h2>
+<h3><span>Crafting</span></h3>
+<div><table class="wikitable"><tr><th>Recipe</th><th>Ingredients</th><th>Building</th><th>Products</th><th>Prerequisites</th></tr>
+<tr><td>Iron Plate</td><td>3 × Iron Ingot30 / min</td><td>Constructor6 sec</td><td>2 × Iron Plate20 / min</td><td>Tier 0</td></tr>
+<tr><td>Alternate Coated Iron Plate</td><td>10 × Iron Ingot37.5 / min</td><td>2 × Plastic7.5 / min</td><td>Assembler8 sec</td><td>15 × Iron Plate75 / min</td><td>MAM</td></tr>
+</table></div>
+<h2><span>Usage</span></h2><p>Used in lots of things</p>
+</div></main>
+<footer><div>Fandom footer</div></footer></body></html>'''
+
 
 def singlerequests(verbose):
     '''
@@ -188,9 +237,1814 @@ def matsutilisation(verbose):
         return False
 
 
+def linearsolver(verbose):
+    '''
+    Tests the linear solver engine against the same known raw material amounts as the propagation engine
+    And checks that every item node is exactly balanced - nothing unfilled
+    '''
+    test_items = {
+        'smart_plating': {
+            'iron_ore': 23.25
+        },
+        'cooling_system': {
+            'water': 15.00,
+            'nitrogen_gas': 25.00,
+            'coal': 5.00,
+            'bauxite': 10.00,
+            'raw_quartz': 5.00,
+            'copper_ore': 15.33,
+            'crude_oil': 3.00
+        }
+    }
+
+    if verbose:
+        print("TEST: linear solver single item request")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    test_pass = True
+
+    for item_name, raw_mats in test_items.items():
+        planner = LinearProcessGraph(asset_data)
+        planner.add_request(item_name, 1)
+
+        for node in planner.graph_nodes.values():
+            if isinstance(node, ItemNode) and round(node.rate_requested - node.rate_filled, 6) > 0:
+                if verbose:
+                    print(f"{item_name}: {node.name} unfilled")
+                test_pass = False
+
+        for root in planner.root_nodes:
+            root_node = planner.graph_nodes[root]
+            if not raw_mats.get(root_node.primary_item) == round(root_node.rate_produced,2):
+                if verbose:
+                    print(f"{item_name}: incorrect amount of {root_node.primary_item}")
+                test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[linearsolver] test PASSED')
+        return True
+    else:
+        print('[linearsolver] test FAILED')
+        return False
+
+
+def sharedrecipe(verbose):
+    '''
+    Tests the linear solver with one recipe chosen for two requested items - a recipe making both of them
+    Every request should be filled whichever order they're added in, with the recipe run fast enough for the item which needs the most
+    '''
+    if verbose:
+        print("TEST: linear solver shared recipe")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    recipe_choices = {'polymer_resin': 'heavy_oil_residue', 'heavy_oil_residue': 'heavy_oil_residue'}
+
+    test_pass = True
+
+    results = []
+    for requests in [{'polymer_resin': 10, 'heavy_oil_residue': 4}, {'heavy_oil_residue': 4, 'polymer_resin': 10}]:
+        planner = LinearProcessGraph(asset_data, recipe_choices= recipe_choices)
+        planner.add_requests(requests)
+
+        for node in planner.graph_nodes.values():
+            if isinstance(node, ItemNode) and round(node.rate_requested - node.rate_filled, 6) > 0:
+                if verbose:
+                    print(f"{list(requests)}: {node.name} unfilled")
+                test_pass = False
+
+        results.append({mat: round(rate, 6) for mat, rate in planner.raw_materials().items()})
+
+    if results[0] != results[1]:
+        if verbose:
+            print(f"Raw materials depend on the request order - {results}")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[sharedrecipe] test PASSED')
+        return True
+    else:
+        print('[sharedrecipe] test FAILED')
+        return False
+
+
+def linearattribution(verbose):
+    '''
+    Tests splitting the raw materials between the requests of the linear solver, and that building nodes are named by recipe
+    Requests covered by another request's byproducts, or sharing its recipe, should still get their share, and the shares should add up
+    to all of the raw materials - for planned requests and for material utilisation
+    '''
+    if verbose:
+        print("TEST: linear solver raw material attribution")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    test_pass = True
+
+    planners = {}
+
+    # Heavy oil residue is covered by the byproduct of the plastic
+    planners['byproduct'] = LinearProcessGraph(asset_data)
+    planners['byproduct'].add_requests({'plastic': 5, 'heavy_oil_residue': 2})
+
+    # Both items chose the same recipe
+    planners['shared recipe'] = LinearProcessGraph(asset_data, recipe_choices= {'polymer_resin': 'heavy_oil_residue', 'heavy_oil_residue': 'heavy_oil_residue'})
+    planners['shared recipe'].add_requests({'polymer_resin': 2, 'heavy_oil_residue': 4})
+
+    # The refinery runs a recipe named after one product but chosen for another
+    planners['refinery'] = LinearProcessGraph(asset_data, recipe_choices= {'polymer_resin': 'heavy_oil_residue'})
+    planners['refinery'].add_requests({'fuel': 10, 'polymer_resin': 8})
+
+    planners['utilisation'] = LinearProcessGraph(asset_data)
+    error_msg = planners['utilisation'].mats_utilisation({'iron_ore': 100, 'crude_oil': 50}, {'smart_plating': 1, 'plastic': 2})
+    if error_msg is not None:
+        if verbose:
+            print(f"Utilisation failed - {error_msg}")
+        test_pass = False
+
+    for case, planner in planners.items():
+        for item_name, mats in planner.request_mats.items():
+            if len(mats) == 0:
+                if verbose:
+                    print(f"No raw materials attributed to {item_name} ({case})")
+                test_pass = False
+
+        totals = {}
+        for mats in planner.request_mats.values():
+            for mat, rate in mats.items():
+                totals[mat] = totals.get(mat, 0) + rate
+
+        if {mat: round(rate,4) for mat, rate in totals.items()} != {mat: round(rate,4) for mat, rate in planner.raw_materials().items()}:
+            if verbose:
+                print(f"Attributed raw materials {totals} don't add up to {planner.raw_materials()} ({case})")
+            test_pass = False
+
+        # Building nodes are keyed by the recipe they run
+        for node_name, node in planner.graph_nodes.items():
+            if isinstance(node, BuildingNode) and node_name != f"{node.name}:{node.recipe.name}":
+                if verbose:
+                    print(f"Building node {node_name} runs recipe {node.recipe.name} ({case})")
+                test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[linearattribution] test PASSED')
+        return True
+    else:
+        print('[linearattribution] test FAILED')
+        return False
+
+
+def linearremoval(verbose):
+    '''
+    Tests removing the only request from the linear solver - the graph should be left empty, not crash
+    '''
+    if verbose:
+        print("TEST: linear solver removing the last request")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    test_pass = True
+
+    for remove in ('remove_request', 'update_request'):
+        planner = LinearProcessGraph(asset_data)
+        planner.add_request('smart_plating', 1)
+
+        try:
+            if remove == 'remove_request':
+                planner.remove_request('smart_plating')
+            else:
+                planner.update_request('smart_plating', 0)
+        except Exception as error:
+            if verbose:
+                print(f"{remove} of the last request failed: {error!r}")
+            test_pass = False
+            continue
+
+        if planner.graph_nodes or planner.graph_edges or planner.request_mats or planner.raw_materials():
+            if verbose:
+                print(f"Graph not empty after {remove} of the last request")
+            test_pass = False
+
+        # Still usable afterwards
+        planner.add_request('smart_plating', 1)
+        if 'smart_plating' not in planner.request_mats:
+            if verbose:
+                print(f"No plan for a new request after {remove} of the last request")
+            test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[linearremoval] test PASSED')
+        return True
+    else:
+        print('[linearremoval] test FAILED')
+        return False
+
+
+def batchrequests(verbose):
+    '''
+    Tests planning several requested items in one graph
+    Items which share no raw materials should each be attributed the same raw materials as when planned on their own
+    '''
+    test_items = {
+        'smart_plating': {
+            'iron_ore': 23.25
+        },
+        'cooling_system': {
+            'water': 15.00,
+            'nitrogen_gas': 25.00,
+            'coal': 5.00,
+            'bauxite': 10.00,
+            'raw_quartz': 5.00,
+            'copper_ore': 15.33,
+            'crude_oil': 3.00
+        }
+    }
+
+    if verbose:
+        print("TEST: batch item requests")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    test_pass = True
+
+    for planner in [ProcessGraph(asset_data), LinearProcessGraph(asset_data)]:
+        planner.add_requests({item_name: 1 for item_name in test_items})
+
+        for item_name, raw_mats in test_items.items():
+            attributed = {mat: round(rate,2) for mat, rate in planner.request_mats[item_name].items()}
+            if attributed != raw_mats:
+                if verbose:
+                    print(f"{type(planner).__name__}: incorrect raw materials attributed to {item_name}")
+                test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[batchrequests] test PASSED')
+        return True
+    else:
+        print('[batchrequests] test FAILED')
+        return False
+
+
+def updaterequests(verbose):
+    '''
+    Tests changing and removing requests on an existing graph
+    The incrementally updated graph should match a graph planned from scratch with the final requests, also for items with byproducts
+    '''
+    if verbose:
+        print("TEST: incremental request updates")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    planner = ProcessGraph(asset_data)
+    planner.add_requests({'smart_plating': 1, 'cooling_system': 1, 'turbo_motor': 1})
+
+    planner.update_request('smart_plating', 4)
+    planner.update_request('turbo_motor', 0.5)
+    planner.update_request('cooling_system', 0)
+
+    reference = ProcessGraph(asset_data)
+    reference.add_requests({'smart_plating': 4, 'turbo_motor': 0.5})
+
+    test_pass = True
+
+    if set(planner.graph_nodes) != set(reference.graph_nodes):
+        if verbose:
+            print("Nodes left on the graph don't match")
+        test_pass = False
+
+    updated_mats = {mat: round(rate,2) for mat, rate in planner.raw_materials().items()}
+    reference_mats = {mat: round(rate,2) for mat, rate in reference.raw_materials().items()}
+    if updated_mats != reference_mats:
+        if verbose:
+            print(f"Incorrect raw materials {updated_mats} - expected {reference_mats}")
+        test_pass = False
+
+    for node in planner.graph_nodes.values():
+        if isinstance(node, ItemNode) and round(node.rate_needed(), 6) > 0:
+            if verbose:
+                print(f"{node.name} unfilled")
+            test_pass = False
+
+    # Items with byproducts - every step should match a plan made from scratch of the requests so far, in the same order,
+    # with and without cached subplans. Byproducts go to the later requests, so planning in another order can need more
+    byproduct_steps = [
+        [('heavy_oil_residue', 1), ('polymer_resin', 0.5), ('heavy_oil_residue', 0)],
+        [('plastic', 5), ('heavy_oil_residue', 2), ('plastic', 1), ('fuel', 3), ('heavy_oil_residue', 4), ('plastic', 0)],
+        [('circuit_board', 2), ('heavy_oil_residue', 1), ('rubber', 2), ('circuit_board', 0), ('polymer_resin', 3)]
+    ]
+    for steps in byproduct_steps:
+        for cache in (None, SubplanCache()):
+            planner = ProcessGraph(asset_data, subplan_cache= cache)
+
+            for item, amount in steps:
+                planner.update_request(item, amount)
+
+                reference = ProcessGraph(asset_data, subplan_cache= cache)
+                reference.add_requests(dict(planner.requests))
+
+                if set(planner.graph_nodes) != set(reference.graph_nodes) \
+                        or {mat: round(rate,4) for mat, rate in planner.raw_materials().items()} != {mat: round(rate,4) for mat, rate in reference.raw_materials().items()}:
+                    if verbose:
+                        print(f"Graph after {steps[:steps.index((item, amount))+1]} doesn't match a new plan of {planner.requests}")
+                    test_pass = False
+
+                for node_name, node in planner.graph_nodes.items():
+                    if isinstance(node, ItemNode) and round(node.rate_needed(), 6) > 0:
+                        if verbose:
+                            print(f"{node_name} unfilled after {item} changed to {amount}")
+                        test_pass = False
+                    elif isinstance(node, BuildingNode) and node.rate_produced <= ProcessGraph.tolerance:
+                        if verbose:
+                            print(f"{node_name} left on the graph producing nothing")
+                        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[updaterequests] test PASSED')
+        return True
+    else:
+        print('[updaterequests] test FAILED')
+        return False
+
+
+def subplancache(verbose):
+    '''
+    Tests planning with cached per unit subplans against the known raw material amounts
+    Planning the same items again should only use cached subplans
+    '''
+    test_items = {
+        'smart_plating': {
+            'iron_ore': 46.50
+        },
+        'turbo_motor': {
+            'water': 216.00,
+            'nitrogen_gas': 200.00,
+            'coal': 160.00,
+            'bauxite': 176.00,
+            'raw_quartz': 148.00,
+            'copper_ore': 312.67,
+            'crude_oil': 270.00,
+            'iron_ore': 338.00
+        }
+    }
+
+    if verbose:
+        print("TEST: subplan cache")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    cache = SubplanCache()
+
+    test_pass = True
+
+    misses = 0
+    for planning_round in range(2):
+        for item_name, raw_mats in test_items.items():
+            planner = ProcessGraph(asset_data, subplan_cache= cache)
+            planner.add_request(item_name, 2)
+
+            if {mat: round(rate,2) for mat, rate in planner.raw_materials().items()} != raw_mats:
+                if verbose:
+                    print(f"Incorrect raw materials for {item_name}")
+                test_pass = False
+
+        if planning_round == 0:
+            misses = cache.misses
+
+    if cache.misses != misses or cache.hits == 0:
+        if verbose:
+            print(f"Subplans not reused {cache.info()}")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[subplancache] test PASSED')
+        return True
+    else:
+        print('[subplancache] test FAILED')
+        return False
+
+
+def recipeoptimiser(verbose):
+    '''
+    Tests choosing recipes to minimise raw materials
+    The chosen recipes should never need more raw materials than the standard ones, and should plan to the optimiser's total
+    '''
+    test_items = ['smart_plating', 'cooling_system', 'turbo_motor']
+
+    if verbose:
+        print("TEST: recipe optimiser")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    index = compile_assets(asset_data)
+
+    test_pass = True
+
+    for item_name in test_items:
+        selection = optimise_recipes(index, {item_name: 1}, 'raw')
+
+        standard = LinearProcessGraph(asset_data, index)
+        standard.add_request(item_name, 1)
+
+        optimised = LinearProcessGraph(asset_data, index, recipe_choices= selection.recipe_choices)
+        optimised.add_request(item_name, 1)
+
+        standard_total = sum(standard.raw_materials().values())
+        optimised_total = sum(optimised.raw_materials().values())
+
+        if round(optimised_total, 2) > round(standard_total, 2):
+            if verbose:
+                print(f"{item_name}: chosen recipes need more raw materials than the standard recipes")
+            test_pass = False
+
+        if round(optimised_total, 1) != round(selection.objective_value, 1):
+            if verbose:
+                print(f"{item_name}: planned raw materials {optimised_total} don't match the optimiser {selection.objective_value}")
+            test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[recipeoptimiser] test PASSED')
+        return True
+    else:
+        print('[recipeoptimiser] test FAILED')
+        return False
+
+
+def lpthroughput(verbose):
+    '''
+    Tests the linear program materials utilisation against the same known ratio as the propagation engine
+    Alternate recipes should never make less
+    '''
+    available_materials = {
+        'iron_ore': 720,
+        'copper_ore': 240,
+        'coal': 480,
+        'limestone': 240
+    }
+    request_ratios = {
+        'motor': 1,
+        'encased_industrial_beam': 2,
+        'steel_pipe': 10,
+        'copper_sheet': 10
+    }
+    actual_production = {
+        'motor': 8,
+        'encased_industrial_beam': 16,
+        'steel_pipe': 80,
+        'copper_sheet': 80
+    }
+    required_materials = {
+        'iron_ore': 628,
+        'copper_ore': 224,
+        'coal': 448,
+        'limestone': 240
+    }
+
+    if verbose:
+        print("TEST: linear program materials utilisation")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    test_pass = True
+
+    planner = LinearProcessGraph(asset_data)
+    planner.mats_utilisation(available_materials, request_ratios)
+
+    for item, amount in actual_production.items():
+        if not round(planner.graph_nodes[f"{item}_OUT"].rate_filled,1) == amount:
+            if verbose:
+                print(f"Incorrect amount produced of {item}")
+            test_pass = False
+
+    for item, amount in required_materials.items():
+        if not round(planner.utilisation.used[item],1) == amount or not round(planner.utilisation.slack[item],1) == available_materials[item] - amount:
+            if verbose:
+                print(f"Incorrect amount of {item} used")
+            test_pass = False
+
+    # Limestone is the limiting material, so it's the only one which is worth having more of
+    if not planner.utilisation.shadow_prices['limestone'] > 0 or planner.utilisation.shadow_prices['iron_ore'] > 1e-6:
+        if verbose:
+            print(f"Incorrect shadow prices {planner.utilisation.shadow_prices}")
+        test_pass = False
+
+    alternates = LinearProcessGraph(asset_data)
+    alternates.mats_utilisation(available_materials, request_ratios, alternates= True)
+    if alternates.utilisation.scale < planner.utilisation.scale - 1e-6:
+        if verbose:
+            print("Alternate recipes made less")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[lpthroughput] test PASSED')
+        return True
+    else:
+        print('[lpthroughput] test FAILED')
+        return False
+
+
+def recipechoices(verbose):
+    '''
+    Tests maximising throughput with recipe choices which don't exist or don't make their item
+    They should be rejected with a ValueError naming the item and recipe, not fail later on a lookup
+    '''
+    if verbose:
+        print("TEST: throughput recipe choices")
+
+    asset_data = {
+        'miner':        Asset('miner', '', 'building'),
+        'constructor':  Asset('constructor', '', 'building'),
+        'iron_ore':     Asset('iron_ore', '', 'item', [Recipe('iron_ore', [], 'miner', [Component('iron_ore', 1, 60)])]),
+        'iron_plate':   Asset('iron_plate', '', 'item', [
+            Recipe('iron_plate', [Component('iron_ore', 3, 30)], 'constructor', [Component('iron_plate', 2, 20)]),
+            Recipe('alternate_iron_plate', [Component('iron_ore', 1, 30)], 'constructor', [Component('iron_plate', 1, 30)])
+        ])
+    }
+    index = compile_assets(asset_data)
+
+    test_pass = True
+
+    result = maximise_throughput(index, {'iron_ore': 60}, {'iron_plate': 1}, alternates= False, recipe_choices= {'iron_plate': 'alternate_iron_plate'})
+    if round(result.production['iron_plate'], 2) != 60:
+        if verbose:
+            print(f"Chosen recipe not used - {result.production}")
+        test_pass = False
+
+    bad_choices = [
+        {'iron_plate': 'no_such_recipe'},
+        {'iron_plate': 'iron_ore'},
+        {'no_such_item': 'iron_plate'}
+    ]
+    for recipe_choices in bad_choices:
+        [(item_name, recipe_name)] = recipe_choices.items()
+        try:
+            maximise_throughput(index, {'iron_ore': 60}, {'iron_plate': 1}, alternates= False, recipe_choices= recipe_choices)
+            error = None
+        except Exception as exception:
+            error = exception
+
+        if not isinstance(error, ValueError) or item_name not in str(error) or recipe_name not in str(error):
+            if verbose:
+                print(f"{recipe_choices} not rejected by name - {error!r}")
+            test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[recipechoices] test PASSED')
+        return True
+    else:
+        print('[recipechoices] test FAILED')
+        return False
+
+
+def boundedstack(verbose):
+    '''
+    Tests planning with a recursion limit far below the depth of the production chains
+    Expansion and propagation don't recurse, so the plans should match ones made with the normal limit
+    '''
+    test_items = {'smart_plating': 4, 'cooling_system': 2, 'turbo_motor': 1}
+
+    if verbose:
+        print("TEST: bounded stack planning")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    reference = ProcessGraph(asset_data)
+    reference.add_requests(test_items)
+    reference.update_request('smart_plating', 1)
+
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(30)
+    try:
+        planner = ProcessGraph(asset_data)
+        planner.add_requests(test_items)
+        planner.update_request('smart_plating', 1)
+    except RecursionError:
+        planner = None
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    test_pass = True
+
+    if planner is None:
+        if verbose:
+            print("Recursion limit reached")
+        test_pass = False
+
+    elif {mat: round(rate,2) for mat, rate in planner.raw_materials().items()} != {mat: round(rate,2) for mat, rate in reference.raw_materials().items()}:
+        if verbose:
+            print("Incorrect raw materials")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[boundedstack] test PASSED')
+        return True
+    else:
+        print('[boundedstack] test FAILED')
+        return False
+
+
+def planmemory(verbose):
+    '''
+    Tests the memory a large plan takes stays small - graph nodes and edges are slotted, and the adjacency of each node is a tuple
+    Plans a 1000 item chain of made up items and compares the memory still held per graph node against a bound
+    '''
+    chain_length = 1000
+    max_bytes_per_node = 440     # About 400 measured - 565 with instance dicts, 477 with adjacency lists
+
+    if verbose:
+        print("TEST: plan memory")
+
+    asset_data = {
+        'miner':        Asset('miner', '', 'building'),
+        'constructor':  Asset('constructor', '', 'building'),
+        'part_0':       Asset('part_0', '', 'item', [Recipe('part_0', [], 'miner', [Component('part_0', 1, 60)])])
+    }
+    for i in range(1, chain_length):
+        asset_data[f'part_{i}'] = Asset(f'part_{i}', '', 'item', [Recipe(f'part_{i}', [Component(f'part_{i-1}', 1, 30)], 'constructor', [Component(f'part_{i}', 1, 30)])])
+
+    tracemalloc.start()
+    try:
+        planner = ProcessGraph(asset_data)
+        planner.add_request(f'part_{chain_length-1}', 10)
+        used = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    test_pass = True
+
+    if len(planner.graph_nodes) != 2 * chain_length:
+        if verbose:
+            print(f"{len(planner.graph_nodes)} nodes planned - expected {2 * chain_length}")
+        test_pass = False
+
+    if any(hasattr(node, '__dict__') for node in planner.graph_nodes.values()) or any(hasattr(edge, '__dict__') for edge in planner.graph_edges):
+        if verbose:
+            print("Graph nodes or edges have an instance dict")
+        test_pass = False
+
+    bytes_per_node = used / len(planner.graph_nodes)
+    if verbose:
+        print(f"{bytes_per_node:.0f} bytes per node")
+    if bytes_per_node > max_bytes_per_node:
+        if verbose:
+            print(f"Plan takes {bytes_per_node:.0f} bytes per node - over {max_bytes_per_node}")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[planmemory] test PASSED')
+        return True
+    else:
+        print('[planmemory] test FAILED')
+        return False
+
+
+def pagefetcher(verbose):
+    '''
+    Tests scraping building pages from a local stand-in for the wiki
+    Pages should be read in order, a page which fails once should be retried and a missing page should be reported, not raised
+    '''
+    building_page = '''<html><body><table class="infobox-table"><tr><td><a class="image">
+        <img src="http://img.test/images/a/ab/{name}.png/revision/latest?cb=1"></a></td></tr></table></body></html>'''
+    building_names = ['Smelter', 'Constructor', 'Assembler', 'Missing', 'Refinery']
+    buildings_table = bs('''<table><tr><td>Production</td><td>''' +
+        ''.join(f'<a href="/wiki/{name}"><img src="{name}.png"></a>' for name in building_names) +
+        '''</td></tr></table>''', 'html.parser')
+
+    requested = []
+
+    class WikiStandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.split('/')[-1]
+            requested.append(name)
+
+            # Fail the first request for the refinery, and have no page for the missing building
+            if name == 'Missing' or (name == 'Refinery' and requested.count(name) == 1):
+                self.send_response(404 if name == 'Missing' else 503)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(building_page.format(name= name).encode())
+
+        def log_message(self, *args):
+            pass
+
+    if verbose:
+        print("TEST: concurrent page fetching")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WikiStandIn)
+    threading.Thread(target= server.serve_forever, daemon= True).start()
+
+    try:
+        with PageFetcher(max_workers= 3, retries= 2, backoff= 0) as fetcher:
+            with contextlib.redirect_stdout(io.StringIO()) as progress:
+                buildings = get_production_buildings(buildings_table, base_link= f"http://127.0.0.1:{server.server_port}/wiki/", fetcher= fetcher)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    test_pass = True
+
+    expected = [name.lower() for name in building_names if name != 'Missing']
+    if list(buildings) != expected:
+        if verbose:
+            print(f"Incorrect buildings {list(buildings)} - expected {expected}")
+        test_pass = False
+
+    if any(buildings[name].image_url != f"http://img.test/images/a/ab/{name.capitalize()}.png" for name in buildings):
+        if verbose:
+            print("Incorrect image urls")
+        test_pass = False
+
+    if requested.count('Refinery') != 2:
+        if verbose:
+            print("Failed page not retried")
+        test_pass = False
+
+    done = [line.replace('...Done', '') for line in progress.getvalue().splitlines() if line.endswith('...Done')]
+    if done != expected or 'Failed to read' not in progress.getvalue():
+        if verbose:
+            print("Incorrect progress reporting")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[pagefetcher] test PASSED')
+        return True
+    else:
+        print('[pagefetcher] test FAILED')
+        return False
+
+
+def pagecache(verbose):
+    '''
+    Tests scraping building pages twice through the page cache, with one page changed on the stand-in wiki in between
+    Only the changed page should be downloaded and parsed again
+    '''
+    building_names = ['Smelter', 'Constructor', 'Assembler']
+    buildings_table = bs('''<table><tr><td>Production</td><td>''' +
+        ''.join(f'<a href="/wiki/{name}"><img src="{name}.png"></a>' for name in building_names) +
+        '''</td></tr></table>''', 'html.parser')
+
+    image_versions = {name: 1 for name in building_names}
+
+    class WikiStandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.split('/')[-1]
+            etag = f'"{name}-{image_versions[name]}"'
+
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(f'''<html><body><table class="infobox-table"><tr><td><a class="image">
+                <img src="http://img.test/{name}_v{image_versions[name]}.png"></a></td></tr></table></body></html>'''.encode())
+
+        def log_message(self, *args):
+            pass
+
+    if verbose:
+        print("TEST: page cache")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WikiStandIn)
+    threading.Thread(target= server.serve_forever, daemon= True).start()
+    base_link = f"http://127.0.0.1:{server.server_port}/wiki/"
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir, contextlib.redirect_stdout(io.StringIO()):
+            with PageFetcher(cache= PageCache(cache_dir)) as fetcher:
+                get_production_buildings(buildings_table, base_link= base_link, fetcher= fetcher)
+
+            image_versions['Constructor'] = 2
+
+            cache = PageCache(cache_dir)
+            with PageFetcher(cache= cache) as fetcher:
+                buildings = get_production_buildings(buildings_table, base_link= base_link, fetcher= fetcher)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    test_pass = True
+
+    if buildings['constructor'].image_url != "http://img.test/Constructor_v2.png" or buildings['smelter'].image_url != "http://img.test/Smelter_v1.png":
+        if verbose:
+            print("Incorrect image urls")
+        test_pass = False
+
+    if cache.info() != {'page_hits': 2, 'page_misses': 1, 'parse_hits': 2, 'parse_misses': 1}:
+        if verbose:
+            print(f"Unchanged pages fetched or parsed again {cache.info()}")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[pagecache] test PASSED')
+        return True
+    else:
+        print('[pagecache] test FAILED')
+        return False
+
+
+def incrementalrebuild(verbose):
+    '''
+    Tests rebuilding asset data from only the pages which changed, and the diff between two versions of the asset data
+    '''
+    building_names = ['Smelter', 'Constructor', 'Assembler']
+    buildings_table = bs('''<table><tr><td>Production</td><td>''' +
+        ''.join(f'<a href="/wiki/{name}"><img src="{name}.png"></a>' for name in building_names) +
+        '''</td></tr></table>''', 'html.parser')
+
+    image_versions = {name: 1 for name in building_names}
+
+    class WikiStandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.split('/')[-1]
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(f'''<html><body><table class="infobox-table"><tr><td><a class="image">
+                <img src="http://img.test/{name}_v{image_versions[name]}.png"></a></td></tr></table></body></html>'''.encode())
+
+        def log_message(self, *args):
+            pass
+
+    if verbose:
+        print("TEST: incremental asset rebuild")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WikiStandIn)
+    threading.Thread(target= server.serve_forever, daemon= True).start()
+    base_link = f"http://127.0.0.1:{server.server_port}/wiki/"
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir, contextlib.redirect_stdout(io.StringIO()):
+            first_build = PageManifest()
+            old_buildings = get_production_buildings(buildings_table, base_link= base_link, manifest= first_build)
+
+            image_versions['Constructor'] = 2
+
+            # Only pages which are read go through the cache - reused pages skip it
+            cache = PageCache(cache_dir)
+            with PageFetcher(cache= cache) as fetcher:
+                new_buildings = get_production_buildings(buildings_table, base_link= base_link, fetcher= fetcher,
+                                                         manifest= PageManifest(first_build.pages, old_buildings))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    test_pass = True
+
+    if cache.parse_misses != 1 or new_buildings['constructor'].image_url != "http://img.test/Constructor_v2.png":
+        if verbose:
+            print("Unchanged pages read again, or changed page not read")
+        test_pass = False
+
+    if diff_assets(old_buildings, new_buildings).changed_assets != {'constructor'}:
+        if verbose:
+            print("Incorrect changed buildings")
+        test_pass = False
+
+    # Change, remove and add recipes of the asset data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    new_assets = dict(asset_data)
+    screw = new_assets['screw']
+    standard, alternate = screw.recipes[0], screw.recipes[1]
+    changed = Recipe(standard.name, standard.ingredients, standard.building_name, [Component(product.name, product.quantity, product.rate * 2) for product in standard.products])
+    added = Recipe('test_screw', [Component('iron_plate', 1, 10)], 'constructor', [Component('screw', 10, 100)])
+    new_assets['screw'] = Asset(screw.name, screw.image_url, screw.type, [changed, added])
+
+    asset_diff = diff_assets(asset_data, new_assets)
+
+    if (asset_diff.changed_recipes, asset_diff.removed_recipes, asset_diff.added_recipes, asset_diff.changed_assets) != ({standard.name}, {alternate.name}, {'test_screw'}, {'screw'}):
+        if verbose:
+            print("Incorrect recipe diff")
+        test_pass = False
+
+    expected_items = set(standard.ingredients_names + alternate.ingredients_names) | {'screw', 'iron_plate'}
+    if asset_diff.affected_items != expected_items:
+        if verbose:
+            print(f"Incorrect affected items {asset_diff.affected_items} - expected {expected_items}")
+        test_pass = False
+
+    if not diff_assets(asset_data, asset_data).is_empty():
+        if verbose:
+            print("Changes found between the same asset data")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[incrementalrebuild] test PASSED')
+        return True
+    else:
+        print('[incrementalrebuild] test FAILED')
+        return False
+
+
+def changedsharedrecipe(verbose):
+    '''
+    Tests rebuilding item data when a recipe shared by two items changes on only one of their pages
+    The recipe read from the changed page should be used by both items, not the copy reused from the unchanged page
+    '''
+    item_names = ['Iron Plate', 'Rotor']
+    ingot_rates = {name: 30 for name in item_names}
+
+    shared_row = '<tr><td>Alternate Shared Plate</td><td>1 × Iron Ingot{rate} / min</td><td>Refinery6 sec</td><td>1 × Iron Plate10 / min</td><td>1 × Rotor5 / min</td><td>MAM</td></tr>'
+
+    class WikiStandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.split('/')[-1].replace('_', ' ')
+            page = sample_item_page.replace('</table></div>', shared_row.format(rate= ingot_rates[name]) + '</table></div>')
+            for tag in ['<title>', 'page-header__title">', 'itemprop="name">']:
+                page = page.replace(f'{tag}Iron Plate', f'{tag}{name}')
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(page.encode())
+
+        def log_message(self, *args):
+            pass
+
+    items_table = bs(''.join(f'<a href="/wiki/{name.replace(" ", "_")}"><img src="{name}.png"></a>' for name in item_names), 'html.parser')
+
+    if verbose:
+        print("TEST: changed shared recipe rebuild")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WikiStandIn)
+    threading.Thread(target= server.serve_forever, daemon= True).start()
+    base_link = f"http://127.0.0.1:{server.server_port}/wiki/"
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            first_build = PageManifest()
+            old_items, _ = get_items_and_recipes(items_table, base_link= base_link, manifest= first_build, parse_workers= 1)
+
+            # Only the second page changes - the first is reused from the manifest, and merged before the changed one
+            ingot_rates['Rotor'] = 45
+            new_items, new_recipes = get_items_and_recipes(items_table, base_link= base_link, manifest= PageManifest(first_build.pages, old_items), parse_workers= 1)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    test_pass = True
+
+    shared = [recipe for item in new_items.values() for recipe in item.recipes if recipe.name == '_shared_plate']
+    if len(shared) != 2 or any(recipe.ingredients[0].rate != 45 for recipe in shared) or shared[0] is not shared[1]:
+        if verbose:
+            print(f"Items don't share the changed recipe - {[recipe.ingredients for recipe in shared]}")
+        test_pass = False
+
+    if [recipe.ingredients[0].rate for recipe in new_recipes if recipe.name == '_shared_plate'] != [45]:
+        if verbose:
+            print("Stale recipe in the list of recipes")
+        test_pass = False
+
+    if '_shared_plate' not in diff_assets(old_items, new_items).changed_recipes:
+        if verbose:
+            print("Changed shared recipe not in the diff")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[changedsharedrecipe] test PASSED')
+        return True
+    else:
+        print('[changedsharedrecipe] test FAILED')
+        return False
+
+
+def fastparse(verbose):
+    '''
+    Tests reading an item page by parsing only the article, against parsing the whole page
+    A page with the item name outside of the article should still be read in full
+    '''
+    item_page = sample_item_page
+    # Same page, with the item name moved into the page header
+    header_page = item_page.replace('<th itemprop="name">Iron Plate</th>', '<th>Iron Plate</th>').replace('<h1 class="page-header__title">', '<h1 class="page-header__title" itemprop="name">')
+
+    if verbose:
+        print("TEST: fast page parsing")
+
+    test_pass = True
+
+    for page in [item_page, header_page]:
+        full = read_wiki_page(bs(page.encode(), 'html.parser'))
+        fast = read_item_page(page.encode())
+
+        if fast['item'] is None or asdict(fast['item']) != asdict(full['item']) or len(fast['item'].recipes) != 2:
+            if verbose:
+                print(f"Incorrect item read {fast['item']}")
+            test_pass = False
+
+    if read_building_page(item_page.encode()) != "https://img.test/images/1/12/Iron_Plate.png":
+        if verbose:
+            print("Incorrect image url")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[fastparse] test PASSED')
+        return True
+    else:
+        print('[fastparse] test FAILED')
+        return False
+
+
+def parallelparse(verbose):
+    '''
+    Tests parsing item pages from a local stand-in for the wiki in several processes
+    The items, recipes and progress reporting should be the same as parsing them all in this process
+    '''
+    item_names = ['Iron Plate', 'Steel Beam', 'Copper Sheet', 'Quickwire', 'Rubber', 'Plastic']
+
+    class WikiStandIn(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.split('/')[-1].replace('_', ' ')
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(sample_item_page.replace('Iron Plate', name).encode())
+
+        def log_message(self, *args):
+            pass
+
+    items_table = bs(''.join(f'<a href="/wiki/{name.replace(" ", "_")}"><img src="{name}.png"></a>' for name in item_names), 'html.parser')
+
+    if verbose:
+        print("TEST: parallel page parsing")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WikiStandIn)
+    threading.Thread(target= server.serve_forever, daemon= True).start()
+    base_link = f"http://127.0.0.1:{server.server_port}/wiki/"
+
+    results = []
+    try:
+        for parse_workers in [1, 3]:
+            with contextlib.redirect_stdout(io.StringIO()) as progress:
+                items, recipes = get_items_and_recipes(items_table, base_link= base_link, parse_workers= parse_workers)
+            results.append(([asdict(item) for item in items.values()], [recipe.name for recipe in recipes], progress.getvalue()))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    test_pass = True
+
+    if results[0] != results[1]:
+        if verbose:
+            print("Parallel parse doesn't match")
+        test_pass = False
+
+    if [item['name'] for item in results[1][0]] != ['_'.join(name.lower().split(' ')) for name in item_names]:
+        if verbose:
+            print("Incorrect items")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[parallelparse] test PASSED')
+        return True
+    else:
+        print('[parallelparse] test FAILED')
+        return False
+
+
+def recipeimmutable(verbose):
+    '''
+    Tests recipes are immutable and compared and hashed by name, that their component lookups are right,
+    that recipes pickled before they were immutable still load, and that the json export keeps the component names
+    '''
+    if verbose:
+        print("TEST: immutable recipes")
+
+    test_pass = True
+
+    recipe = Recipe('alternate_wire', [Component('iron_ingot', 1, 12.5), Component('copper_ingot', 1, 12.5)], 'assembler', [Component('wire', 9, 22.5)])
+    same_name = Recipe('alternate_wire', [], 'constructor', [])
+
+    if recipe != same_name or hash(recipe) != hash(same_name) or len({recipe, same_name}) != 1 or recipe == Recipe('wire', [], 'constructor', []):
+        if verbose:
+            print("Recipes not compared by name")
+        test_pass = False
+
+    try:
+        recipe.name = 'changed'
+        if verbose:
+            print("Recipe could be changed")
+        test_pass = False
+    except FrozenInstanceError:
+        pass
+
+    if not isinstance(recipe.ingredients, tuple) or not isinstance(recipe.products, tuple):
+        if verbose:
+            print("Components not kept as tuples")
+        test_pass = False
+
+    if recipe.ingredient_index != {'iron_ingot': 0, 'copper_ingot': 1} or recipe.product_index != {'wire': 0} \
+            or recipe.ingredients_names != ('iron_ingot', 'copper_ingot') or recipe.products_names != ('wire',):
+        if verbose:
+            print(f"Wrong component lookups {recipe.ingredient_index} {recipe.product_index}")
+        test_pass = False
+
+    # State of a recipe pickled before recipes were immutable - lists of components and of names, no index lookups
+    old_state = {
+        'name':                 'alternate_wire',
+        'ingredients':          [Component('iron_ingot', 1, 12.5), Component('copper_ingot', 1, 12.5)],
+        'building_name':        'assembler',
+        'products':             [Component('wire', 9, 22.5)],
+        'ingredients_names':    ['iron_ingot', 'copper_ingot'],
+        'products_names':       ['wire']
+    }
+    loaded = Recipe.__new__(Recipe)
+    loaded.__setstate__(old_state)
+
+    if loaded.ingredients != recipe.ingredients or loaded.products != recipe.products or loaded.building_name != 'assembler' \
+            or loaded.ingredient_index != recipe.ingredient_index or loaded.product_index != recipe.product_index or hash(loaded) != hash(recipe) \
+            or pickle.loads(pickle.dumps(recipe)).ingredient_index != recipe.ingredient_index:
+        if verbose:
+            print("Old recipe state not loaded")
+        test_pass = False
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        assets_to_json({'wire': Asset('wire', '', 'item', [recipe])}, os.path.join(output_dir, 'asset_data.json'))
+        with open(os.path.join(output_dir, 'asset_data.json')) as infile:
+            saved = json.load(infile)['wire']['recipes'][0]
+
+    if saved.get('ingredients_names') != ['iron_ingot', 'copper_ingot'] or saved.get('products_names') != ['wire']:
+        if verbose:
+            print(f"Component names missing from the json export - {sorted(saved)}")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[recipeimmutable] test PASSED')
+        return True
+    else:
+        print('[recipeimmutable] test FAILED')
+        return False
+
+
+def assetio(verbose):
+    '''
+    Tests saving the asset data as json and ndjson and loading it back
+    The loaded assets should be the same and plan the same, and the saved asset data shouldn't be changed
+    '''
+    if verbose:
+        print("TEST: asset json io")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    def flattened(asset):
+        dictionary = asdict(asset)
+        return dictionary | {'recipes': dictionary['recipes'] or []}
+
+    original = {name: asdict(asset) for name, asset in asset_data.items()}
+
+    test_pass = True
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        assets_to_ndjson(asset_data, os.path.join(output_dir, 'asset_data.ndjson'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            assets_to_json(asset_data, os.path.join(output_dir, 'asset_data.json'))
+
+        for asset_file in ['asset_data.ndjson', 'asset_data.json']:
+            loaded = load_assets(os.path.join(output_dir, asset_file))
+
+            # The json export saves assets without recipes with an empty list of them
+            if list(loaded) != list(asset_data) or any(flattened(loaded[name]) != flattened(asset_data[name]) for name in loaded):
+                if verbose:
+                    print(f"Assets loaded from {asset_file} don't match")
+                test_pass = False
+
+            planned, reference = ProcessGraph(loaded), ProcessGraph(asset_data)
+            planned.add_request('smart_plating', 1)
+            reference.add_request('smart_plating', 1)
+            if planned.raw_materials() != reference.raw_materials():
+                if verbose:
+                    print(f"Assets loaded from {asset_file} plan differently")
+                test_pass = False
+
+        if {name: asdict(asset) for name, asset in asset_data.items()} != original:
+            if verbose:
+                print("Asset data changed by saving it")
+            test_pass = False
+
+        # nan isn't valid json
+        try:
+            assets_to_ndjson({'bad': Asset('bad', '', 'item', [Recipe('bad', [], 'miner', [Component('bad', 1, float('nan'))])])}, os.path.join(output_dir, 'bad.ndjson'))
+            if verbose:
+                print("nan saved")
+            test_pass = False
+        except ValueError:
+            pass
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[assetio] test PASSED')
+        return True
+    else:
+        print('[assetio] test FAILED')
+        return False
+
+
+def binaryassets(verbose):
+    '''
+    Tests saving the asset data in the binary format and loading it back through the memory map
+    The loaded assets should be the same and plan the same, with recipes shared between items and read only arrays
+    '''
+    if verbose:
+        print("TEST: binary asset format")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    # Energy rates which aren't numbers aren't kept
+    def comparable(asset):
+        dictionary = asdict(asset)
+        for recipe in dictionary['recipes'] or []:
+            for component in recipe['ingredients'] + recipe['products']:
+                if not isinstance(component['energy_rate'], (int, float)):
+                    component['energy_rate'] = None
+        return dictionary
+
+    test_pass = True
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        asset_file = os.path.join(output_dir, 'asset_data.bin')
+        assets_to_binary(asset_data, asset_file)
+
+        loaded = load_assets(asset_file)
+
+        if not isinstance(loaded, BinaryAssets):
+            if verbose:
+                print(".bin file not loaded as binary assets")
+            test_pass = False
+
+        if list(loaded) != list(asset_data) or any(comparable(loaded[name]) != comparable(asset_data[name]) for name in asset_data):
+            if verbose:
+                print("Loaded assets don't match")
+            test_pass = False
+
+        # Recipes made by several buildings/items should be one object, like in the scraped data
+        shared = {}
+        for asset in loaded.values():
+            for recipe in asset.recipes or []:
+                if shared.setdefault(recipe.name, recipe) is not recipe:
+                    if verbose:
+                        print(f"Recipe {recipe.name} loaded more than once")
+                    test_pass = False
+
+        planned, reference = ProcessGraph(loaded), ProcessGraph(asset_data)
+        planned.add_request('smart_plating', 1)
+        reference.add_request('smart_plating', 1)
+        if planned.raw_materials() != reference.raw_materials():
+            if verbose:
+                print("Loaded assets plan differently")
+            test_pass = False
+
+        if loaded.ingredient_rates.flags.writeable:
+            if verbose:
+                print("Mapped arrays are writeable")
+            test_pass = False
+
+        # Not an asset file
+        with open(os.path.join(output_dir, 'bad.bin'), 'wb') as outfile:
+            outfile.write(b'not assets')
+        try:
+            BinaryAssets(os.path.join(output_dir, 'bad.bin'))
+            if verbose:
+                print("Bad file loaded")
+            test_pass = False
+        except Exception:
+            pass
+
+        # The same assets saved in two formats each get their own index
+        pickle_file = os.path.join(output_dir, 'asset_data.pickle')
+        with open(pickle_file, 'wb') as outfile:
+            pickle.dump(asset_data, outfile)
+
+        for path in [asset_file, pickle_file]:
+            load_recipe_index(path, asset_data)
+        for path in [asset_file, pickle_file]:
+            if RecipeIndex.load(index_file(path)).source_hash != file_hash(path):
+                if verbose:
+                    print(f"Index of {path} overwritten")
+                test_pass = False
+
+        loaded.close()
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[binaryassets] test PASSED')
+        return True
+    else:
+        print('[binaryassets] test FAILED')
+        return False
+
+
+def plannerstats(verbose):
+    '''
+    Tests the planner stats - planning with them should give the same graph, and count the work done by each request
+    '''
+    if verbose:
+        print("TEST: planner stats")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    test_pass = True
+
+    stats = PlannerStats()
+    planner, reference = ProcessGraph(asset_data, stats= stats), ProcessGraph(asset_data)
+    for graph in [planner, reference]:
+        graph.add_request('smart_plating', 2)
+        graph.update_request('smart_plating', 1)
+        graph.remove_request('smart_plating')
+        graph.add_request('smart_plating', 3)
+
+    if planner.raw_materials() != reference.raw_materials() or len(planner.graph_nodes) != len(reference.graph_nodes):
+        if verbose:
+            print("Planning with stats gives a different graph")
+        test_pass = False
+
+    exported = json.loads(stats.to_json())
+
+    if [request['action'] for request in exported['requests']] != ['add', 'change', 'remove', 'add']:
+        if verbose:
+            print(f"Requests recorded wrong - {[request['action'] for request in exported['requests']]}")
+        test_pass = False
+
+    first = exported['requests'][0]
+    if first['recipes_expanded'] == 0 or first['max_depth'] < 2 or first['edges_scanned'] == 0:
+        if verbose:
+            print(f"Work of the first request not counted - {first}")
+        test_pass = False
+
+    # Totals are the sum of the requests
+    for counter in PlannerStats.counters:
+        if exported[counter] != sum(request[counter] for request in exported['requests']):
+            if verbose:
+                print(f"Total {counter} doesn't match the requests")
+            test_pass = False
+
+    if exported['calls'].get('remove_request') != 1 or exported['calls'].get('change_request') != 2:
+        if verbose:
+            print(f"Phases timed wrong - {exported['calls']}")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[plannerstats] test PASSED')
+        return True
+    else:
+        print('[plannerstats] test FAILED')
+        return False
+
+
+def plancache(verbose):
+    '''
+    Tests the plan cache - equal requests should share a key, results should be shared through the cache directory,
+    and results should be dropped once they expire or there are too many
+    '''
+    if verbose:
+        print("TEST: plan cache")
+
+    test_pass = True
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = PlanCache(cache_dir, maxsize= 2, max_files= 3)
+
+        # Same requests in a different order and number type, different asset versions and planners
+        key = cache.key('production', 'v1', {'screw': 1, 'rotor': 2.5})
+        if key != cache.key('production', 'v1', {'rotor': 2.5, 'screw': 1.0}):
+            if verbose:
+                print("Equal requests have different keys")
+            test_pass = False
+
+        if key in [cache.key('production', 'v2', {'screw': 1, 'rotor': 2.5}), cache.key('utilisation', 'v1', {'screw': 1, 'rotor': 2.5}), cache.key('production', 'v1', {'screw': 2, 'rotor': 2.5})]:
+            if verbose:
+                print("Different plans have the same key")
+            test_pass = False
+
+        if cache.get(key) is not None:
+            if verbose:
+                print("Result found before it was cached")
+            test_pass = False
+
+        cache.put(key, (['elements'], {'screw': {'iron_ore': 1.0}}))
+        if cache.get(key) != (['elements'], {'screw': {'iron_ore': 1.0}}):
+            if verbose:
+                print("Cached result not found")
+            test_pass = False
+
+        # Another process using the same directory
+        other = PlanCache(cache_dir)
+        if other.get(key) != (['elements'], {'screw': {'iron_ore': 1.0}}) or other.disk_hits != 1:
+            if verbose:
+                print("Result not shared through the cache directory")
+            test_pass = False
+
+        # Least recently used results are dropped from memory, and the oldest files once there are too many
+        for i in range(4):
+            cache.put(cache.key('production', 'v1', {'screw': i}), i)
+
+        if len(cache.results) != 2 or len(os.listdir(cache_dir)) != 3:
+            if verbose:
+                print(f"Cache not bounded - {len(cache.results)} results in memory and {len(os.listdir(cache_dir))} files")
+            test_pass = False
+
+        if PlanCache(cache_dir).get(key) is not None:
+            if verbose:
+                print("Oldest file not removed")
+            test_pass = False
+
+        # Expired results
+        expired = PlanCache(cache_dir, ttl= -1)
+        if expired.get(cache.key('production', 'v1', {'screw': 3})) is not None:
+            if verbose:
+                print("Expired result used")
+            test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[plancache] test PASSED')
+        return True
+    else:
+        print('[plancache] test FAILED')
+        return False
+
+
+def jobrunner(verbose):
+    '''
+    Tests the background job runner - a new job for a session should supersede its previous one,
+    and the results and errors of jobs should be available once they finish, from threads or processes
+    '''
+    if verbose:
+        print("TEST: background jobs")
+
+    test_pass = True
+
+    def wait(runner, job_id):
+        while runner.status(job_id)['state'] in ('queued', 'running'):
+            threading.Event().wait(0.01)
+        return runner.status(job_id)
+
+    runner = JobRunner(max_workers= 1)
+    release = threading.Event()
+
+    # Block the only worker so the next jobs are queued
+    blocking = runner.submit('other', release.wait, 10)
+    first = runner.submit('session', pow, 2, 3)
+    second = runner.submit('session', pow, 2, 4)
+
+    if runner.status(first)['state'] != 'cancelled' or runner.status(second)['state'] != 'queued':
+        if verbose:
+            print(f"Superseded job not cancelled - {runner.status(first)['state']}, {runner.status(second)['state']}")
+        test_pass = False
+
+    release.set()
+    if wait(runner, second)['result'] != 16 or wait(runner, blocking)['state'] != 'done':
+        if verbose:
+            print("Jobs didn't finish")
+        test_pass = False
+
+    # A running job which is superseded has its result thrown away
+    release.clear()
+    running = runner.submit('session', release.wait, 10)
+    while runner.status(running)['state'] != 'running':
+        threading.Event().wait(0.01)
+    latest = runner.submit('session', pow, 3, 2)
+    release.set()
+
+    if wait(runner, running)['state'] != 'cancelled' or wait(runner, latest)['result'] != 9:
+        if verbose:
+            print("Running job not superseded")
+        test_pass = False
+
+    failed = wait(runner, runner.submit('session', pow, 'a', 2))
+    if failed['state'] != 'failed' or not isinstance(failed['error'], TypeError):
+        if verbose:
+            print("Failed job not reported")
+        test_pass = False
+
+    if runner.status('missing')['state'] != 'unknown':
+        if verbose:
+            print("Unknown job found")
+        test_pass = False
+
+    runner.shutdown()
+
+    # Worker processes
+    runner = JobRunner(max_workers= 1, processes= True)
+    if wait(runner, runner.submit('session', pow, 5, 2))['result'] != 25:
+        if verbose:
+            print("Job not run in a worker process")
+        test_pass = False
+    runner.shutdown()
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[jobrunner] test PASSED')
+        return True
+    else:
+        print('[jobrunner] test FAILED')
+        return False
+
+
+def jobpolling(verbose):
+    '''
+    Tests polling for a utilisation calculation from a worker process which doesn't hold the job
+    The result should come from the plan cache the job saved it in, and a job which is nowhere should say so instead of stopping quietly
+    '''
+    import utilisation_ui
+
+    if verbose:
+        print("TEST: utilisation job polling")
+
+    test_pass = True
+
+    ui_cache = utilisation_ui.plan_cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        utilisation_ui.plan_cache = PlanCache(cache_dir)
+        try:
+            raw_materials, requested_items = {'iron_ore': 60}, {'iron_plate': 1}
+            key = utilisation_ui.plan_cache.key('utilisation', 'test', raw_materials, requested_items)
+            job = {'session': 'session', 'id': 'session:0', 'key': key}
+
+            # Nothing has the job or its result
+            output = utilisation_ui.check_job(job, {'session': 'session'}, None)
+            if 'submit again' not in str(output[2]) or output[5] is not True:
+                if verbose:
+                    print(f"Lost job not reported - {output[2]!r}")
+                test_pass = False
+
+            # Run by another process's job runner - only the plan cache is shared
+            runner = JobRunner(max_workers= 1)
+            other_id = runner.submit('session', utilisation_ui.plan_and_cache, key, raw_materials, requested_items)
+            while runner.status(other_id)['state'] in ('queued', 'running'):
+                threading.Event().wait(0.01)
+            result = runner.status(other_id)['result']
+            runner.shutdown()
+
+            output = utilisation_ui.check_job(job, {'session': 'session'}, None)
+            if result is None or output[0] != result[0] or output[2] != result[1] or output[5] is not True:
+                if verbose:
+                    print("Result of a job from another process not found in the plan cache")
+                test_pass = False
+        finally:
+            utilisation_ui.plan_cache = ui_cache
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[jobpolling] test PASSED')
+        return True
+    else:
+        print('[jobpolling] test FAILED')
+        return False
+
+
+def graphelements(verbose):
+    '''
+    Tests the graph elements - buildings running over 100% should be labelled with their machine count, building nodes
+    feeding different items should stay separate, and updates should only send what changed since the browser's last render
+    '''
+    if verbose:
+        print("TEST: graph elements")
+
+    # Load item data
+    with open('asset_data.pickle', 'rb') as infile:
+        asset_data = pickle.load(infile)
+
+    test_pass = True
+
+    # The requested rotors and the rotors for the smart plating are made by separate buildings on the graph, feeding different item nodes
+    planner = ProcessGraph(asset_data)
+    planner.add_requests({'smart_plating': 1, 'rotor': 1})
+    elements = graph_elements(planner, asset_data)
+
+    rotor_buildings = [element for element in elements if element['data']['id'].startswith('assembler:rotor') and 'source' not in element['data']]
+    if len(rotor_buildings) != 2:
+        if verbose:
+            print(f"Rotor buildings merged - {rotor_buildings}")
+        test_pass = False
+
+    # A building over 100% is labelled with how many machines it needs
+    planner = ProcessGraph(asset_data)
+    planner.add_request('rotor', 10)
+    for element in graph_elements(planner, asset_data):
+        node = planner.graph_nodes.get(element['data']['id'])
+        if isinstance(node, BuildingNode):
+            machines = math.ceil(round(node.clock_speed, 6))
+            if (machines > 1) != element['data']['label'].startswith(f"{machines}x "):
+                if verbose:
+                    print(f"Wrong machine count for {node.name} at {node.clock_speed} - {element['data']['label']}")
+                test_pass = False
+
+    # Every edge should connect nodes which are shown, and there should be no duplicated edges
+    node_ids = set(element['data']['id'] for element in elements if 'source' not in element['data'])
+    edges = [(element['data']['source'], element['data']['target']) for element in elements if 'source' in element['data']]
+    if not all(source in node_ids and target in node_ids for source, target in edges) or len(edges) != len(set(edges)):
+        if verbose:
+            print("Edges don't match the nodes")
+        test_pass = False
+
+    # Applies the operations of a patch to a list, like the browser does
+    def patched(elements, patch):
+        elements = list(elements)
+        for operation in patch.to_plotly_json()['operations']:
+            if operation['operation'] == 'Delete':
+                del elements[operation['location'][0]]
+            elif operation['operation'] == 'Assign':
+                elements[operation['location'][0]] = operation['params']['value']
+            elif operation['operation'] == 'Append':
+                elements.append(operation['params']['value'])
+        return elements
+
+    cache = RenderCache()
+    nodes = [{'data': {'id': str(i), 'label': str(i)}} for i in range(10)]
+
+    output, token = cache.render(nodes, None)
+    if output != nodes:
+        if verbose:
+            print("First render not the full list")
+        test_pass = False
+
+    if cache.render(list(nodes), token) != (no_update, token):
+        if verbose:
+            print("Unchanged render sent again")
+        test_pass = False
+
+    # One node changed, one removed and one added
+    changed = nodes[:3] + [{'data': {'id': '3', 'label': 'changed'}}] + nodes[5:] + [{'data': {'id': 'new', 'label': 'new'}}]
+    output, new_token = cache.render(changed, token)
+    if not isinstance(output, Patch) or len(output.to_plotly_json()['operations']) != 3:
+        if verbose:
+            print("Small change not sent as a patch")
+        test_pass = False
+    elif sorted(map(str, patched(nodes, output))) != sorted(map(str, changed)) or patched(nodes, output) != cache.rendered[new_token]:
+        if verbose:
+            print("Patch doesn't give the new elements")
+        test_pass = False
+
+    # Browser showing something the cache doesn't know
+    if cache.render(changed, 'unknown')[0] != changed:
+        if verbose:
+            print("Unknown render not sent in full")
+        test_pass = False
+
+    if test_pass:
+        if verbose:
+            print('ALL TESTS PASSED')
+            print()
+        else:
+            print('[graphelements] test PASSED')
+        return True
+    else:
+        print('[graphelements] test FAILED')
+        return False
+
+
 def doall(verbose):
     singlerequests(verbose)
     matsutilisation(verbose)
+    linearsolver(verbose)
+    sharedrecipe(verbose)
+    linearremoval(verbose)
+    linearattribution(verbose)
+    batchrequests(verbose)
+    updaterequests(verbose)
+    subplancache(verbose)
+    recipeoptimiser(verbose)
+    lpthroughput(verbose)
+    recipechoices(verbose)
+    boundedstack(verbose)
+    planmemory(verbose)
+    pagefetcher(verbose)
+    pagecache(verbose)
+    incrementalrebuild(verbose)
+    changedsharedrecipe(verbose)
+    fastparse(verbose)
+    parallelparse(verbose)
+    recipeimmutable(verbose)
+    assetio(verbose)
+    binaryassets(verbose)
+    plannerstats(verbose)
+    plancache(verbose)
+    jobrunner(verbose)
+    jobpolling(verbose)
+    graphelements(verbose)
 
 if __name__ == "__main__":
     import argparse
@@ -1,21 +1,45 @@
 import dash
+from dash import callback_context, no_update
 from dash.dependencies import Output, Input, State, ALL
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_cytoscape as cyto
-import pickle
-from process_planner import ProcessGraph
-from data_defs import ItemNode, BuildingNode
+import logging
+import uuid
+from linear_planner import LinearProcessGraph
+from planner_stats import PlannerStats
+from plan_cache import PlanCache
+from job_runner import JobRunner
+from asset_store import get_assets
+from graph_elements import graph_elements, RenderCache
 import numpy as np
 
 # Initialise dash app and extra layouts for graphs
 app = dash.Dash(__name__)
 cyto.load_extra_layouts()
 
+# Finished plans - the same inputs from another click, tab or worker process aren't planned again
+plan_cache  = PlanCache()
+
+# Graphs recently sent to browsers - updates are sent as patches of them
+render_cache    = RenderCache()
+
+# Plans are calculated in the background and polled for, so requests aren't blocked while they run
+job_runner  = JobRunner()
+
+# Planner stats of each calculation are logged if the app is started with --stats
+logger      = logging.getLogger(__name__)
+log_stats   = False
+
 app.layout = html.Div([
     # For storing this session's data in the browser - don't store as globals so multiple instances can run
     dcc.Store(id='memory', data={'raw_materials':{}, 'requested_items':{}}),
 
+    # This page's session id and the calculation it's waiting for
+    dcc.Store(id='job', data={}),
+    dcc.Store(id='rendered', data=None),        # Token of the graph this page is showing, for sending only what's changed
+    dcc.Interval(id='poll', interval=500, disabled=True),
+
     html.H1("Materials Utilisation Planner"),
 
     # Inputs
@@ -58,7 +82,11 @@ app.layout = html.Div([
                     id= 'requested_items'
                 ),
                 html.Div('', style={'height':'10px'}),
-                html.H3(id='calc-msg', style={'color':'red'})
+                html.H3(id='calc-msg', style={'color':'red'}),
+                html.Div(id='calc-status'),
+                html.Div(
+                    id= 'utilisation'
+                )
             ],
         ),
 
@@ -125,8 +153,7 @@ def manage_inputs(raw_clicks, request_clicks, raw_ids, raw_amounts, request_ids,
             if amount == 0:
                 del memory[keys[i]][ids[i][j]['index']]
 
-    with open('asset_data.pickle', 'rb') as infile:
-        asset_data = pickle.load(infile)
+    asset_data = get_assets().assets
 
     # If valid item, add to storage
     for i,name in enumerate([raw_name, request_name]):
@@ -157,54 +184,140 @@ def manage_inputs(raw_clicks, request_clicks, raw_ids, raw_amounts, request_ids,
 
 @app.callback(
     Output('process_network', 'elements'),      # For showing the caluclated production process network
+    Output('rendered', 'data'),                 # Token of the graph shown
     Output('calc-msg', 'children'),             # To show messages after calculation - ie missing materials error
+    Output('utilisation', 'children'),          # To show how much of each raw material is used
+    Output('calc-status', 'children'),          # To show that a calculation is running
+    Output('poll', 'disabled'),                 # Polling is turned on while a calculation is running
+    Output('job', 'data'),                      # For keeping track of the running calculation
     Input('submit', 'n_clicks'),                # Button which triggers the callback and starts the calculation
-    State('memory', 'data')                     # Session memory
+    Input('poll', 'n_intervals'),               # Checks on the running calculation
+    State('memory', 'data'),                    # Session memory
+    State('job', 'data'),                       # Session id and running calculation
+    State('rendered', 'data')                   # Token of the graph shown
 )
-def calculate_production(n_clicks, memory):
-    elements = []
+def calculate_production(n_clicks, n_intervals, memory, job, rendered):
+    # Session id of this page - the running calculation is only kept in the job data while it's running
+    idle_job = {'session': job.get('session') or uuid.uuid4().hex}
+    triggered = [trigger['prop_id'] for trigger in callback_context.triggered]
+
+    if triggered == ['poll.n_intervals']:
+        return check_job(job, idle_job, rendered)
 
     if len(memory['requested_items']) == 0:
-        return elements, ''
+        job_runner.cancel(idle_job['session'])
+        return *render_cache.render([], rendered), '', [], '', True, idle_job
+
+    # Graph elements, error message and utilisation of the materials - only planned if these inputs haven't been planned already
+    assets = get_assets()
+    key = plan_cache.key('utilisation', assets.version, memory['raw_materials'], memory['requested_items'])
+    cached = plan_cache.get(key)
+
+    if cached is not None:
+        job_runner.cancel(idle_job['session'])
+        elements, error_msg, utilisation = cached
+        return *render_cache.render(elements, rendered), error_msg, utilisation_list(utilisation), '', True, idle_job
+
+    # Plan in the background - supersedes a calculation of the previous inputs if it's still running
+    job_id = job_runner.submit(idle_job['session'], plan_and_cache, key, memory['raw_materials'], memory['requested_items'])
+
+    return no_update, no_update, '', no_update, 'Calculating...', False, idle_job | {'id': job_id, 'key': key}
+
+
+def check_job(job: dict, idle_job: dict, rendered: str) -> tuple:
+    '''
+    Outputs of calculate_production for a poll of the running calculation
+    '''
+    if 'id' not in job:
+        return no_update, no_update, no_update, no_update, '', True, idle_job
+
+    status = job_runner.status(job['id'])
+
+    if status['state'] in ('queued', 'running'):
+        return no_update, no_update, no_update, no_update, f"Calculating... ({round(status['elapsed'])} s)", False, no_update
+
+    if status['state'] == 'done':
+        elements, error_msg, utilisation = status['result']
+        return *render_cache.render(elements, rendered), error_msg, utilisation_list(utilisation), '', True, idle_job
+
+    if status['state'] == 'failed':
+        logger.error(f"Calculation failed: {status['error']!r}")
+        return *render_cache.render([], rendered), f"Calculation failed - {status['error']}", [], '', True, idle_job
+
+    if status['state'] == 'unknown':
+        # Run by another worker process, or dropped from the job runner - the job saved its result in the plan cache when it finished
+        cached = plan_cache.get(job['key'])
+        if cached is None:
+            return *render_cache.render([], rendered), "Calculation lost - submit again", [], '', True, idle_job
+
+        elements, error_msg, utilisation = cached
+        return *render_cache.render(elements, rendered), error_msg, utilisation_list(utilisation), '', True, idle_job
+
+    # Superseded by another calculation
+    return no_update, no_update, no_update, no_update, '', True, idle_job
+
+
+def utilisation_list(utilisation: list) -> list:
+    '''
+    Raw material utilisation lines on screen
+    '''
+    return [html.P(html.Strong(line)) if i == 0 else html.P(line) for i, line in enumerate(utilisation)]
+
+
+def plan_and_cache(key: str, raw_materials: dict, requested_items: dict) -> tuple:
+    '''
+    Plans the production in the background and caches the result under key - from the process which ran it,
+    so a poll which reaches another worker process can still find it
+    '''
+    result = plan_utilisation(raw_materials, requested_items)
+    plan_cache.put(key, result)
+
+    return result
+
+
+def plan_utilisation(raw_materials: dict, requested_items: dict) -> tuple:
+    '''
+    Plans the production of the requested items from the raw materials - run in the background by the job runner
+    Returns the graph elements, the error message and the lines of the raw material utilisation
+    '''
+    elements = []
+    assets = get_assets()
+    asset_data = assets.assets
 
     # Load data into planner
-    with open('asset_data.pickle', 'rb') as infile:
-        asset_data = pickle.load(infile)
-    planner = ProcessGraph(asset_data)
+    stats = PlannerStats() if log_stats else None
+    planner = LinearProcessGraph(asset_data, assets.index, stats= stats)
 
     # Compute the production process which gives the requested item ratio given the available materials
-    error_msg = planner.mats_utilisation(memory['raw_materials'], memory['requested_items'])
+    error_msg = planner.mats_utilisation(raw_materials, requested_items)
+
+    if stats is not None:
+        logger.info(f"calculate_production planner stats: {stats.to_json()}")
 
     if error_msg is not None:
-        return elements, error_msg
-
-    # Get nodes in graph
-    for node_name in planner.graph_nodes:
-        node = planner.graph_nodes[node_name]
-        if isinstance(node,ItemNode):
-            label = f"{round(node.rate_filled,1)} {' '.join(node.name.split('_'))} per min"
-        elif isinstance(node,BuildingNode):
-            label = f"{node.name} ({round(node.clock_speed*100,1)}%)"
-
-        asset_name = node_name.replace('_OUT', '').split(':')[0]
-        if asset_name == 'resource_well_extractor':
-            asset_name = 'resource_well_pressurizer'
-
-        elements.append({'data' : {
-            'id'    : node_name,
-            'label' : label,
-            'image' : asset_data[asset_name].image_url
-        }})
-
-    # Get connecting edges
-    for edge in planner.graph_edges:
-        elements.append({'data' : {
-            'source'    : edge.source_id,
-            'target'    : edge.target_id,
-            'weight'    : round(edge.rate,1)
-        }})
-
-    return elements, ''
+        return elements, error_msg, []
+
+    # Raw materials used and left over - shadow price is how much more could be made with another 1 per min of the material
+    utilisation = ['Raw material utilisation:']
+    for mat, slack in planner.utilisation.slack.items():
+        used = planner.utilisation.used.get(mat, 0)
+        utilisation.append(f"{' '.join(mat.split('_'))}: {round(used,1)} used, {round(slack,1)} spare, shadow price {round(planner.utilisation.shadow_prices[mat],3)}")
+
+    return graph_elements(planner, asset_data), '', utilisation
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stats', action='store_true', help='Log the planner stats of every callback')
+    parser.add_argument('--workers', type=int, default=2, help='Calculations which can run at once')
+    parser.add_argument('--processes', action='store_true', help='Run calculations in worker processes instead of threads')
+
+    args = parser.parse_args()
+
+    if args.stats:
+        log_stats = True
+        logging.basicConfig(level=logging.INFO)
+
+    job_runner = JobRunner(max_workers= args.workers, processes= args.processes)
+
     app.run_server(debug=True, port=8050)
\ No newline at end of file